@@ -104,6 +104,19 @@ CREATE TABLE IF NOT EXISTS `myems_energy_db`.`tbl_meter_hourly` (
   PRIMARY KEY (`id`));
 CREATE INDEX `tbl_meter_hourly_index_1` ON  `myems_energy_db`.`tbl_meter_hourly`   (`meter_id`, `start_datetime_utc`);
 
+-- ---------------------------------------------------------------------------------------------------------------------
+-- Table `myems_energy_db`.`tbl_normalization_watermarks`
+-- ---------------------------------------------------------------------------------------------------------------------
+DROP TABLE IF EXISTS `myems_energy_db`.`tbl_normalization_watermarks` ;
+
+CREATE TABLE IF NOT EXISTS `myems_energy_db`.`tbl_normalization_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `entity_type` VARCHAR(32) NOT NULL COMMENT 'meter, virtual_meter or offline_meter',
+  `entity_id` BIGINT NOT NULL,
+  `last_slot_utc` DATETIME NOT NULL COMMENT 'The start datetime of the last normalized time slot',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_normalization_watermarks_index_1` ON  `myems_energy_db`.`tbl_normalization_watermarks`   (`entity_type`, `entity_id`);
+
 -- ---------------------------------------------------------------------------------------------------------------------
 -- Table `myems_energy_db`.`tbl_offline_meter_hourly`
 -- ---------------------------------------------------------------------------------------------------------------------
@@ -33,7 +33,7 @@ CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_analog_value_latest` (
   `utc_date_time` DATETIME NOT NULL,
   `actual_value` DECIMAL(18, 3) NOT NULL,
   PRIMARY KEY (`id`));
-CREATE INDEX `tbl_analog_value_latest_index_1` ON  `myems_historical_db`.`tbl_analog_value_latest`  (`point_id` , `utc_date_time`);
+CREATE UNIQUE INDEX `tbl_analog_value_latest_index_1` ON  `myems_historical_db`.`tbl_analog_value_latest`  (`point_id`);
 CREATE INDEX `tbl_analog_value_latest_index_2` ON  `myems_historical_db`.`tbl_analog_value_latest`  (`utc_date_time`);
 
 -- ---------------------------------------------------------------------------------------------------------------------
@@ -76,7 +76,7 @@ CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_digital_value_latest` (
   `utc_date_time` DATETIME NOT NULL,
   `actual_value` INT NOT NULL,
   PRIMARY KEY (`id`));
-CREATE INDEX `tbl_digital_value_latest_index_1` ON  `myems_historical_db`.`tbl_digital_value_latest`  (`point_id` , `utc_date_time`);
+CREATE UNIQUE INDEX `tbl_digital_value_latest_index_1` ON  `myems_historical_db`.`tbl_digital_value_latest`  (`point_id`);
 CREATE INDEX `tbl_digital_value_latest_index_2` ON  `myems_historical_db`.`tbl_digital_value_latest`  (`utc_date_time`);
 
 -- ---------------------------------------------------------------------------------------------------------------------
@@ -94,6 +94,21 @@ CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_energy_value` (
 CREATE INDEX `tbl_energy_value_index_1` ON  `myems_historical_db`.`tbl_energy_value`  (`point_id` , `utc_date_time`);
 CREATE INDEX `tbl_energy_value_index_2` ON  `myems_historical_db`.`tbl_energy_value`  (`utc_date_time`);
 
+-- ---------------------------------------------------------------------------------------------------------------------
+-- Table `myems_historical_db`.`tbl_energy_value_cleaning_watermarks`
+-- ---------------------------------------------------------------------------------------------------------------------
+DROP TABLE IF EXISTS `myems_historical_db`.`tbl_energy_value_cleaning_watermarks` ;
+
+CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_energy_value_cleaning_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `last_cleaned_id` BIGINT NOT NULL COMMENT 'Energy values of the point with id less than or equal to it are cleaned',
+  `base_actual_value` DECIMAL(18, 3) NULL COMMENT 'The last good value, less values are concave candidates',
+  `base_utc_date_time` DATETIME NULL COMMENT 'The time of the base value, values not later than it are not compared with it',
+  `detector_context` LONGTEXT NULL COMMENT 'Recent values checked by detectors, MUST be in JSON format',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_energy_value_cleaning_watermarks_index_1` ON  `myems_historical_db`.`tbl_energy_value_cleaning_watermarks`  (`point_id`);
+
 -- ---------------------------------------------------------------------------------------------------------------------
 -- Table `myems_historical_db`.`tbl_energy_value_latest`
 -- ---------------------------------------------------------------------------------------------------------------------
@@ -105,7 +120,7 @@ CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_energy_value_latest` (
   `utc_date_time` DATETIME NOT NULL,
   `actual_value` DECIMAL(18, 3) NOT NULL,
   PRIMARY KEY (`id`));
-CREATE INDEX `tbl_energy_value_latest_index_1` ON  `myems_historical_db`.`tbl_energy_value_latest`  (`point_id` , `utc_date_time`);
+CREATE UNIQUE INDEX `tbl_energy_value_latest_index_1` ON  `myems_historical_db`.`tbl_energy_value_latest`  (`point_id`);
 CREATE INDEX `tbl_energy_value_latest_index_2` ON  `myems_historical_db`.`tbl_energy_value_latest`  (`utc_date_time`);
 
 -- ---------------------------------------------------------------------------------------------------------------------
@@ -417,6 +417,9 @@ CREATE TABLE IF NOT EXISTS `myems_system_db`.`tbl_gateways` (
   `token` CHAR(36) NOT NULL,
   `last_seen_datetime_utc` DATETIME NULL  COMMENT 'The last seen date time in UTC via PING, TELNET or Heartbeat',
   `description` VARCHAR(255) ,
+  `live_workers` INT NULL COMMENT 'The number of running acquisition workers reported by Heartbeat',
+  `spool_records` BIGINT NULL COMMENT 'The number of records in the local spool reported by Heartbeat',
+  `average_sweep_seconds` DECIMAL(18, 3) NULL COMMENT 'The average sweep time since the previous Heartbeat',
   PRIMARY KEY (`id`));
 CREATE INDEX `tbl_gateways_index_1` ON  `myems_system_db`.`tbl_gateways`   (`name`);
 
@@ -902,6 +905,19 @@ CREATE INDEX `tbl_points_index_1` ON  `myems_system_db`.`tbl_points`   (`name`);
 CREATE INDEX `tbl_points_index_2` ON  `myems_system_db`.`tbl_points`   (`data_source_id`);
 CREATE INDEX `tbl_points_index_3` ON  `myems_system_db`.`tbl_points`   (`id`, `object_type`);
 
+-- ---------------------------------------------------------------------------------------------------------------------
+-- Table `myems_system_db`.`tbl_points_detectors`
+-- ---------------------------------------------------------------------------------------------------------------------
+DROP TABLE IF EXISTS `myems_system_db`.`tbl_points_detectors` ;
+
+CREATE TABLE IF NOT EXISTS `myems_system_db`.`tbl_points_detectors` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `detector` VARCHAR(64) NOT NULL COMMENT 'rate_of_change, mad or stuck_value, Used in Cleaning Service',
+  `parameters` LONGTEXT NOT NULL COMMENT 'MUST be in JSON format',
+  PRIMARY KEY (`id`));
+CREATE INDEX `tbl_points_detectors_index_1` ON  `myems_system_db`.`tbl_points_detectors`   (`point_id`);
+
 -- ---------------------------------------------------------------------------------------------------------------------
 -- Table `myems_system_db`.`tbl_sensors`
 -- ---------------------------------------------------------------------------------------------------------------------
@@ -27,6 +27,10 @@ WHERE start_datetime_utc >= '2020-12-31 16:00:00';
 -- NOTE: if you delete tbl_offline_meter_hourly, the offline meter files should be reuploaded
 -- DELETE FROM `myems_energy_db`.`tbl_offline_meter_hourly`
 -- WHERE start_datetime_utc >= '2020-12-31 16:00:00';
+-- DELETE FROM `myems_energy_db`.`tbl_normalization_watermarks`
+-- WHERE entity_type = 'offline_meter';
+-- INSERT INTO `myems_energy_db`.`tbl_normalization_watermarks` (entity_type, entity_id, last_slot_utc)
+-- SELECT 'offline_meter', offline_meter_id, MAX(start_datetime_utc) FROM `myems_energy_db`.`tbl_offline_meter_hourly` GROUP BY offline_meter_id;
 
 DELETE FROM `myems_energy_db`.`tbl_shopfloor_input_category_hourly`
 WHERE start_datetime_utc >= '2020-12-31 16:00:00';
@@ -58,6 +62,15 @@ WHERE start_datetime_utc >= '2020-12-31 16:00:00';
 DELETE FROM `myems_energy_db`.`tbl_virtual_meter_hourly`
 WHERE start_datetime_utc >= '2020-12-31 16:00:00';
 
+-- NOTE: myems-normalization resumes from the watermarks, so they are reset to the last time slots left in the hourly
+-- tables, and the meters and virtual meters without any time slot left start from START_DATETIME_UTC
+DELETE FROM `myems_energy_db`.`tbl_normalization_watermarks`
+WHERE entity_type IN ('meter', 'virtual_meter');
+INSERT INTO `myems_energy_db`.`tbl_normalization_watermarks` (entity_type, entity_id, last_slot_utc)
+SELECT 'meter', meter_id, MAX(start_datetime_utc) FROM `myems_energy_db`.`tbl_meter_hourly` GROUP BY meter_id;
+INSERT INTO `myems_energy_db`.`tbl_normalization_watermarks` (entity_type, entity_id, last_slot_utc)
+SELECT 'virtual_meter', virtual_meter_id, MAX(start_datetime_utc) FROM `myems_energy_db`.`tbl_virtual_meter_hourly` GROUP BY virtual_meter_id;
+
 DELETE FROM `myems_billing_db`.`tbl_combined_equipment_input_category_hourly`
 WHERE start_datetime_utc >= '2020-12-31 16:00:00';
 
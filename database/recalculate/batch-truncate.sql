@@ -12,6 +12,7 @@ TRUNCATE TABLE myems_energy_db.tbl_equipment_output_category_hourly;
 TRUNCATE TABLE myems_energy_db.tbl_meter_hourly;
 -- NOTE: if you truncate tbl_offline_meter_hourly, the offline meter files should be reuploaded
 -- TRUNCATE TABLE myems_energy_db.tbl_offline_meter_hourly;
+-- DELETE FROM myems_energy_db.tbl_normalization_watermarks WHERE entity_type = 'offline_meter';
 TRUNCATE TABLE myems_energy_db.tbl_shopfloor_input_category_hourly;
 TRUNCATE TABLE myems_energy_db.tbl_shopfloor_input_item_hourly;
 TRUNCATE TABLE myems_energy_db.tbl_space_input_category_hourly;
@@ -22,6 +23,8 @@ TRUNCATE TABLE myems_energy_db.tbl_store_input_item_hourly;
 TRUNCATE TABLE myems_energy_db.tbl_tenant_input_category_hourly;
 TRUNCATE TABLE myems_energy_db.tbl_tenant_input_item_hourly;
 TRUNCATE TABLE myems_energy_db.tbl_virtual_meter_hourly;
+-- NOTE: myems-normalization resumes from the watermarks, so they are deleted to start from START_DATETIME_UTC
+DELETE FROM myems_energy_db.tbl_normalization_watermarks WHERE entity_type IN ('meter', 'virtual_meter');
 
 TRUNCATE TABLE myems_billing_db.tbl_combined_equipment_input_category_hourly;
 TRUNCATE TABLE myems_billing_db.tbl_combined_equipment_input_item_hourly;
@@ -0,0 +1,76 @@
+-- ---------------------------------------------------------------------------------------------------------------------
+-- WARNING: BACKUP YOUR DATABASE BEFORE UPGRADING
+-- THIS SCRIPT IS ONLY FOR UPGRADING 3.11.0 TO 3.12.0
+-- THE CURRENT VERSION CAN BE FOUND AT `myems_system_db`.`tbl_versions`
+-- ---------------------------------------------------------------------------------------------------------------------
+
+START TRANSACTION;
+
+-- remove duplicated latest values and keep the newest one of each point,
+-- then replace the index on point_id and utc_date_time with a unique key on point_id
+-- so that latest values can be upserted by INSERT ... ON DUPLICATE KEY UPDATE
+DELETE t1 FROM `myems_historical_db`.`tbl_analog_value_latest` t1
+INNER JOIN `myems_historical_db`.`tbl_analog_value_latest` t2
+ON t1.point_id = t2.point_id AND (t1.utc_date_time < t2.utc_date_time OR (t1.utc_date_time = t2.utc_date_time AND t1.id < t2.id));
+DROP INDEX `tbl_analog_value_latest_index_1` ON `myems_historical_db`.`tbl_analog_value_latest`;
+CREATE UNIQUE INDEX `tbl_analog_value_latest_index_1` ON  `myems_historical_db`.`tbl_analog_value_latest`  (`point_id`);
+
+DELETE t1 FROM `myems_historical_db`.`tbl_digital_value_latest` t1
+INNER JOIN `myems_historical_db`.`tbl_digital_value_latest` t2
+ON t1.point_id = t2.point_id AND (t1.utc_date_time < t2.utc_date_time OR (t1.utc_date_time = t2.utc_date_time AND t1.id < t2.id));
+DROP INDEX `tbl_digital_value_latest_index_1` ON `myems_historical_db`.`tbl_digital_value_latest`;
+CREATE UNIQUE INDEX `tbl_digital_value_latest_index_1` ON  `myems_historical_db`.`tbl_digital_value_latest`  (`point_id`);
+
+DELETE t1 FROM `myems_historical_db`.`tbl_energy_value_latest` t1
+INNER JOIN `myems_historical_db`.`tbl_energy_value_latest` t2
+ON t1.point_id = t2.point_id AND (t1.utc_date_time < t2.utc_date_time OR (t1.utc_date_time = t2.utc_date_time AND t1.id < t2.id));
+DROP INDEX `tbl_energy_value_latest_index_1` ON `myems_historical_db`.`tbl_energy_value_latest`;
+CREATE UNIQUE INDEX `tbl_energy_value_latest_index_1` ON  `myems_historical_db`.`tbl_energy_value_latest`  (`point_id`);
+
+-- add acquisition statistics reported by gateway heartbeat
+ALTER TABLE `myems_system_db`.`tbl_gateways`
+ADD `live_workers` INT NULL COMMENT 'The number of running acquisition workers reported by Heartbeat' AFTER `description`,
+ADD `spool_records` BIGINT NULL COMMENT 'The number of records in the local spool reported by Heartbeat' AFTER `live_workers`,
+ADD `average_sweep_seconds` DECIMAL(18, 3) NULL COMMENT 'The average sweep time since the previous Heartbeat' AFTER `spool_records`;
+
+-- add watermarks of cleaning energy values,
+-- so that myems-cleaning cleans only the energy values inserted since the last run
+CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_energy_value_cleaning_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `last_cleaned_id` BIGINT NOT NULL COMMENT 'Energy values of the point with id less than or equal to it are cleaned',
+  `base_actual_value` DECIMAL(18, 3) NULL COMMENT 'The last good value, less values are concave candidates',
+  `base_utc_date_time` DATETIME NULL COMMENT 'The time of the base value, values not later than it are not compared with it',
+  `detector_context` LONGTEXT NULL COMMENT 'Recent values checked by detectors, MUST be in JSON format',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_energy_value_cleaning_watermarks_index_1` ON  `myems_historical_db`.`tbl_energy_value_cleaning_watermarks`  (`point_id`);
+
+-- add statistical outlier detectors of energy value points used in myems-cleaning
+CREATE TABLE IF NOT EXISTS `myems_system_db`.`tbl_points_detectors` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `detector` VARCHAR(64) NOT NULL COMMENT 'rate_of_change, mad or stuck_value, Used in Cleaning Service',
+  `parameters` LONGTEXT NOT NULL COMMENT 'MUST be in JSON format',
+  PRIMARY KEY (`id`));
+CREATE INDEX `tbl_points_detectors_index_1` ON  `myems_system_db`.`tbl_points_detectors`   (`point_id`);
+
+-- add watermarks of normalization,
+-- so that myems-normalization reads the last normalized time slots of all meters in one query
+CREATE TABLE IF NOT EXISTS `myems_energy_db`.`tbl_normalization_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `entity_type` VARCHAR(32) NOT NULL COMMENT 'meter, virtual_meter or offline_meter',
+  `entity_id` BIGINT NOT NULL,
+  `last_slot_utc` DATETIME NOT NULL COMMENT 'The start datetime of the last normalized time slot',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_normalization_watermarks_index_1` ON  `myems_energy_db`.`tbl_normalization_watermarks`   (`entity_type`, `entity_id`);
+INSERT INTO `myems_energy_db`.`tbl_normalization_watermarks` (entity_type, entity_id, last_slot_utc)
+SELECT 'meter', meter_id, MAX(start_datetime_utc) FROM `myems_energy_db`.`tbl_meter_hourly` GROUP BY meter_id;
+INSERT INTO `myems_energy_db`.`tbl_normalization_watermarks` (entity_type, entity_id, last_slot_utc)
+SELECT 'virtual_meter', virtual_meter_id, MAX(start_datetime_utc) FROM `myems_energy_db`.`tbl_virtual_meter_hourly` GROUP BY virtual_meter_id;
+INSERT INTO `myems_energy_db`.`tbl_normalization_watermarks` (entity_type, entity_id, last_slot_utc)
+SELECT 'offline_meter', offline_meter_id, MAX(start_datetime_utc) FROM `myems_energy_db`.`tbl_offline_meter_hourly` GROUP BY offline_meter_id;
+
+-- UPDATE VERSION NUMBER
+-- the version number and the release date are updated by the release, together with the install scripts
+
+COMMIT;
@@ -22,7 +22,8 @@ class GatewayCollection:
         admin_control(req)
         cnx = mysql.connector.connect(**config.myems_system_db)
         cursor = cnx.cursor()
-        query = (" SELECT id, name, uuid, token, last_seen_datetime_utc, description "
+        query = (" SELECT id, name, uuid, token, last_seen_datetime_utc, description, "
+                 "        live_workers, spool_records, average_sweep_seconds "
                  " FROM tbl_gateways "
                  " ORDER BY id ")
         cursor.execute(query)
@@ -46,7 +47,10 @@ class GatewayCollection:
                 meta_result = {"id": row[0], "name": row[1], "uuid": row[2],
                                "token": row[3],
                                "last_seen_datetime": last_seen_datetime,
-                               "description": row[5]
+                               "description": row[5],
+                               "live_workers": row[6],
+                               "spool_records": row[7],
+                               "average_sweep_seconds": row[8]
                                }
                 result.append(meta_result)
 
@@ -127,7 +131,8 @@ class GatewayItem:
         cnx = mysql.connector.connect(**config.myems_system_db)
         cursor = cnx.cursor()
 
-        query = (" SELECT id, name, uuid, token, last_seen_datetime_utc, description "
+        query = (" SELECT id, name, uuid, token, last_seen_datetime_utc, description, "
+                 "        live_workers, spool_records, average_sweep_seconds "
                  " FROM tbl_gateways "
                  " WHERE id =%s ")
         cursor.execute(query, (id_,))
@@ -154,7 +159,10 @@ class GatewayItem:
                   "uuid": row[2],
                   "token": row[3],
                   "last_seen_datetime": last_seen_datetime,
-                  "description": row[5]}
+                  "description": row[5],
+                  "live_workers": row[6],
+                  "spool_records": row[7],
+                  "average_sweep_seconds": row[8]}
 
         resp.text = json.dumps(result)
 
@@ -0,0 +1,349 @@
+import argparse
+import heapq
+import logging
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import mysql.connector
+
+import clean_energy_value
+import config
+import detectors
+
+########################################################################################################################
+# Benchmark of Cleaning Energy Values
+# Generates synthetic energy values of many points with labeled bad cases, and reports the rows classified per second
+# and the accuracy of cleaning against the labels, so that optimizations can be checked for both speed and accuracy.
+# Bad cases of the generated values:
+# bad case 1.1: runs of values greater than the high limit
+# bad case 1.2: runs of zeros
+# bad case 2.x: runs of concave values less than the last good value
+# spike: a value increasing much faster than the other values, found by the detectors rate_of_change and mad
+# stuck: a run of unchanged values, of which the values after STUCK_MAX_MINUTES are found by the detector stuck_value
+# The values of a point are one minute apart and end at the current time, no bad case is generated in the last 90
+# minutes, so that all concave candidates are confirmed or expired.
+#
+# By default, the values are classified in memory chunk by chunk as the workers of clean_energy_value do, without
+# database. With --runs, they are classified in several incremental runs with the watermarks of the previous run, and
+# the tags are compared with one run, so that the state carried between runs is checked. With --database, the points
+# and their detectors are inserted into system database, and the values are inserted into historical database in order
+# of time, and then clean_energy_value.clean runs on them, once or in --runs incremental runs after the values of each
+# run are inserted. Please use empty test databases for that.
+# The detectors of points are rate_of_change, mad and stuck_value by default.
+########################################################################################################################
+
+HIGH_LIMIT = Decimal('999999999.000')
+LOW_LIMIT = Decimal('0.000')
+# the value of bad case 1.1
+HIGH_OUTLIER_VALUE = Decimal('52776558592.000')
+# no bad case is generated in the last minutes of each point
+MINUTES_WITHOUT_BAD_CASE = 90
+# the increment of the value of case spike
+SPIKE_INCREMENT = 100000.0
+# the maximum minutes of unchanged values of case stuck, as in the detector stuck_value
+STUCK_MAX_MINUTES = 120
+# detectors of all points by default, the labels of cases spike and stuck depend on them
+DEFAULT_DETECTOR_LIST = [('rate_of_change', '{"max_rate_per_minute": 100.0}'),
+                         ('mad', '{"window": 30, "threshold": 5.0}'),
+                         ('stuck_value', '{"max_minutes": %d}' % STUCK_MAX_MINUTES)]
+
+
+def generate_point_values(point_id, number_of_values, end_datetime_utc, bad_case_rate, seed):
+    """
+    Generate the energy values of a point in order of utc_date_time
+
+    :return: generator of (point_id, utc_date_time, actual_value, is_bad) where is_bad is the label
+    """
+    random_generator = random.Random(seed * 1000003 + point_id)
+    start_datetime_utc = end_datetime_utc - timedelta(minutes=number_of_values - 1)
+    value = random_generator.uniform(1000.0, 100000.0)
+    # the minute when the value changed last time
+    changed_i = 0
+    i = 0
+    while i < number_of_values:
+        if 0 < i < number_of_values - MINUTES_WITHOUT_BAD_CASE and random_generator.random() < bad_case_rate:
+            bad_case = random_generator.choice(('1.1', '1.2', '2.x', 'spike', 'stuck'))
+            if bad_case == 'spike':
+                yield point_id, start_datetime_utc + timedelta(minutes=i), \
+                    Decimal(str(round(value + SPIKE_INCREMENT, 3))), True
+                i += 1
+                continue
+            if bad_case == 'stuck':
+                # the run of unchanged values starts from the last value, or continues the last run
+                for j in range(min(random_generator.randint(STUCK_MAX_MINUTES // 2, STUCK_MAX_MINUTES * 2),
+                                   number_of_values - MINUTES_WITHOUT_BAD_CASE - i)):
+                    yield point_id, start_datetime_utc + timedelta(minutes=i), Decimal(str(round(value, 3))), \
+                        i - changed_i > STUCK_MAX_MINUTES
+                    i += 1
+                continue
+            for j in range(min(random_generator.randint(1, 10), number_of_values - MINUTES_WITHOUT_BAD_CASE - i)):
+                if bad_case == '1.1':
+                    actual_value = HIGH_OUTLIER_VALUE
+                elif bad_case == '1.2':
+                    actual_value = Decimal('0.000')
+                else:
+                    actual_value = Decimal(str(round(value - random_generator.uniform(1.0, 100.0), 3)))
+                yield point_id, start_datetime_utc + timedelta(minutes=i), actual_value, True
+                i += 1
+            continue
+
+        value += random_generator.uniform(0.0, 10.0)
+        changed_i = i
+        yield point_id, start_datetime_utc + timedelta(minutes=i), Decimal(str(round(value, 3))), False
+        i += 1
+
+
+def report(number_of_rows, elapsed_time, confusion_dict):
+    true_positive = confusion_dict['true_positive']
+    false_positive = confusion_dict['false_positive']
+    false_negative = confusion_dict['false_negative']
+    print("%d rows classified in %.3fs, %.0f rows/s" %
+          (number_of_rows, elapsed_time, number_of_rows / elapsed_time if elapsed_time > 0 else 0.0))
+    print("bad values: %d true positives, %d false positives, %d false negatives, %d pending, "
+          "precision %.4f, recall %.4f" %
+          (true_positive, false_positive, false_negative, confusion_dict['pending'],
+           true_positive / (true_positive + false_positive) if true_positive + false_positive > 0 else 1.0,
+           true_positive / (true_positive + false_negative) if true_positive + false_negative > 0 else 1.0))
+
+
+def count_result(confusion_dict, is_bad_label, is_bad):
+    """
+    :param is_bad: True if tagged bad, False if tagged good, or None if pending
+    """
+    if is_bad is None:
+        confusion_dict['pending'] += 1
+    elif is_bad and is_bad_label:
+        confusion_dict['true_positive'] += 1
+    elif is_bad:
+        confusion_dict['false_positive'] += 1
+    elif is_bad_label:
+        confusion_dict['false_negative'] += 1
+
+
+def generate_rows(arguments, end_datetime_utc):
+    """
+    Generate the energy values of all points with ids assigned in order of utc_date_time and point_id,
+    as they are inserted by acquisition
+
+    :return: (list of (id, point_id, utc_date_time, actual_value), bytearray of labels by id)
+    """
+    generator_list = [generate_point_values(point_id, arguments.values, end_datetime_utc,
+                                            arguments.bad_case_rate, arguments.seed)
+                      for point_id in range(1, arguments.points + 1)]
+    rows_energy_values = list()
+    is_bad_label_list = bytearray(arguments.points * arguments.values + 1)
+    for id_, row in enumerate(heapq.merge(*generator_list, key=lambda row: (row[1], row[0])), start=1):
+        rows_energy_values.append((id_, row[0], row[1], row[2]))
+        is_bad_label_list[id_] = row[3]
+    return rows_energy_values, is_bad_label_list
+
+
+def tag_values(is_bad_list, bad_list, good_list):
+    for bad_id in bad_list:
+        is_bad_list[bad_id] = True
+    for good_id in good_list:
+        is_bad_list[good_id] = False
+
+
+def clean_in_memory(arguments, point_dict, rows_energy_values, number_of_runs):
+    """
+    Classify the values in number_of_runs incremental runs, each on the values inserted until its time,
+    with the watermarks of the previous run, as clean_energy_value.clean does on a single shard
+
+    :return: (list of tags by id, True for bad, False for good and None for pending, elapsed time of checks)
+    """
+    is_bad_list = [None] * (len(rows_energy_values) + 1)
+    watermark_dict = dict()
+    utc_date_time_list = [row[2] for row in rows_energy_values]
+    first_datetime_utc = utc_date_time_list[0]
+    elapsed_time = 0.0
+    for run_index in range(number_of_runs):
+        # the run takes place one minute after the last value inserted until then
+        run_datetime_utc = first_datetime_utc + timedelta(minutes=arguments.values * (run_index + 1) // number_of_runs)
+        max_id = bisect_left(utc_date_time_list, run_datetime_utc)
+        shard = {"max_id": max_id,
+                 "point_dict": point_dict,
+                 "watermark_dict": watermark_dict,
+                 "concave_expired_datetime": run_datetime_utc - timedelta(hours=1)}
+        # values not tagged yet, in order of point_id and utc_date_time as read by the worker
+        rows_run_values = sorted([row for row in rows_energy_values[:max_id] if is_bad_list[row[0]] is None],
+                                 key=lambda row: (row[1], row[2], row[0]))
+        new_watermark_dict = dict()
+        point_state = None
+        for i in range(0, len(rows_run_values), arguments.chunk_size):
+            start_time = time.perf_counter()
+            bad_list = list()
+            good_list = list()
+            point_state = clean_energy_value.check_chunk(shard, point_state,
+                                                         rows_run_values[i:i + arguments.chunk_size], bad_list,
+                                                         good_list, new_watermark_dict)
+            elapsed_time += time.perf_counter() - start_time
+            tag_values(is_bad_list, bad_list, good_list)
+        if point_state is not None:
+            start_time = time.perf_counter()
+            good_list = list()
+            clean_energy_value.finish_point(point_state, shard['concave_expired_datetime'], shard['max_id'],
+                                            good_list, new_watermark_dict)
+            elapsed_time += time.perf_counter() - start_time
+            tag_values(is_bad_list, list(), good_list)
+
+        watermark_dict = dict(watermark_dict)
+        watermark_dict.update(new_watermark_dict)
+    return is_bad_list, elapsed_time
+
+
+def get_detector_list(arguments):
+    """
+    :return: list of (name, parameters in JSON format) of the detectors of all points
+    """
+    if arguments.no_detector:
+        return list()
+    return arguments.detector if arguments.detector is not None else DEFAULT_DETECTOR_LIST
+
+
+def run_in_memory(arguments, end_datetime_utc):
+    point_dict = dict()
+    for point_id in range(1, arguments.points + 1):
+        point_dict[point_id] = {"high_limit": HIGH_LIMIT, "low_limit": LOW_LIMIT,
+                                "detector_list": [detectors.parse_detector(name, parameters)
+                                                  for name, parameters in get_detector_list(arguments)]}
+    rows_energy_values, is_bad_label_list = generate_rows(arguments, end_datetime_utc)
+
+    is_bad_list, elapsed_time = clean_in_memory(arguments, point_dict, rows_energy_values, arguments.runs)
+    confusion_dict = {'true_positive': 0, 'false_positive': 0, 'false_negative': 0, 'pending': 0}
+    for id_ in range(1, len(rows_energy_values) + 1):
+        count_result(confusion_dict, is_bad_label_list[id_] == 1, is_bad_list[id_])
+    report(len(rows_energy_values), elapsed_time, confusion_dict)
+
+    if arguments.runs > 1:
+        # the watermarks and the detector contexts carried between runs should not change any tag
+        is_bad_list_in_one_run, _ = clean_in_memory(arguments, point_dict, rows_energy_values, 1)
+        difference_list = [id_ for id_ in range(1, len(rows_energy_values) + 1)
+                           if is_bad_list[id_] != is_bad_list_in_one_run[id_]]
+        print("%d values tagged differently in %d runs than in one run" % (len(difference_list), arguments.runs))
+
+
+def run_in_database(arguments, end_datetime_utc):
+    start_datetime_utc = end_datetime_utc - timedelta(minutes=arguments.values - 1)
+    if datetime.strptime(config.start_datetime_utc, '%Y-%m-%d %H:%M:%S') > start_datetime_utc:
+        print("START_DATETIME_UTC must be earlier than " + start_datetime_utc.isoformat()[0:19])
+        return
+
+    cnx_system = mysql.connector.connect(**config.myems_system_db)
+    cursor_system = cnx_system.cursor()
+    cnx_historical = mysql.connector.connect(**config.myems_historical_db)
+    cursor_historical = cnx_historical.cursor()
+    try:
+        cursor_historical.execute(" SELECT (SELECT COUNT(*) FROM tbl_energy_value), "
+                                  "        (SELECT COUNT(*) FROM tbl_energy_value_cleaning_watermarks) ")
+        row = cursor_historical.fetchone()
+        if row[0] > 0 or row[1] > 0:
+            print("tbl_energy_value and tbl_energy_value_cleaning_watermarks must be empty, "
+                  "please use a test database")
+            return
+
+        print("Inserting %d points into system database" % arguments.points)
+        point_id_list = list()
+        for i in range(arguments.points):
+            cursor_system.execute(" INSERT INTO tbl_points "
+                                  "             (name, data_source_id, object_type, units, high_limit, low_limit, "
+                                  "              is_trend, address, description) "
+                                  " VALUES (%s, 0, 'ENERGY_VALUE', 'kWh', %s, %s, 1, '{}', 'benchmark') ",
+                                  ('benchmark energy value ' + str(i + 1) + ' ' + end_datetime_utc.isoformat(),
+                                   HIGH_LIMIT, LOW_LIMIT))
+            point_id_list.append(cursor_system.lastrowid)
+        for point_id in point_id_list:
+            for name, parameters in get_detector_list(arguments):
+                cursor_system.execute(" INSERT INTO tbl_points_detectors (point_id, detector, parameters) "
+                                      " VALUES (%s, %s, %s) ", (point_id, name, parameters))
+        cnx_system.commit()
+
+        def insert_values(insert_list):
+            cursor_historical.executemany(" INSERT INTO tbl_energy_value (point_id, utc_date_time, actual_value) "
+                                          " VALUES (%s, %s, %s) ", insert_list)
+            cnx_historical.commit()
+
+        # the values are inserted in order of time before each run, and cleaned incrementally by the watermarks
+        print("Inserting %d values into historical database in %d runs" %
+              (arguments.points * arguments.values, arguments.runs))
+        generator_list = [generate_point_values(point_id, arguments.values, end_datetime_utc,
+                                                arguments.bad_case_rate, arguments.seed)
+                          for point_id in point_id_list]
+        row_iterator = heapq.merge(*generator_list, key=lambda row: (row[1], row[0]))
+        row = next(row_iterator, None)
+        logger = logging.getLogger('myems-cleaning-benchmark')
+        logger.addHandler(logging.StreamHandler())
+        elapsed_time = 0.0
+        for run_index in range(arguments.runs):
+            run_datetime_utc = start_datetime_utc + timedelta(minutes=arguments.values * (run_index + 1) //
+                                                              arguments.runs)
+            insert_list = list()
+            while row is not None and row[1] < run_datetime_utc:
+                insert_list.append(row[0:3])
+                if len(insert_list) == 10000:
+                    insert_values(insert_list)
+                    insert_list = list()
+                row = next(row_iterator, None)
+            if len(insert_list) > 0:
+                insert_values(insert_list)
+
+            print("Cleaning, run %d of %d" % (run_index + 1, arguments.runs))
+            start_time = time.perf_counter()
+            is_cleaned = clean_energy_value.clean(logger)
+            elapsed_time += time.perf_counter() - start_time
+            if not is_cleaned:
+                print("Failed to clean, please check the log")
+                return
+
+        confusion_dict = {'true_positive': 0, 'false_positive': 0, 'false_negative': 0, 'pending': 0}
+        for point_id in point_id_list:
+            cursor_historical.execute(" SELECT is_bad "
+                                      " FROM tbl_energy_value "
+                                      " WHERE point_id = %s "
+                                      " ORDER BY utc_date_time ", (point_id,))
+            rows_is_bad = cursor_historical.fetchall()
+            for row_is_bad, row in zip(rows_is_bad, generate_point_values(point_id, arguments.values,
+                                                                          end_datetime_utc,
+                                                                          arguments.bad_case_rate,
+                                                                          arguments.seed)):
+                count_result(confusion_dict, row[3], None if row_is_bad[0] is None else row_is_bad[0] == 1)
+        report(arguments.points * arguments.values, elapsed_time, confusion_dict)
+    finally:
+        cursor_system.close()
+        cnx_system.close()
+        cursor_historical.close()
+        cnx_historical.close()
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Benchmark of cleaning energy values with synthetic data')
+    argument_parser.add_argument('--points', type=int, default=1000, help='number of points')
+    argument_parser.add_argument('--values', type=int, default=1440, help='number of values of each point')
+    argument_parser.add_argument('--bad-case-rate', type=float, default=0.01,
+                                 help='probability of starting a bad case at each value')
+    argument_parser.add_argument('--chunk-size', type=int, default=config.energy_value_chunk_size,
+                                 help='number of values in each chunk in memory')
+    argument_parser.add_argument('--seed', type=int, default=0, help='seed of the generator')
+    argument_parser.add_argument('--runs', type=int, default=1,
+                                 help='number of incremental runs, in memory the tags are compared with one run '
+                                      'if it is greater than 1')
+    argument_parser.add_argument('--detector', nargs=2, action='append', metavar=('NAME', 'PARAMETERS'),
+                                 help='detector of all points with parameters in JSON format, can be repeated, '
+                                      'instead of the default detectors')
+    argument_parser.add_argument('--no-detector', action='store_true', help='no detector of points')
+    argument_parser.add_argument('--database', action='store_true',
+                                 help='insert into system database and historical database and run the cleaning')
+    arguments = argument_parser.parse_args()
+
+    end_datetime_utc = datetime.utcnow().replace(second=0, microsecond=0)
+    if arguments.database:
+        run_in_database(arguments, end_datetime_utc)
+    else:
+        run_in_memory(arguments, end_datetime_utc)
+
+
+if __name__ == "__main__":
+    main()
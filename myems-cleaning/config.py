@@ -22,9 +22,27 @@ myems_historical_db = {
 # NOTE: By default, energy values in historical db will never be deleted automatically.
 live_in_days = config('LIVE_IN_DAYS', default=365, cast=int)
 
+# indicates how many days of daily partitions are created in advance
+# if tbl_analog_value and tbl_digital_value are partitioned by RANGE COLUMNS(utc_date_time)
+partitions_ahead_in_days = config('PARTITIONS_AHEAD_IN_DAYS', default=7, cast=int)
+
+# indicates how many expired analog values or digital values are deleted in one batch and how long to pause after
+# each batch, if tbl_analog_value and tbl_digital_value are not partitioned
+retention_batch_size = config('RETENTION_BATCH_SIZE', default=10000, cast=int)
+retention_batch_interval_in_seconds = config('RETENTION_BATCH_INTERVAL_IN_SECONDS', default=0.5, cast=float)
+
 # indicates from when (in UTC timezone) to clean if all is_bad properties are null
 # format string: "%Y-%m-%d %H:%M:%S"
 start_datetime_utc = config('START_DATETIME_UTC', default='2021-12-31 16:00:00')
 
+# indicates how many energy values are fetched from historical database at a time when cleaning,
+# the larger chunk size the more memory needed but the less round trips
+energy_value_chunk_size = config('ENERGY_VALUE_CHUNK_SIZE', default=10000, cast=int)
+
+# the number of worker processes in parallel for cleaning energy values,
+# points are split into shards of contiguous point ids
+# the pool size depends on the computing performance of the database server and the analysis server
+pool_size = config('POOL_SIZE', default=5, cast=int)
+
 # indicates if the program is in debug mode
 is_debug = config('IS_DEBUG', default=False, cast=bool)
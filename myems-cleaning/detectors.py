@@ -0,0 +1,191 @@
+import json
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+########################################################################################################################
+# Statistical Outlier Detectors of Energy Values
+# Detectors are configured per point in table tbl_points_detectors of system database, each with a JSON object of
+# parameters, and run on the values of a point in each chunk after the limit checks and before the concave check.
+# A detector is a function of numpy arrays of timestamps in seconds and values of the point in order of time,
+# which returns a boolean array where bad values are True. The arrays begin with the recent checked values of the point
+# in previous chunks as context, so that detectors are not blind at chunk boundaries.
+# The context of a point is saved with its cleaning watermark at the end of each run and restored in the next run,
+# so that detectors are not blind at run boundaries either.
+# To add a detector, implement the function and add it to detector_dict.
+#
+# NOTE: energy values are accumulated, so rates are the increments per minute of values.
+# Decreases of values are left to the concave check, values less than the maximum of the previous values are neither
+# checked by detectors nor kept in the context.
+########################################################################################################################
+
+# the minimum interval in minutes between values to calculate rates, to avoid dividing by zero
+MIN_INTERVAL_IN_MINUTES = 1.0 / 60
+# the scale factor of median absolute deviation to estimate the standard deviation of normal distribution
+MAD_SCALE_FACTOR = 1.4826
+
+
+def calculate_rates(timestamps, values):
+    """
+    :return: array of increments per minute from each value to the next value
+    """
+    return np.diff(values) / np.maximum(np.diff(timestamps) / 60.0, MIN_INTERVAL_IN_MINUTES)
+
+
+def detect_rate_of_change(timestamps, values, parameters):
+    """
+    Values increasing faster than max_rate_per_minute since the previous value are bad, such as spikes
+
+    :param parameters: {"max_rate_per_minute": 100.0}
+    """
+    mask = np.zeros(len(values), dtype=bool)
+    if len(values) < 2:
+        return mask
+    mask[1:] = calculate_rates(timestamps, values) > float(parameters['max_rate_per_minute'])
+    return mask
+
+
+def detect_mad(timestamps, values, parameters):
+    """
+    Values increasing faster than the rolling median rate by more than threshold times the scaled median absolute
+    deviation of the rates in the previous window are bad
+
+    :param parameters: {"window": 30, "threshold": 5.0}
+    """
+    window = int(parameters.get('window', 30))
+    threshold = float(parameters.get('threshold', 5.0))
+    mask = np.zeros(len(values), dtype=bool)
+    # window rates of the previous values and the rate of the value itself
+    if len(values) < window + 2:
+        return mask
+    rates = calculate_rates(timestamps, values)
+    # the k-th window holds rates[k:k + window], which precede rates[k + window]
+    windows = sliding_window_view(rates[:-1], window)
+    medians = np.median(windows, axis=1)
+    scales = MAD_SCALE_FACTOR * np.median(np.abs(windows - medians[:, np.newaxis]), axis=1)
+    deviations = rates[window:] - medians
+    # the rate from value i - 1 to value i belongs to value i
+    mask[window + 1:] = (scales > 0) & (deviations > threshold * scales)
+    return mask
+
+
+def detect_stuck_value(timestamps, values, parameters):
+    """
+    Values unchanged for longer than max_minutes since the value changed last time are bad,
+    such as a frozen meter or a communication failure
+
+    :param parameters: {"max_minutes": 120}
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=bool)
+    indexes = np.arange(len(values))
+    is_changed = np.ones(len(values), dtype=bool)
+    is_changed[1:] = values[1:] != values[:-1]
+    # index of the first value of the run of equal values
+    run_start_indexes = np.maximum.accumulate(np.where(is_changed, indexes, 0))
+    return (timestamps - timestamps[run_start_indexes]) / 60.0 > float(parameters['max_minutes'])
+
+
+detector_dict = {
+    'rate_of_change': detect_rate_of_change,
+    'mad': detect_mad,
+    'stuck_value': detect_stuck_value,
+}
+
+
+def parse_detector(name, parameters):
+    """
+    :return: (name, dict of parameters)
+    :raise ValueError: if the detector does not exist or the parameters are not a JSON object
+    """
+    if name not in detector_dict:
+        raise ValueError("detector " + str(name) + " does not exist")
+    parameters = json.loads(parameters) if parameters else dict()
+    if not isinstance(parameters, dict):
+        raise ValueError("parameters of detector " + str(name) + " must be a JSON object")
+    return name, parameters
+
+
+def get_context_size(detector_list):
+    """
+    :return: the number of recent checked values kept as context of the detectors
+    """
+    context_size = 1
+    for name, parameters in detector_list:
+        if name == 'mad':
+            context_size = max(context_size, int(parameters.get('window', 30)) + 1)
+    return context_size
+
+
+def detect(detector_list, context, timestamp_list, value_list):
+    """
+    Run the detectors of a point on its values in a chunk
+
+    :param detector_list: list of (name, parameters) of the point
+    :param context: (timestamps, values) of the recent values of the point checked by the detectors, or None
+    :param timestamp_list: list of timestamps in seconds of the values in order of time
+    :param value_list: list of values
+    :return: (list of True for bad values and False for good values, new context)
+    """
+    context_timestamps, context_values = context if context is not None else (np.zeros(0), np.zeros(0))
+    timestamps = np.concatenate((context_timestamps, np.array(timestamp_list, dtype=float)))
+    values = np.concatenate((context_values, np.array(value_list, dtype=float)))
+
+    # values less than the maximum of the previous values are not checked, they are left to the concave check,
+    # and the detectors run again without the bad values raising the maximum and greater than the next value,
+    # such as spikes, until no more bad value hides the next values from the detectors
+    is_excluded = np.zeros(len(values), dtype=bool)
+    while True:
+        maximums = np.maximum.accumulate(np.where(is_excluded, -np.inf, values))
+        previous_maximums = np.concatenate(([-np.inf], maximums[:-1]))
+        checked_indexes = np.nonzero(~is_excluded & (values >= previous_maximums))[0]
+        mask = is_excluded.copy()
+        for name, parameters in detector_list:
+            mask[checked_indexes] |= detector_dict[name](timestamps[checked_indexes], values[checked_indexes],
+                                                         parameters)
+        # values in context may hide the values in this chunk too, so they are excluded in the same way
+        included_indexes = np.nonzero(~is_excluded)[0]
+        is_hiding = np.zeros(len(values), dtype=bool)
+        is_hiding[included_indexes[:-1]] = values[included_indexes[:-1]] > values[included_indexes[1:]]
+        is_hiding &= mask & ~is_excluded & (values > previous_maximums)
+        if not np.any(is_hiding):
+            break
+        is_excluded |= is_hiding
+    # values in context are checked in previous chunks
+    mask[:len(context_values)] = False
+
+    checked_timestamps = timestamps[checked_indexes]
+    checked_values = values[checked_indexes]
+    # keep the recent checked values, and the first value of the run of the last value for the stuck value detector
+    keep_from_index = max(0, len(checked_values) - get_context_size(detector_list))
+    run_start_index = keep_from_index
+    if len(checked_values) > 0:
+        changed_indexes = np.nonzero(checked_values != checked_values[-1])[0]
+        run_start_index = changed_indexes[-1] + 1 if len(changed_indexes) > 0 else 0
+    if run_start_index < keep_from_index:
+        keep_indexes = np.concatenate(([run_start_index], np.arange(keep_from_index, len(checked_values))))
+    else:
+        keep_indexes = np.arange(keep_from_index, len(checked_values))
+    return mask[len(context_values):].tolist(), (checked_timestamps[keep_indexes], checked_values[keep_indexes])
+
+
+def encode_context(context):
+    """
+    :return: the context in JSON format to be saved with the cleaning watermark, or None
+    """
+    if context is None:
+        return None
+    context_timestamps, context_values = context
+    return json.dumps({"timestamps": context_timestamps.tolist(), "values": context_values.tolist()})
+
+
+def decode_context(context):
+    """
+    :param context: the context in JSON format saved with the cleaning watermark, or None
+    :return: (timestamps, values) of the recent values of the point checked by the detectors, or None
+    """
+    if not context:
+        return None
+    context = json.loads(context)
+    return np.array(context['timestamps'], dtype=float), np.array(context['values'], dtype=float)
@@ -0,0 +1,155 @@
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import config
+
+
+########################################################################################################################
+# Retention of Trend Values
+# Analog values and digital values older than live_in_days are expired.
+# If the table is partitioned by RANGE COLUMNS(utc_date_time), expired partitions are dropped and daily partitions for
+# the upcoming days are created in advance, so that retention is a metadata change instead of deleting rows.
+# Otherwise expired values are deleted in small batches with a pause after each batch, so that there is no huge
+# transaction bloating the undo logs and stalling the inserts of acquisition.
+#
+# Step 1: Get the partitions of the table
+# Step 2: Drop the expired partitions and create the upcoming partitions of a partitioned table
+# Step 3: Delete the expired values in batches of an unpartitioned table
+########################################################################################################################
+
+
+def job(logger, table_name):
+    cnx_historical = None
+    cursor_historical = None
+    try:
+        cnx_historical = mysql.connector.connect(**config.myems_historical_db)
+        cursor_historical = cnx_historical.cursor()
+    except Exception as e:
+        logger.error("Error in step 1.1 of retention.job of " + table_name + " " + str(e))
+        if cursor_historical:
+            cursor_historical.close()
+        if cnx_historical:
+            cnx_historical.close()
+        return
+
+    expired_utc = datetime.utcnow() - timedelta(days=config.live_in_days)
+    try:
+        ################################################################################################################
+        # Step 1: Get the partitions of the table
+        ################################################################################################################
+        partition_list = get_partitions(cursor_historical, table_name)
+
+        if partition_list is not None:
+            ############################################################################################################
+            # Step 2: Drop the expired partitions and create the upcoming partitions of a partitioned table
+            ############################################################################################################
+            drop_expired_partitions(cursor_historical, table_name, partition_list, expired_utc)
+            create_upcoming_partitions(cursor_historical, table_name, partition_list,
+                                       datetime.utcnow() + timedelta(days=config.partitions_ahead_in_days))
+            logger.info("Dropped partitions of " + table_name + " before date time in UTC: " +
+                        expired_utc.isoformat()[0:19])
+        else:
+            ############################################################################################################
+            # Step 3: Delete the expired values in batches of an unpartitioned table
+            ############################################################################################################
+            delete_expired_values(cnx_historical, cursor_historical, table_name, expired_utc)
+            logger.info("Deleted values of " + table_name + " before date time in UTC: " +
+                        expired_utc.isoformat()[0:19])
+    except Exception as e:
+        logger.error("Error in retention.job of " + table_name + " " + str(e))
+    finally:
+        if cursor_historical:
+            cursor_historical.close()
+        if cnx_historical:
+            cnx_historical.close()
+
+
+########################################################################################################################
+# Get the partitions of a table partitioned by RANGE COLUMNS(utc_date_time)
+# :return: list of dicts of partition name and upper bound in order of upper bound,
+#          the upper bound of the MAXVALUE partition is None,
+#          or None if the table is not partitioned or is partitioned in other ways
+########################################################################################################################
+def get_partitions(cursor_historical, table_name):
+    cursor_historical.execute(" SELECT PARTITION_NAME, PARTITION_METHOD, PARTITION_EXPRESSION, PARTITION_DESCRIPTION "
+                              " FROM information_schema.PARTITIONS "
+                              " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                              " ORDER BY PARTITION_ORDINAL_POSITION ", (table_name,))
+    rows_partitions = cursor_historical.fetchall()
+    if rows_partitions is None or len(rows_partitions) == 0 or rows_partitions[0][0] is None:
+        return None
+
+    partition_list = list()
+    for row in rows_partitions:
+        if row[1] != 'RANGE COLUMNS' or row[2].strip('`') != 'utc_date_time':
+            return None
+        if row[3] == 'MAXVALUE':
+            upper_bound = None
+        else:
+            upper_bound = datetime.strptime(row[3].strip("'")[0:19], '%Y-%m-%d %H:%M:%S')
+        partition_list.append({"name": row[0], "upper_bound": upper_bound})
+    return partition_list
+
+
+########################################################################################################################
+# Drop the partitions of which all values are expired, the last partition is never dropped
+########################################################################################################################
+def drop_expired_partitions(cursor_historical, table_name, partition_list, expired_utc):
+    expired_partition_name_list = [partition['name'] for partition in partition_list[:-1]
+                                   if partition['upper_bound'] is not None and partition['upper_bound'] <= expired_utc]
+    if len(expired_partition_name_list) > 0:
+        cursor_historical.execute(" ALTER TABLE " + table_name +
+                                  " DROP PARTITION " + ', '.join(expired_partition_name_list))
+
+
+########################################################################################################################
+# Create daily partitions until the upcoming datetime in UTC,
+# by splitting the MAXVALUE partition if there is one, else by adding partitions
+########################################################################################################################
+def create_upcoming_partitions(cursor_historical, table_name, partition_list, upcoming_utc):
+    upper_bound_list = [partition['upper_bound'] for partition in partition_list
+                        if partition['upper_bound'] is not None]
+    if len(upper_bound_list) > 0:
+        last_upper_bound = max(upper_bound_list)
+    else:
+        last_upper_bound = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    new_partition_list = list()
+    upper_bound = last_upper_bound.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while last_upper_bound <= upcoming_utc:
+        new_partition_list.append(" PARTITION p" + upper_bound.strftime('%Y%m%d') +
+                                  " VALUES LESS THAN ('" + upper_bound.strftime('%Y-%m-%d %H:%M:%S') + "') ")
+        last_upper_bound = upper_bound
+        upper_bound = upper_bound + timedelta(days=1)
+    if len(new_partition_list) == 0:
+        return
+
+    maxvalue_partition_list = [partition for partition in partition_list if partition['upper_bound'] is None]
+    if len(maxvalue_partition_list) > 0:
+        maxvalue_partition_name = maxvalue_partition_list[0]['name']
+        cursor_historical.execute(" ALTER TABLE " + table_name +
+                                  " REORGANIZE PARTITION " + maxvalue_partition_name + " INTO ( " +
+                                  ', '.join(new_partition_list) +
+                                  ", PARTITION " + maxvalue_partition_name + " VALUES LESS THAN (MAXVALUE)) ")
+    else:
+        cursor_historical.execute(" ALTER TABLE " + table_name +
+                                  " ADD PARTITION ( " + ', '.join(new_partition_list) + ") ")
+
+
+########################################################################################################################
+# Delete the expired values in batches, each batch is committed and followed by a pause
+########################################################################################################################
+def delete_expired_values(cnx_historical, cursor_historical, table_name, expired_utc):
+    while True:
+        cursor_historical.execute(" DELETE "
+                                  " FROM " + table_name +
+                                  " WHERE utc_date_time < %s "
+                                  " ORDER BY utc_date_time "
+                                  " LIMIT %s ", (expired_utc, config.retention_batch_size))
+        deleted_count = cursor_historical.rowcount
+        cnx_historical.commit()
+        if deleted_count < config.retention_batch_size:
+            break
+        time.sleep(config.retention_batch_interval_in_seconds)
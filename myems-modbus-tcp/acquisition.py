@@ -1,476 +1,292 @@
-import json
 import math
-import telnetlib3
-import asyncio
 import time
+import asyncio
 from datetime import datetime
 from decimal import Decimal
-import mysql.connector
-from modbus_tk import modbus_tcp
-import config
-from byte_swap import byte_swap_32_bit, byte_swap_64_bit
+from deadband import DeadbandFilter
+import metrics
+import planner
+from scheduler import Scheduler
+
+
+########################################################################################################################
+# Get point list of the data source
+# Returns None if failed to load points, or an empty list if there is no point for the data source
+########################################################################################################################
+async def load_point_list(logger, data_source_id, writer_pool):
+    try:
+        rows_point = await writer_pool.load_points(data_source_id)
+    except Exception as e:
+        logger.error("Error in step 2.2 of acquisition process: " + str(e))
+        return None
+
+    if rows_point is None or len(rows_point) == 0:
+        # there is no points for this data source, nothing is polled until points are added
+        logger.error("Point Not Found in Data Source (ID = %s), wait for points to be added ", data_source_id)
+        return list()
+
+    # There are points for this data source
+    point_list = list()
+    for row_point in rows_point:
+        point_list.append({"id": row_point[0],
+                           "name": row_point[1],
+                           "object_type": row_point[2],
+                           "is_trend": row_point[3],
+                           "ratio": row_point[4],
+                           "address": row_point[5]})
+    return point_list
 
 
 ########################################################################################################################
-# Check connectivity to the host and port
+# Execute a Modbus request and record its round trip time, timeouts and errors
 ########################################################################################################################
-async def check_connectivity(host, port):
-    reader, writer = await telnetlib3.open_connection(host, port)
-    # Close the connection
-    writer.close()
+async def execute(master, data_source_id, **kwargs):
+    start_time = time.perf_counter()
+    try:
+        result = await master.execute(**kwargs)
+    except TimeoutError:
+        metrics.request_timeouts_total.inc(data_source_id)
+        raise
+    except Exception:
+        metrics.request_errors_total.inc(data_source_id)
+        raise
+    metrics.request_duration_seconds.observe(time.perf_counter() - start_time, data_source_id)
+    return result
+
 
 ########################################################################################################################
 # Acquisition Procedures
-# Step 1: Check connectivity to the host and port
-# Step 2: Get point list
-# Step 3: Read point values from Modbus slaves
-# Step 4: Bulk insert point values and update latest values in historical database
+# Each data source is polled by one acquisition worker (coroutine), all workers run in the same event loop
+# Step 1: Connect to the host and port, the connection is kept alive by the Modbus master
+# Step 2: Get point list, and reload it when the engine notifies that the point configuration is changed
+# Step 3: Read point values from Modbus slaves on the deadlines of their polling intervals
+# Step 4: Bulk insert point values and update latest values in historical database by the shared writer pool
 ########################################################################################################################
 
 
-def process(logger, data_source_id, host, port):
+async def process(logger, data_source_id, host, port, interval_in_seconds, master, writer_pool, reload_event):
+    # hold back trend values inside the deadbands of points
+    deadband_filter = DeadbandFilter()
+
     while True:
         # begin of the outermost while loop
 
         ################################################################################################################
-        # Step 1: Check connectivity to the host and port
+        # Step 1: Connect to the host and port
         ################################################################################################################
         try:
-            asyncio.run(check_connectivity(host, port))
+            await master.connect()
             print("Succeeded to connect %s:%s in acquisition process ", host, port)
         except Exception as e:
             logger.error("Failed to connect %s:%s in acquisition process: %s  ", host, port, str(e))
-            # go to begin of the outermost while loop
-            time.sleep(300)
+            # wait for the backoff of reconnecting and go to begin of the outermost while loop
+            await asyncio.sleep(master.seconds_to_reconnect())
             continue
 
         ################################################################################################################
         # Step 2: Get point list
         ################################################################################################################
-        cnx_system_db = None
-        cursor_system_db = None
-        try:
-            cnx_system_db = mysql.connector.connect(**config.myems_system_db)
-            cursor_system_db = cnx_system_db.cursor()
-        except Exception as e:
-            logger.error("Error in step 2.1 of acquisition process " + str(e))
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
-            # go to begin of the outermost while loop
-            time.sleep(60)
-            continue
-
-        try:
-            query = (" SELECT id, name, object_type, is_trend, ratio, address "
-                     " FROM tbl_points "
-                     " WHERE data_source_id = %s AND is_virtual = 0 "
-                     " ORDER BY id ")
-            cursor_system_db.execute(query, (data_source_id,))
-            rows_point = cursor_system_db.fetchall()
-        except Exception as e:
-            logger.error("Error in step 2.2 of acquisition process: " + str(e))
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
-            # go to begin of the outermost while loop
-            time.sleep(60)
-            continue
-
-        if rows_point is None or len(rows_point) == 0:
-            # there is no points for this data source
-            logger.error("Point Not Found in Data Source (ID = %s), acquisition process terminated ", data_source_id)
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
+        reload_event.clear()
+        point_list = await load_point_list(logger, data_source_id, writer_pool)
+        if point_list is None:
             # go to begin of the outermost while loop
-            time.sleep(60)
+            await asyncio.sleep(60)
             continue
 
-        # There are points for this data source
-        point_list = list()
-        for row_point in rows_point:
-            point_list.append({"id": row_point[0],
-                               "name": row_point[1],
-                               "object_type": row_point[2],
-                               "is_trend": row_point[3],
-                               "ratio": row_point[4],
-                               "address": row_point[5]})
+        # compile point list into read plan once, and compile it again only when the point configuration is changed,
+        # then place the blocks of read plan into time slots by their polling intervals
+        read_plan = planner.compile_plan(logger, data_source_id, point_list)
+        read_scheduler = Scheduler(read_plan, interval_in_seconds)
 
         ################################################################################################################
         # Step 3: Read point values from Modbus slaves
         ################################################################################################################
-        # connect to historical database
-        cnx_historical_db = None
-        cursor_historical_db = None
-        try:
-            cnx_historical_db = mysql.connector.connect(**config.myems_historical_db)
-            cursor_historical_db = cnx_historical_db.cursor()
-        except Exception as e:
-            logger.error("Error in step 3.1 of acquisition process " + str(e))
-            if cursor_historical_db:
-                cursor_historical_db.close()
-            if cnx_historical_db:
-                cnx_historical_db.close()
-
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
-            # go to begin of the outermost while loop
-            time.sleep(60)
-            continue
-
-        # connect to the Modbus data source
-        master = modbus_tcp.TcpMaster(host=host, port=port, timeout_in_sec=5.0)
-        master.set_timeout(5.0)
         print("Ready to connect to %s:%s ", host, port)
 
-        # inner while loop to read all point values periodically
+        # inner while loop to read point values of time slots on their deadlines
         while True:
             # begin of the inner while loop
-            is_modbus_tcp_timed_out = False
+            # sleep until the next deadline or until the point configuration is changed
+            try:
+                await asyncio.wait_for(reload_event.wait(), read_scheduler.seconds_to_next_deadline())
+            except asyncio.TimeoutError:
+                pass
+
+            is_modbus_tcp_connection_lost = False
             energy_value_list = list()
             analog_value_list = list()
             digital_value_list = list()
 
-            # TODO: update point list in another thread
-            # foreach point loop
-            for point in point_list:
-                # begin of foreach point loop
-                try:
-                    address = json.loads(point['address'])
-                except Exception as e:
-                    logger.error("Error in step 3.2 of acquisition process: Invalid point address in JSON " + str(e))
-                    continue
+            # reload point list and compile read plan again if the point configuration is changed,
+            # an empty point list compiles into an empty read plan, so deleted points are not polled anymore
+            if reload_event.is_set():
+                reload_event.clear()
+                reloaded_point_list = await load_point_list(logger, data_source_id, writer_pool)
+                if reloaded_point_list is not None:
+                    read_plan = planner.compile_plan(logger, data_source_id, reloaded_point_list)
+                    read_scheduler = Scheduler(read_plan, interval_in_seconds)
+                else:
+                    # keep polling by the current read plan, and retry later because the engine has already taken
+                    # the new checksum of the point list and will not notify again
+                    asyncio.get_running_loop().call_later(60, reload_event.set)
+
+            due_block_list, missed_deadline_count = read_scheduler.pop_due_blocks()
+            if missed_deadline_count > 0:
+                metrics.missed_deadlines_total.inc(data_source_id, amount=missed_deadline_count)
+                logger.error("Data Source(ID=%s) missed %s polling deadlines, total %s missed deadlines ",
+                             data_source_id, missed_deadline_count, read_scheduler.missed_deadline_count)
+            if len(due_block_list) == 0:
+                # go to begin of the inner while loop to wait for the next deadline
+                continue
 
-                if 'slave_id' not in address.keys() \
-                        or 'function_code' not in address.keys() \
-                        or 'offset' not in address.keys() \
-                        or 'number_of_registers' not in address.keys() \
-                        or 'format' not in address.keys() \
-                        or 'byte_swap' not in address.keys() \
-                        or address['slave_id'] < 1 \
-                        or address['function_code'] not in (1, 2, 3, 4) \
-                        or address['offset'] < 0 \
-                        or address['number_of_registers'] < 0 \
-                        or len(address['format']) < 1 \
-                        or not isinstance(address['byte_swap'], bool):
-                    logger.error('Data Source(ID=%s), Point(ID=%s) Invalid address data.',
-                                 data_source_id, point['id'])
-                    # invalid point is found
-                    # go to begin of foreach point loop to process next point
+            # foreach block loop to read point values,
+            # points of a block are read in one request and then decoded in one pass
+            sweep_start_time = time.perf_counter()
+            point_result_list = list()
+            for block in due_block_list:
+                # begin of foreach block loop
+                if not master.is_slave_available(block.slave_id):
+                    # the slave is backing off after timeouts, skip its blocks until the backoff expires,
+                    # while the other slaves of the data source keep being polled
                     continue
 
-                # read point value
-                try:
-                    result = master.execute(slave=address['slave_id'],
-                                            function_code=address['function_code'],
-                                            starting_address=address['offset'],
-                                            quantity_of_x=address['number_of_registers'],
-                                            data_format=address['format'])
-                except Exception as e:
-                    logger.error(str(e) +
-                                 " host:" + host + " port:" + str(port) +
-                                 " slave_id:" + str(address['slave_id']) +
-                                 " function_code:" + str(address['function_code']) +
-                                 " starting_address:" + str(address['offset']) +
-                                 " quantity_of_x:" + str(address['number_of_registers']) +
-                                 " data_format:" + str(address['format']) +
-                                 " byte_swap:" + str(address['byte_swap']))
-
-                    if 'timed out' in str(e):
-                        is_modbus_tcp_timed_out = True
-                        # timeout error
-                        # break the foreach point loop
-                        break
-                    else:
-                        # exception occurred when read register value,
-                        # go to begin of foreach point loop to process next point
+                if block.is_block_read:
+                    try:
+                        registers = await execute(master, data_source_id,
+                                                  slave=block.slave_id,
+                                                  function_code=block.function_code,
+                                                  starting_address=block.offset,
+                                                  quantity_of_x=block.number_of_registers)
+                        point_result_list.extend(planner.decode_block(registers, block))
+                        # go to begin of foreach block loop to process next block
                         continue
-
+                    except Exception as e:
+                        logger.error(str(e) +
+                                     " host:" + host + " port:" + str(port) +
+                                     " slave_id:" + str(block.slave_id) +
+                                     " function_code:" + str(block.function_code) +
+                                     " starting_address:" + str(block.offset) +
+                                     " quantity_of_x:" + str(block.number_of_registers))
+
+                        if isinstance(e, ConnectionError):
+                            is_modbus_tcp_connection_lost = True
+                            # connection error, the Modbus master reconnects with backoff in the next sweep
+                            # break the foreach block loop
+                            break
+                        if isinstance(e, TimeoutError):
+                            # timeout error, the slave is backing off
+                            # go to begin of foreach block loop to process next block
+                            continue
+                        # exception occurred when read block, such as illegal data address in the gap between points,
+                        # fall back to read points of this block one by one
+
+                for descriptor in block.descriptor_list:
+                    # read point value
+                    try:
+                        if descriptor.function_code in planner.REGISTER_FUNCTION_CODES:
+                            registers = await execute(master, data_source_id,
+                                                      slave=descriptor.slave_id,
+                                                      function_code=descriptor.function_code,
+                                                      starting_address=descriptor.offset,
+                                                      quantity_of_x=descriptor.number_of_registers)
+                            result = planner.decode_registers(registers, descriptor.offset, descriptor)
+                        else:
+                            result = await execute(master, data_source_id,
+                                                   slave=descriptor.slave_id,
+                                                   function_code=descriptor.function_code,
+                                                   starting_address=descriptor.offset,
+                                                   quantity_of_x=descriptor.number_of_registers,
+                                                   data_format=descriptor.format)
+                    except Exception as e:
+                        logger.error(str(e) +
+                                     " host:" + host + " port:" + str(port) +
+                                     " slave_id:" + str(descriptor.slave_id) +
+                                     " function_code:" + str(descriptor.function_code) +
+                                     " starting_address:" + str(descriptor.offset) +
+                                     " quantity_of_x:" + str(descriptor.number_of_registers) +
+                                     " data_format:" + str(descriptor.format) +
+                                     " byte_swap:" + str(descriptor.byte_swap))
+
+                        if isinstance(e, ConnectionError):
+                            is_modbus_tcp_connection_lost = True
+                            # connection error
+                            # break the foreach point loop
+                            break
+                        elif isinstance(e, TimeoutError):
+                            # timeout error, the slave is backing off
+                            # break the foreach point loop
+                            break
+                        else:
+                            # exception occurred when read register value,
+                            # go to begin of foreach point loop to process next point
+                            continue
+
+                    point_result_list.append((descriptor, result))
+
+                if is_modbus_tcp_connection_lost:
+                    # break the foreach block loop
+                    break
+            # end of foreach block loop
+
+            # foreach result loop
+            for descriptor, result in point_result_list:
+                # begin of foreach result loop
                 if result is None or not isinstance(result, tuple) or len(result) == 0:
                     logger.error("Error in step 3.3 of acquisition process: \n"
                                  " invalid result: None "
-                                 " for point_id: " + str(point['id']))
+                                 " for point_id: " + str(descriptor.point_id))
                     # invalid result
-                    # go to begin of foreach point loop to process next point
+                    # go to begin of foreach result loop to process next result
                     continue
 
                 if not isinstance(result[0], float) and not isinstance(result[0], int) or math.isnan(result[0]):
                     logger.error(" Error in step 3.4 of acquisition process:\n"
                                  " invalid result: not float and not int or not a number "
-                                 " for point_id: " + str(point['id']))
+                                 " for point_id: " + str(descriptor.point_id))
                     # invalid result
-                    # go to begin of foreach point loop to process next point
+                    # go to begin of foreach result loop to process next result
                     continue
 
-                if address['byte_swap']:
-                    if address['number_of_registers'] == 2:
-                        value = byte_swap_32_bit(result[0])
-                    elif address['number_of_registers'] == 4:
-                        value = byte_swap_64_bit(result[0])
-                    else:
-                        value = result[0]
+                # byte swap of registers is done by the decoder, the swap function is only left for other formats
+                if descriptor.swap_function is not None:
+                    value = descriptor.swap_function(result[0])
                 else:
                     value = result[0]
 
-                if point['object_type'] == 'ANALOG_VALUE':
-                    analog_value_list.append({'point_id': point['id'],
-                                              'is_trend': point['is_trend'],
-                                              'value': Decimal(value) * point['ratio']})
-                elif point['object_type'] == 'ENERGY_VALUE':
-                    energy_value_list.append({'point_id': point['id'],
-                                              'is_trend': point['is_trend'],
-                                              'value': Decimal(value) * point['ratio']})
-                elif point['object_type'] == 'DIGITAL_VALUE':
-                    digital_value_list.append({'point_id': point['id'],
-                                               'is_trend': point['is_trend'],
-                                               'value': int(value) * int(point['ratio'])})
-
-            # end of foreach point loop
-
-            if is_modbus_tcp_timed_out:
-                # Modbus TCP connection timeout
-
-                # destroy the Modbus master
-                del master
-
-                # close the connection to database
-                if cursor_historical_db:
-                    cursor_historical_db.close()
-                if cnx_historical_db:
-                    cnx_historical_db.close()
-                if cursor_system_db:
-                    cursor_system_db.close()
-                if cnx_system_db:
-                    cnx_system_db.close()
-
-                # break the inner while loop
-                # go to begin of the outermost while loop
-                time.sleep(60)
-                break
+                if descriptor.object_type == 'ANALOG_VALUE':
+                    value = Decimal(value) * descriptor.ratio
+                    analog_value_list.append({'point_id': descriptor.point_id,
+                                              'is_trend': descriptor.is_trend and
+                                              deadband_filter.is_trend_required(descriptor, value),
+                                              'value': value})
+                elif descriptor.object_type == 'ENERGY_VALUE':
+                    value = Decimal(value) * descriptor.ratio
+                    energy_value_list.append({'point_id': descriptor.point_id,
+                                              'is_trend': descriptor.is_trend and
+                                              deadband_filter.is_trend_required(descriptor, value),
+                                              'value': value})
+                elif descriptor.object_type == 'DIGITAL_VALUE':
+                    digital_value_list.append({'point_id': descriptor.point_id,
+                                               'is_trend': descriptor.is_trend,
+                                               'value': int(value) * descriptor.ratio})
+
+            # end of foreach result loop
+            metrics.sweep_duration_seconds.observe(time.perf_counter() - sweep_start_time, data_source_id)
+            metrics.points_read_total.inc(data_source_id, amount=len(point_result_list))
 
             ############################################################################################################
             # Step 4: Bulk insert point values and update latest values in historical database
             ############################################################################################################
-            # check the connection to the Historical Database
-            if not cnx_historical_db.is_connected():
-                try:
-                    cnx_historical_db = mysql.connector.connect(**config.myems_historical_db)
-                    cursor_historical_db = cnx_historical_db.cursor()
-                except Exception as e:
-                    logger.error("Error in step 4.1 of acquisition process: " + str(e))
-                    if cursor_historical_db:
-                        cursor_historical_db.close()
-                    if cnx_historical_db:
-                        cnx_historical_db.close()
-                    # go to begin of the inner while loop
-                    time.sleep(60)
-                    continue
-
-            # check the connection to the System Database
-            if not cnx_system_db.is_connected():
-                try:
-                    cnx_system_db = mysql.connector.connect(**config.myems_system_db)
-                    cursor_system_db = cnx_system_db.cursor()
-                except Exception as e:
-                    logger.error("Error in step 4.2 of acquisition process: " + str(e))
-                    if cursor_system_db:
-                        cursor_system_db.close()
-                    if cnx_system_db:
-                        cnx_system_db.close()
-                    # go to begin of the inner while loop
-                    time.sleep(60)
-                    continue
-
             current_datetime_utc = datetime.utcnow()
-            # bulk insert values into historical database within a period
-            # and then update latest values
-            while len(analog_value_list) > 0:
-                analog_value_list_100 = analog_value_list[:100]
-                analog_value_list = analog_value_list[100:]
-
-                add_values = (" INSERT INTO tbl_analog_value (point_id, utc_date_time, actual_value) "
-                              " VALUES  ")
-                trend_value_count = 0
-
-                for point_value in analog_value_list_100:
-                    if point_value['is_trend']:
-                        add_values += " (" + str(point_value['point_id']) + ","
-                        add_values += "'" + current_datetime_utc.isoformat() + "',"
-                        add_values += str(point_value['value']) + "), "
-                        trend_value_count += 1
-
-                if trend_value_count > 0:
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(add_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.3.1 of acquisition process " + str(e))
-                        # ignore this exception
-
-                # update tbl_analog_value_latest
-                delete_values = " DELETE FROM tbl_analog_value_latest WHERE point_id IN ( "
-                latest_values = (" INSERT INTO tbl_analog_value_latest (point_id, utc_date_time, actual_value) "
-                                 " VALUES  ")
-                latest_value_count = 0
-
-                for point_value in analog_value_list_100:
-                    delete_values += str(point_value['point_id']) + ","
-                    latest_values += " (" + str(point_value['point_id']) + ","
-                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
-                    latest_values += str(point_value['value']) + "), "
-                    latest_value_count += 1
-
-                if latest_value_count > 0:
-                    try:
-                        # replace "," at the end of string with ")"
-                        cursor_historical_db.execute(delete_values[:-1] + ")")
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.3.2 of acquisition process " + str(e))
-                        # ignore this exception
-
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(latest_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.3.3 of acquisition process " + str(e))
-                        # ignore this exception
-
-            while len(energy_value_list) > 0:
-                energy_value_list_100 = energy_value_list[:100]
-                energy_value_list = energy_value_list[100:]
-
-                add_values = (" INSERT INTO tbl_energy_value (point_id, utc_date_time, actual_value) "
-                              " VALUES  ")
-                trend_value_count = 0
-
-                for point_value in energy_value_list_100:
-                    if point_value['is_trend']:
-                        add_values += " (" + str(point_value['point_id']) + ","
-                        add_values += "'" + current_datetime_utc.isoformat() + "',"
-                        add_values += str(point_value['value']) + "), "
-                        trend_value_count += 1
-
-                if trend_value_count > 0:
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(add_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.4.1 of acquisition process: " + str(e))
-                        # ignore this exception
-
-                # update tbl_energy_value_latest
-                delete_values = " DELETE FROM tbl_energy_value_latest WHERE point_id IN ( "
-                latest_values = (" INSERT INTO tbl_energy_value_latest (point_id, utc_date_time, actual_value) "
-                                 " VALUES  ")
-                latest_value_count = 0
-                for point_value in energy_value_list_100:
-                    delete_values += str(point_value['point_id']) + ","
-                    latest_values += " (" + str(point_value['point_id']) + ","
-                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
-                    latest_values += str(point_value['value']) + "), "
-                    latest_value_count += 1
-
-                if latest_value_count > 0:
-                    try:
-                        # replace "," at the end of string with ")"
-                        cursor_historical_db.execute(delete_values[:-1] + ")")
-                        cnx_historical_db.commit()
-
-                    except Exception as e:
-                        logger.error("Error in step 4.4.2 of acquisition process " + str(e))
-                        # ignore this exception
-
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(latest_values[:-2])
-                        cnx_historical_db.commit()
-
-                    except Exception as e:
-                        logger.error("Error in step 4.4.3 of acquisition process " + str(e))
-                        # ignore this exception
-
-            while len(digital_value_list) > 0:
-                digital_value_list_100 = digital_value_list[:100]
-                digital_value_list = digital_value_list[100:]
-
-                add_values = (" INSERT INTO tbl_digital_value (point_id, utc_date_time, actual_value) "
-                              " VALUES  ")
-                trend_value_count = 0
-
-                for point_value in digital_value_list_100:
-                    if point_value['is_trend']:
-                        add_values += " (" + str(point_value['point_id']) + ","
-                        add_values += "'" + current_datetime_utc.isoformat() + "',"
-                        add_values += str(point_value['value']) + "), "
-                        trend_value_count += 1
-
-                if trend_value_count > 0:
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(add_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.5.1 of acquisition process: " + str(e))
-                        # ignore this exception
-
-                # update tbl_digital_value_latest
-                delete_values = " DELETE FROM tbl_digital_value_latest WHERE point_id IN ( "
-                latest_values = (" INSERT INTO tbl_digital_value_latest (point_id, utc_date_time, actual_value) "
-                                 " VALUES  ")
-                latest_value_count = 0
-                for point_value in digital_value_list_100:
-                    delete_values += str(point_value['point_id']) + ","
-                    latest_values += " (" + str(point_value['point_id']) + ","
-                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
-                    latest_values += str(point_value['value']) + "), "
-                    latest_value_count += 1
-
-                if latest_value_count > 0:
-                    try:
-                        # replace "," at the end of string with ")"
-                        cursor_historical_db.execute(delete_values[:-1] + ")")
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.5.2 of acquisition process " + str(e))
-                        # ignore this exception
-
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(latest_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.5.3 of acquisition process " + str(e))
-                        # ignore this exception
-
-            # update data source last seen datetime
-            update_row = (" UPDATE tbl_data_sources "
-                          " SET last_seen_datetime_utc = '" + current_datetime_utc.isoformat() + "' "
-                          " WHERE id = %s ")
-            try:
-                cursor_system_db.execute(update_row, (data_source_id,))
-                cnx_system_db.commit()
-            except Exception as e:
-                logger.error("Error in step 4.6 of acquisition process " + str(e))
-                if cursor_system_db:
-                    cursor_system_db.close()
-                if cnx_system_db:
-                    cnx_system_db.close()
-                # go to begin of the inner while loop
-                time.sleep(60)
-                continue
-
-            # sleep interval in seconds and continue the inner while loop
-            time.sleep(config.interval_in_seconds)
+            write_start_time = time.perf_counter()
+            # trend values which can not be inserted are spooled by the writer pool, so polling goes on without pause
+            await writer_pool.write_values(data_source_id,
+                                           energy_value_list,
+                                           analog_value_list,
+                                           digital_value_list,
+                                           current_datetime_utc)
+            metrics.db_write_duration_seconds.observe(time.perf_counter() - write_start_time, data_source_id)
+            metrics.last_sweep_timestamp_seconds.set(time.time(), data_source_id)
 
         # end of the inner while loop
 
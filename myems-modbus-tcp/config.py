@@ -18,7 +18,8 @@ myems_historical_db = {
 }
 
 
-# Indicates how long the process waits between readings
+# Indicates how long the process waits between readings,
+# this is the default polling interval of data sources without interval_in_seconds in connection
 interval_in_seconds = config('INTERVAL_IN_SECONDS', default=600, cast=int)
 
 # Get the gateway ID and token from MyEMS Admin
@@ -27,3 +28,54 @@ gateway = {
     'id': config('GATEWAY_ID', default=1, cast=int),
     'token': config('GATEWAY_TOKEN', default='983427af-1c35-42ba-8b4d-288675550225')
 }
+
+# The maximum quantity of registers in one block read, 125 registers is the limit of Modbus specification
+max_registers_per_read = config('MAX_REGISTERS_PER_READ', default=125, cast=int)
+
+# The maximum number of unused registers between two points to be merged into one block read
+max_register_gap = config('MAX_REGISTER_GAP', default=4, cast=int)
+
+# The number of database writer threads shared by all acquisition workers,
+# each writer thread keeps one connection to system database and one connection to historical database
+writer_pool_size = config('WRITER_POOL_SIZE', default=4, cast=int)
+
+# The maximum number of in-flight requests per host and port of Modbus TCP servers,
+# most Modbus TCP servers process one request at a time
+max_requests_in_flight_per_host = config('MAX_REQUESTS_IN_FLIGHT_PER_HOST', default=1, cast=int)
+
+# Indicates how long a request waits for the response of a slave, the request holds an in-flight request of the host
+# and port meanwhile, so that a silent slave delays the other slaves behind the same gateway for this timeout at most
+slave_timeout_in_seconds = config('SLAVE_TIMEOUT_IN_SECONDS', default=1.0, cast=float)
+
+# Indicates how long the engine waits between reloading data sources and points,
+# the acquisition workers of changed data sources are restarted and changed points are re-planned
+reload_interval_in_seconds = config('RELOAD_INTERVAL_IN_SECONDS', default=60, cast=int)
+
+# The local spool file of trend values which failed to be inserted while the historical database is unreachable
+spool_path = config('SPOOL_PATH', default='myems-modbus-tcp-spool.db')
+
+# Indicates how long the spool flusher waits between replaying spooled trend values
+spool_flush_interval_in_seconds = config('SPOOL_FLUSH_INTERVAL_IN_SECONDS', default=60, cast=int)
+
+# The number of spooled records replayed in one read of the spool, each record holds up to 100 values
+spool_flush_batch_size = config('SPOOL_FLUSH_BATCH_SIZE', default=100, cast=int)
+
+# The maximum random delay of the first polling deadline of each time slot, to spread the load over time
+max_jitter_in_seconds = config('MAX_JITTER_IN_SECONDS', default=30, cast=int)
+
+# The default maximum silence interval of points with deadband,
+# a value inside the deadband is trended anyway when the point has not been trended for this interval
+deadband_max_silence_in_seconds = config('DEADBAND_MAX_SILENCE_IN_SECONDS', default=900, cast=int)
+
+# The initial and the maximum backoff of reconnecting to a host and of polling a slave after timeouts,
+# the backoff doubles on each consecutive failure
+backoff_initial_in_seconds = config('BACKOFF_INITIAL_IN_SECONDS', default=5, cast=int)
+backoff_max_in_seconds = config('BACKOFF_MAX_IN_SECONDS', default=300, cast=int)
+
+# The local HTTP endpoint of acquisition metrics in Prometheus text format, http://METRICS_HOST:METRICS_PORT/metrics
+# set METRICS_PORT to 0 to disable the endpoint
+metrics_host = config('METRICS_HOST', default='127.0.0.1')
+metrics_port = config('METRICS_PORT', default=9502, cast=int)
+
+# Indicates how long the gateway heartbeat waits between reports of acquisition statistics to system database
+heartbeat_interval_in_seconds = config('HEARTBEAT_INTERVAL_IN_SECONDS', default=60, cast=int)
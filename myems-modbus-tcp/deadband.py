@@ -0,0 +1,44 @@
+import time
+
+########################################################################################################################
+# Deadband Filter
+# Trend values of analog and energy points with deadband are held back in the acquisition worker while they stay
+# inside the absolute or percent deadband of the last trended value. A value is trended anyway when the point has been
+# silent for max_silence_in_seconds, as a heartbeat of the point in historical database.
+# Latest values are always updated regardless of the deadband.
+########################################################################################################################
+
+
+class DeadbandFilter:
+    def __init__(self):
+        # the last trended (value, monotonic time) by point id,
+        # kept across compiling of read plans so that reloading points does not reset the deadband
+        self.last_trend_dict = dict()
+
+    def is_trend_required(self, descriptor, value):
+        """
+        :param descriptor: the point descriptor
+        :param value: the Decimal value after ratio applied
+        :return: True if the value should be inserted into historical database
+        """
+        if descriptor.deadband_absolute is None and descriptor.deadband_percent is None:
+            return True
+
+        now = time.monotonic()
+        last_trend = self.last_trend_dict.get(descriptor.point_id)
+        if last_trend is None \
+                or now - last_trend[1] >= descriptor.max_silence_in_seconds \
+                or self.is_outside_deadband(descriptor, last_trend[0], value):
+            self.last_trend_dict[descriptor.point_id] = (value, now)
+            return True
+
+        return False
+
+    @staticmethod
+    def is_outside_deadband(descriptor, last_value, value):
+        delta = abs(value - last_value)
+        if descriptor.deadband_absolute is not None and delta > descriptor.deadband_absolute:
+            return True
+        if descriptor.deadband_percent is not None and delta > abs(last_value) * descriptor.deadband_percent / 100:
+            return True
+        return False
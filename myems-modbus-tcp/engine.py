@@ -0,0 +1,182 @@
+import asyncio
+import json
+
+import acquisition
+import config
+import gateway
+import metrics
+from modbus_client import AsyncTcpMaster
+from writer import WriterPool
+
+########################################################################################################################
+# Acquisition Engine
+# One event loop polls all Modbus TCP data sources of this gateway concurrently,
+# and all acquisition workers share one small writer pool.
+# The configuration watcher reloads data sources and checksums of point lists periodically, then
+# starts workers of new data sources, stops workers of removed data sources, restarts workers of changed connections
+# and notifies workers of changed point lists to re-plan their reads, without restarting this service.
+# The spool flusher replays trend values spooled while the historical database was unreachable.
+# The gateway heartbeat reports the health of acquisition to system database periodically.
+# The metrics of acquisition are served on a local HTTP endpoint in Prometheus text format if METRICS_PORT is set.
+########################################################################################################################
+
+
+def parse_connection(logger, data_source):
+    """
+    :param logger: the logger
+    :param data_source: row of data source (id, name, connection)
+    :return: (host, port, interval_in_seconds) tuple, or None if the connection is invalid,
+             interval_in_seconds is optional in connection and config.interval_in_seconds is used by default
+    """
+    if data_source[2] is None or len(data_source[2]) == 0:
+        logger.error("Data Source Connection Not Found.")
+        return None
+
+    try:
+        server = json.loads(data_source[2])
+    except Exception as e:
+        logger.error("Data Source Connection JSON error " + str(e))
+        return None
+
+    if 'host' not in server.keys() \
+            or 'port' not in server.keys() \
+            or server['host'] is None \
+            or server['port'] is None \
+            or len(server['host']) == 0 \
+            or not isinstance(server['port'], int) \
+            or server['port'] < 1 \
+            or ('interval_in_seconds' in server.keys() and
+                (not isinstance(server['interval_in_seconds'], int) or server['interval_in_seconds'] < 1)):
+        logger.error("Data Source Connection Invalid.")
+        return None
+
+    return server['host'], server['port'], server.get('interval_in_seconds', config.interval_in_seconds)
+
+
+async def stop_worker(worker):
+    if worker['task'] is not None:
+        # cancel again until the task is done, asyncio.wait_for may swallow the cancellation
+        # when the awaited future is done at the same time
+        while not worker['task'].done():
+            worker['task'].cancel()
+            await asyncio.wait({worker['task']}, timeout=1.0)
+        try:
+            worker['task'].result()
+        except (asyncio.CancelledError, Exception):
+            pass
+    if worker['master'] is not None:
+        await worker['master'].close()
+
+
+def start_worker(logger, data_source_id, worker, writer_pool):
+    host, port, interval_in_seconds = worker['server']
+    worker['master'] = AsyncTcpMaster(host=host, port=port, timeout_in_sec=5.0,
+                                      slave_timeout_in_sec=config.slave_timeout_in_seconds)
+    worker['reload_event'] = asyncio.Event()
+    worker['task'] = asyncio.create_task(acquisition.process(logger, data_source_id, host, port,
+                                                             interval_in_seconds,
+                                                             worker['master'],
+                                                             writer_pool,
+                                                             worker['reload_event']),
+                                         name='data-source-' + str(data_source_id))
+
+
+async def flush_spool(logger, writer_pool):
+    while True:
+        await asyncio.sleep(config.spool_flush_interval_in_seconds)
+        try:
+            await writer_pool.flush_spool()
+            metrics.spool_records.set(await writer_pool.count_spool())
+        except Exception as e:
+            logger.error("Error in spool flusher " + str(e))
+
+
+async def run(logger):
+    metrics_server = None
+    if config.metrics_port > 0:
+        try:
+            metrics_server = metrics.start_http_server(config.metrics_host, config.metrics_port)
+        except Exception as e:
+            logger.error("Error in starting metrics endpoint " + str(e))
+
+    writer_pool = WriterPool(logger)
+    # replay spooled trend values in background once the historical database is back
+    spool_flusher_task = asyncio.create_task(flush_spool(logger, writer_pool), name='spool-flusher')
+    # report the health of acquisition in background
+    heartbeat_task = asyncio.create_task(gateway.process(logger, writer_pool), name='gateway-heartbeat')
+    # workers by data source id
+    worker_dict = dict()
+    try:
+        while True:
+            ############################################################################################################
+            # Reload data sources and checksums of point lists
+            ############################################################################################################
+            try:
+                rows_data_source = await writer_pool.load_data_sources()
+                point_checksum_dict = await writer_pool.load_point_checksums()
+            except Exception as e:
+                logger.error("Error in engine process " + str(e))
+                # sleep several minutes and continue the loop to reload data sources
+                await asyncio.sleep(60)
+                continue
+
+            if rows_data_source is None or len(rows_data_source) == 0:
+                logger.error("Data Source Not Found, Wait for minutes to retry.")
+
+            data_source_dict = dict()
+            for data_source in rows_data_source or list():
+                data_source_dict[data_source[0]] = data_source
+
+            # stop workers of removed data sources
+            for data_source_id in list(worker_dict.keys()):
+                if data_source_id not in data_source_dict:
+                    print("Data Source Removed: ID=%s " % data_source_id)
+                    await stop_worker(worker_dict.pop(data_source_id))
+                    metrics.remove_data_source(data_source_id)
+
+            for data_source_id, data_source in data_source_dict.items():
+                worker = worker_dict.get(data_source_id)
+                if worker is not None and worker['connection'] == data_source[2]:
+                    if worker['task'] is None:
+                        # invalid connection is not changed
+                        continue
+                    if worker['task'].done():
+                        # the worker terminated unexpectedly, restart it
+                        logger.error("Acquisition worker of Data Source (ID = %s) terminated, restart it ",
+                                     data_source_id)
+                        await stop_worker(worker)
+                        start_worker(logger, data_source_id, worker, writer_pool)
+                    elif worker['point_checksum'] != point_checksum_dict.get(data_source_id):
+                        # notify the worker to reload point list and re-plan reads
+                        worker['reload_event'].set()
+                    worker['point_checksum'] = point_checksum_dict.get(data_source_id)
+                    continue
+
+                # new data source or the connection of data source is changed
+                if worker is not None:
+                    await stop_worker(worker)
+
+                print("Data Source: ID=%s, Name=%s, Connection=%s " %
+                      (data_source[0], data_source[1], data_source[2]))
+                worker = {'connection': data_source[2],
+                          'server': parse_connection(logger, data_source),
+                          'point_checksum': point_checksum_dict.get(data_source_id),
+                          'master': None,
+                          'reload_event': None,
+                          'task': None}
+                worker_dict[data_source_id] = worker
+                if worker['server'] is not None:
+                    start_worker(logger, data_source_id, worker, writer_pool)
+
+            metrics.workers.set(sum(1 for worker in worker_dict.values()
+                                    if worker['task'] is not None and not worker['task'].done()))
+
+            await asyncio.sleep(config.reload_interval_in_seconds)
+    finally:
+        spool_flusher_task.cancel()
+        heartbeat_task.cancel()
+        for worker in worker_dict.values():
+            await stop_worker(worker)
+        writer_pool.shutdown()
+        if metrics_server is not None:
+            metrics_server.shutdown()
@@ -1,88 +1,71 @@
-import time
+import asyncio
 from datetime import datetime
 
-import mysql.connector
-import schedule
-
 import config
+import metrics
 
 
 ########################################################################################################################
-# Gateway Job Procedures
+# Gateway Heartbeat Procedures
+# The heartbeat runs in the event loop of the acquisition engine, so that it reports the health of acquisition
+# collected from the metrics, and it writes over the pooled connection to system database of the shared writer pool
+# instead of opening a new connection for each run.
 # Step 1: Verify Gateway Token
-# Step 2: Collect Gateway Information
-# Step 3: Update Gateway Information
+# Step 2: Collect Acquisition Statistics
+# Step 3: Update Gateway Information and last seen datetime of data sources
 ########################################################################################################################
 
 
-def job(logger, ):
-    ################################################################################################################
-    # Step 1: Verify Gateway Token
-    ################################################################################################################
-    cnx_system_db = None
-    cursor_system_db = None
-    try:
-        cnx_system_db = mysql.connector.connect(**config.myems_system_db)
-        cursor_system_db = cnx_system_db.cursor()
-    except Exception as e:
-        logger.error("Error in step 1.1 of Gateway process " + str(e))
-        if cursor_system_db:
-            cursor_system_db.close()
-        if cnx_system_db:
-            cnx_system_db.close()
-        return
+async def process(logger, writer_pool):
+    # totals of sweep durations and last sweeps by data source reported by the previous heartbeat,
+    # so that average sweep time is calculated since the previous heartbeat and unchanged data sources are not updated
+    previous_sweep_totals = (0.0, 0)
+    previous_last_sweep_dict = dict()
+
+    while True:
+        await asyncio.sleep(config.heartbeat_interval_in_seconds)
 
-    # TODO: choose a more secure method to verify gateway token
-    try:
-        query = (" SELECT name "
-                 " FROM tbl_gateways "
-                 " WHERE id = %s AND token = %s ")
-        cursor_system_db.execute(query, (config.gateway['id'], config.gateway['token']))
-        row = cursor_system_db.fetchone()
-    except Exception as e:
-        logger.error("Error in step 1.2 of gateway process: " + str(e))
-        if cursor_system_db:
-            cursor_system_db.close()
-        if cnx_system_db:
-            cnx_system_db.close()
-        return
+        ################################################################################################################
+        # Step 2: Collect Acquisition Statistics
+        ################################################################################################################
+        current_datetime_utc = datetime.utcnow()
 
-    if row is None:
-        logger.error("Error in step 1.3 of gateway process: Not Found ")
-        if cursor_system_db:
-            cursor_system_db.close()
-        if cnx_system_db:
-            cnx_system_db.close()
-        return
+        sweep_totals = metrics.sweep_duration_seconds.get_totals()
+        average_sweep_seconds = None
+        if sweep_totals[1] > previous_sweep_totals[1] and sweep_totals[0] >= previous_sweep_totals[0]:
+            average_sweep_seconds = ((sweep_totals[0] - previous_sweep_totals[0]) /
+                                     (sweep_totals[1] - previous_sweep_totals[1]))
 
-    ############################################################################################################
-    # Step 2: Collect Gateway Information
-    ############################################################################################################
-    # todo: get more information, such as CPU/MEMORY/DISK
-    current_datetime_utc = datetime.utcnow()
+        last_sweep_dict = dict()
+        for label_values, timestamp in metrics.last_sweep_timestamp_seconds.get_values().items():
+            last_sweep_dict[label_values[0]] = timestamp
+        changed_last_sweep_dict = dict()
+        for data_source_id, timestamp in last_sweep_dict.items():
+            if previous_last_sweep_dict.get(data_source_id) != timestamp:
+                changed_last_sweep_dict[data_source_id] = datetime.utcfromtimestamp(timestamp)
 
-    ############################################################################################################
-    # Step 3: Update Gateway Information
-    ############################################################################################################
-    update_row = (" UPDATE tbl_gateways "
-                  " SET last_seen_datetime_utc = '" + current_datetime_utc.isoformat() + "' "
-                  " WHERE id = %s ")
-    try:
-        cursor_system_db.execute(update_row, (config.gateway['id'], ))
-        cnx_system_db.commit()
-    except Exception as e:
-        logger.error("Error in step 3.1 of gateway process " + str(e))
-        return
-    finally:
-        if cursor_system_db:
-            cursor_system_db.close()
-        if cnx_system_db:
-            cnx_system_db.close()
+        try:
+            spool_records = await writer_pool.count_spool()
+            metrics.spool_records.set(spool_records)
+        except Exception as e:
+            logger.error("Error in step 2.1 of gateway process " + str(e))
+            spool_records = None
 
+        statistics = {'last_seen_datetime_utc': current_datetime_utc,
+                      'live_workers': int(metrics.workers.get_values().get((), 0)),
+                      'spool_records': spool_records,
+                      'average_sweep_seconds': average_sweep_seconds,
+                      'last_sweep_datetime_utc_dict': changed_last_sweep_dict}
 
-def process(logger, ):
-    schedule.every(config.interval_in_seconds).seconds.do(job, logger,)
+        ################################################################################################################
+        # Step 1 and Step 3: Verify Gateway Token and Update Gateway Information
+        ################################################################################################################
+        try:
+            is_written = await writer_pool.write_heartbeat(statistics)
+        except Exception as e:
+            logger.error("Error in gateway process " + str(e))
+            is_written = False
 
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+        if is_written:
+            previous_sweep_totals = sweep_totals
+            previous_last_sweep_dict = last_sweep_dict
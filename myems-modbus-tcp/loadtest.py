@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import logging
+import time
+from decimal import Decimal
+
+import acquisition
+import engine
+import metrics
+import simulator
+from modbus_client import AsyncTcpMaster
+from writer import WriterPool
+
+########################################################################################################################
+# Load Test of Acquisition
+# Runs acquisition workers (acquisition.process) of synthetic data sources against the Modbus TCP slave simulator,
+# and reports points read per second, sweep time, timeouts and database insert rate collected from the metrics.
+# Point lists are generated instead of loaded from system database. Values are counted and dropped by default,
+# or written into historical database by the writer pool with --database, please use a test database for that.
+########################################################################################################################
+
+
+class LoadTestWriterPool:
+    """Writer pool of the load test, which serves generated point lists and counts written values"""
+    def __init__(self, point_rows_dict, writer_pool=None):
+        """
+        :param point_rows_dict: rows of points (id, name, object_type, is_trend, ratio, address) by data source id
+        :param writer_pool: the writer pool to write values into historical database, or None to drop values
+        """
+        self.point_rows_dict = point_rows_dict
+        self.writer_pool = writer_pool
+        self.row_count = 0
+
+    async def load_points(self, data_source_id):
+        return self.point_rows_dict.get(data_source_id)
+
+    async def write_values(self, data_source_id, energy_value_list, analog_value_list, digital_value_list,
+                           current_datetime_utc):
+        row_count = sum(1 for point_value in energy_value_list + analog_value_list + digital_value_list
+                        if point_value['is_trend'])
+        if self.writer_pool is not None:
+            await self.writer_pool.write_values(data_source_id, energy_value_list, analog_value_list,
+                                                digital_value_list, current_datetime_utc)
+        self.row_count += row_count
+
+
+def generate_point_rows(data_source_id, number_of_points, number_of_slaves):
+    """
+    Generate points of 32 bits floats in register pairs, spread over the slaves
+
+    :return: list of rows of points (id, name, object_type, is_trend, ratio, address)
+    """
+    point_rows = list()
+    for i in range(number_of_points):
+        point_id = data_source_id * 1000000 + i
+        slave_id = i % number_of_slaves + 1
+        offset = (i // number_of_slaves) * 2
+        address = ('{"slave_id":%d, "function_code":3, "offset":%d, "number_of_registers":2, '
+                   '"format":">f", "byte_swap":false}' % (slave_id, offset))
+        point_rows.append((point_id, 'point' + str(point_id), 'ANALOG_VALUE', True, Decimal('1.000'), address))
+    return point_rows
+
+
+def sum_values(metric):
+    return sum(metric.get_values().values())
+
+
+def report(start_time, writer_pool):
+    elapsed_time = time.monotonic() - start_time
+    sweep_totals = metrics.sweep_duration_seconds.get_totals()
+    request_totals = metrics.request_duration_seconds.get_totals()
+    write_totals = metrics.db_write_duration_seconds.get_totals()
+    print("%.0fs: %.0f points/s, %d sweeps, %.3fs per sweep, %d requests, %.1fms per request, "
+          "%d timeouts, %d errors, %d missed deadlines, %.0f rows/s inserted, %.3fs per write" %
+          (elapsed_time,
+           sum_values(metrics.points_read_total) / elapsed_time,
+           sweep_totals[1],
+           sweep_totals[0] / sweep_totals[1] if sweep_totals[1] > 0 else 0.0,
+           request_totals[1],
+           request_totals[0] / request_totals[1] * 1000 if request_totals[1] > 0 else 0.0,
+           sum_values(metrics.request_timeouts_total),
+           sum_values(metrics.request_errors_total),
+           sum_values(metrics.missed_deadlines_total),
+           writer_pool.row_count / elapsed_time,
+           write_totals[0] / write_totals[1] if write_totals[1] > 0 else 0.0))
+
+
+async def run(arguments):
+    logger = logging.getLogger('myems-modbus-tcp-loadtest')
+    logger.setLevel(logging.ERROR)
+    logger.addHandler(logging.StreamHandler())
+
+    simulator_server = None
+    if arguments.start_simulator:
+        simulator_server = await simulator.create_simulator(arguments).start_server(arguments.host, arguments.port)
+
+    database_writer_pool = None
+    if arguments.database:
+        database_writer_pool = WriterPool(logger)
+
+    point_rows_dict = dict()
+    for data_source_id in range(1, arguments.data_sources + 1):
+        point_rows_dict[data_source_id] = generate_point_rows(data_source_id, arguments.points, arguments.slaves)
+    writer_pool = LoadTestWriterPool(point_rows_dict, database_writer_pool)
+
+    print("Load test of %d data sources of %d points on %s:%d, polling interval %d seconds, duration %d seconds " %
+          (arguments.data_sources, arguments.points, arguments.host, arguments.port,
+           arguments.interval, arguments.duration))
+    worker_list = list()
+    for data_source_id in point_rows_dict.keys():
+        master = AsyncTcpMaster(host=arguments.host, port=arguments.port, timeout_in_sec=arguments.timeout,
+                                slave_timeout_in_sec=arguments.slave_timeout)
+        task = asyncio.create_task(acquisition.process(logger, data_source_id,
+                                                       arguments.host, arguments.port,
+                                                       arguments.interval,
+                                                       master,
+                                                       writer_pool,
+                                                       asyncio.Event()))
+        worker_list.append({'master': master, 'task': task})
+
+    start_time = time.monotonic()
+    try:
+        while time.monotonic() - start_time < arguments.duration:
+            await asyncio.sleep(min(arguments.report_interval, arguments.duration - (time.monotonic() - start_time)))
+            report(start_time, writer_pool)
+    finally:
+        for worker in worker_list:
+            await engine.stop_worker(worker)
+        if database_writer_pool is not None:
+            database_writer_pool.shutdown()
+        if simulator_server is not None:
+            simulator_server.close()
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Load test of acquisition against the Modbus TCP simulator')
+    simulator.parse_arguments(argument_parser)
+    argument_parser.add_argument('--start-simulator', action='store_true',
+                                 help='run the simulator in this process instead of connecting to a running one')
+    argument_parser.add_argument('--data-sources', type=int, default=4, help='number of data sources')
+    argument_parser.add_argument('--points', type=int, default=1000, help='number of points of each data source')
+    argument_parser.add_argument('--interval', type=int, default=10, help='polling interval in seconds')
+    argument_parser.add_argument('--timeout', type=float, default=5.0,
+                                 help='timeout of connecting and sending Modbus requests in seconds')
+    argument_parser.add_argument('--slave-timeout', type=float, default=1.0,
+                                 help='timeout of waiting for responses of slaves in seconds')
+    argument_parser.add_argument('--duration', type=int, default=60, help='duration of the load test in seconds')
+    argument_parser.add_argument('--report-interval', type=int, default=10, help='interval of reports in seconds')
+    argument_parser.add_argument('--database', action='store_true',
+                                 help='write values into historical database by the writer pool')
+    asyncio.run(run(argument_parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,8 @@
-import json
+import asyncio
 import logging
-import time
 from logging.handlers import RotatingFileHandler
-from multiprocessing import Process
 
-import mysql.connector
-
-import acquisition
-import config
-import gateway
+import engine
 
 
 def main():
@@ -31,86 +25,10 @@ def main():
     logger.addHandler(logging.StreamHandler())
 
     ####################################################################################################################
-    # Create Gateway Process
+    # Run acquisition workers of all data sources and the gateway heartbeat in one event loop,
+    # data sources and points are reloaded periodically by the engine
     ####################################################################################################################
-    Process(target=gateway.process, args=(logger,)).start()
-
-    # Get Data Sources
-    data_source_list = list()
-    while True:
-        # TODO: This service has to RESTART to reload latest data sources and this should be fixed
-        cnx_system_db = None
-        cursor_system_db = None
-        try:
-            cnx_system_db = mysql.connector.connect(**config.myems_system_db)
-            cursor_system_db = cnx_system_db.cursor()
-        except Exception as e:
-            logger.error("Error in main process " + str(e))
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
-            # sleep several minutes and continue the outer loop to reload points
-            time.sleep(60)
-            continue
-
-        # Get data sources by gateway and protocol
-        rows_data_source = None
-        try:
-            query = (" SELECT ds.id, ds.name, ds.connection "
-                     " FROM tbl_data_sources ds, tbl_gateways g "
-                     " WHERE ds.protocol = 'modbus-tcp' AND ds.gateway_id = g.id AND g.id = %s AND g.token = %s "
-                     " ORDER BY ds.id ")
-            cursor_system_db.execute(query, (config.gateway['id'], config.gateway['token'],))
-            rows_data_source = cursor_system_db.fetchall()
-        except Exception as e:
-            logger.error("Error in main process " + str(e))
-            # sleep several minutes and continue the outer loop to reload points
-            time.sleep(60)
-            continue
-        finally:
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
-
-        if rows_data_source is None or len(rows_data_source) == 0:
-            logger.error("Data Source Not Found, Wait for minutes to retry.")
-            # wait for a while and retry
-            time.sleep(60)
-            continue
-        else:
-            # Stop to connect these data sources
-            data_source_list = rows_data_source
-            break
-
-    for data_source in data_source_list:
-        print("Data Source: ID=%s, Name=%s, Connection=%s " %
-              (data_source[0], data_source[1], data_source[2]))
-
-        if data_source[2] is None or len(data_source[2]) == 0:
-            logger.error("Data Source Connection Not Found.")
-            continue
-
-        try:
-            server = json.loads(data_source[2])
-        except Exception as e:
-            logger.error("Data Source Connection JSON error " + str(e))
-            continue
-
-        if 'host' not in server.keys() \
-                or 'port' not in server.keys() \
-                or server['host'] is None \
-                or server['port'] is None \
-                or len(server['host']) == 0 \
-                or not isinstance(server['port'], int) \
-                or server['port'] < 1:
-            logger.error("Data Source Connection Invalid.")
-            continue
-
-        # fork worker process for each data source
-        # todo: how to restart the process if the process terminated unexpectedly
-        Process(target=acquisition.process, args=(logger, data_source[0], server['host'], server['port'])).start()
+    asyncio.run(engine.run(logger))
 
 
 if __name__ == "__main__":
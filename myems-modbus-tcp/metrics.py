@@ -0,0 +1,213 @@
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+########################################################################################################################
+# Acquisition Metrics
+# Counters, gauges and histograms recorded by the acquisition workers and the writer pool, labeled by data source,
+# and exposed in Prometheus text format on a local HTTP endpoint, so that gateways can be sized and slow PLCs can be
+# spotted before they fall behind their polling intervals.
+# The metrics are updated in the event loop and in the writer threads, and rendered in the HTTP server thread.
+########################################################################################################################
+
+# upper bounds in seconds of histogram buckets, from fast Modbus requests to slow sweeps of large data sources
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+lock = threading.Lock()
+# all metrics in order of exposition
+metric_list = list()
+
+
+def format_float(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def format_labels(label_names, label_values, extra_label=None):
+    label_list = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                  for name, value in zip(label_names, label_values)]
+    if extra_label is not None:
+        label_list.append(extra_label)
+    if len(label_list) == 0:
+        return ''
+    return '{' + ','.join(label_list) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        # value by tuple of label values
+        self.value_dict = dict()
+        metric_list.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with lock:
+            self.value_dict[label_values] = self.value_dict.get(label_values, 0) + amount
+
+    def remove(self, *label_values):
+        with lock:
+            self.value_dict.pop(label_values, None)
+
+    def get_values(self):
+        """
+        :return: dict of values by tuple of label values
+        """
+        with lock:
+            return dict(self.value_dict)
+
+    def render(self):
+        line_list = ['# HELP %s %s' % (self.name, self.documentation),
+                     '# TYPE %s %s' % (self.name, 'counter')]
+        for label_values, value in self.value_dict.items():
+            line_list.append(self.name + format_labels(self.label_names, label_values) + ' ' + format_float(value))
+        return line_list
+
+
+class Gauge(Counter):
+    def set(self, value, *label_values):
+        with lock:
+            self.value_dict[label_values] = value
+
+    def render(self):
+        line_list = super().render()
+        line_list[1] = '# TYPE %s %s' % (self.name, 'gauge')
+        return line_list
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # [list of bucket counts, sum, count] by tuple of label values
+        self.value_dict = dict()
+        metric_list.append(self)
+
+    def observe(self, value, *label_values):
+        with lock:
+            values = self.value_dict.get(label_values)
+            if values is None:
+                values = [[0] * len(self.buckets), 0.0, 0]
+                self.value_dict[label_values] = values
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    values[0][i] += 1
+            values[1] += value
+            values[2] += 1
+
+    def remove(self, *label_values):
+        with lock:
+            self.value_dict.pop(label_values, None)
+
+    def get_totals(self):
+        """
+        :return: (sum, count) of observations of all label values
+        """
+        with lock:
+            return (sum(values[1] for values in self.value_dict.values()),
+                    sum(values[2] for values in self.value_dict.values()))
+
+    def render(self):
+        line_list = ['# HELP %s %s' % (self.name, self.documentation),
+                     '# TYPE %s %s' % (self.name, 'histogram')]
+        for label_values, (bucket_counts, total, count) in self.value_dict.items():
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                line_list.append(self.name + '_bucket' +
+                                 format_labels(self.label_names, label_values,
+                                               'le="' + format_float(upper_bound) + '"') +
+                                 ' ' + str(bucket_count))
+            line_list.append(self.name + '_bucket' +
+                             format_labels(self.label_names, label_values, 'le="+Inf"') + ' ' + str(count))
+            line_list.append(self.name + '_sum' + format_labels(self.label_names, label_values) +
+                             ' ' + format_float(total))
+            line_list.append(self.name + '_count' + format_labels(self.label_names, label_values) +
+                             ' ' + str(count))
+        return line_list
+
+
+########################################################################################################################
+# Metrics of acquisition
+########################################################################################################################
+workers = Gauge('myems_modbus_tcp_workers',
+                'Number of running acquisition workers')
+sweep_duration_seconds = Histogram('myems_modbus_tcp_sweep_duration_seconds',
+                                   'Duration of reading and decoding the due blocks of a sweep',
+                                   ('data_source_id',))
+last_sweep_timestamp_seconds = Gauge('myems_modbus_tcp_last_sweep_timestamp_seconds',
+                                     'Unix time of the last sweep whose values are written successfully',
+                                     ('data_source_id',))
+request_duration_seconds = Histogram('myems_modbus_tcp_request_duration_seconds',
+                                     'Round trip time of Modbus requests',
+                                     ('data_source_id',))
+request_timeouts_total = Counter('myems_modbus_tcp_request_timeouts_total',
+                                 'Number of timed out Modbus requests',
+                                 ('data_source_id',))
+request_errors_total = Counter('myems_modbus_tcp_request_errors_total',
+                               'Number of failed Modbus requests except timeouts',
+                               ('data_source_id',))
+points_read_total = Counter('myems_modbus_tcp_points_read_total',
+                            'Number of point values read, rate() of it is the points read per second',
+                            ('data_source_id',))
+missed_deadlines_total = Counter('myems_modbus_tcp_missed_deadlines_total',
+                                 'Number of polling deadlines missed by slow sweeps',
+                                 ('data_source_id',))
+db_write_duration_seconds = Histogram('myems_modbus_tcp_db_write_duration_seconds',
+                                      'Duration of writing the values of a sweep into historical database, '
+                                      'including waiting for a writer thread',
+                                      ('data_source_id',))
+spool_records = Gauge('myems_modbus_tcp_spool_records',
+                      'Number of records in the local spool waiting to be replayed')
+
+
+def remove_data_source(data_source_id):
+    """
+    Remove the metrics of a removed data source
+    """
+    for metric in metric_list:
+        if metric.label_names == ('data_source_id',):
+            metric.remove(data_source_id)
+
+
+def render():
+    with lock:
+        line_list = list()
+        for metric in metric_list:
+            line_list.extend(metric.render())
+    return '\n'.join(line_list) + '\n'
+
+
+########################################################################################################################
+# Metrics HTTP Endpoint
+########################################################################################################################
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # do not print a line for each scrape
+        pass
+
+
+def start_http_server(host, port):
+    """
+    Serve the metrics in a daemon thread
+
+    :return: the HTTP server, call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    return server
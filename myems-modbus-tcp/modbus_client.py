@@ -0,0 +1,207 @@
+import asyncio
+import struct
+import time
+
+import config
+
+########################################################################################################################
+# Asyncio Modbus TCP Master
+# One persistent TCP connection per data source, requests are framed with MBAP header and responses are dispatched to
+# the waiting requests by transaction identifier, so that one event loop can poll many Modbus TCP servers concurrently.
+# The number of in-flight requests per host and port is capped by a semaphore shared by all masters connected to it,
+# and a request holds its slot for at most the timeout of slaves, so that a silent slave delays the other requests
+# to the host and port only for this timeout.
+# The results are compatible with modbus_tk: values are unpacked with data_format, coils are converted to bits.
+# The connection is kept alive across sweeps. Failures of connecting to the host back off exponentially,
+# and timeouts are tracked per slave, so that only the failing slave backs off exponentially while the other slaves
+# behind the same gateway keep being polled.
+########################################################################################################################
+
+# semaphores to cap the number of in-flight requests by (host, port), shared by all masters in the event loop
+host_semaphore_dict = dict()
+
+
+class ModbusError(Exception):
+    """Exception response from the Modbus slave"""
+    def __init__(self, exception_code):
+        super().__init__("Modbus Error: Exception code = " + str(exception_code))
+        self.exception_code = exception_code
+
+
+def backoff_in_seconds(failure_count):
+    return min(config.backoff_max_in_seconds, config.backoff_initial_in_seconds * 2 ** (failure_count - 1))
+
+
+def get_host_semaphore(host, port):
+    if (host, port) not in host_semaphore_dict:
+        host_semaphore_dict[(host, port)] = asyncio.Semaphore(config.max_requests_in_flight_per_host)
+    return host_semaphore_dict[(host, port)]
+
+
+class AsyncTcpMaster:
+    def __init__(self, host, port, timeout_in_sec=5.0, slave_timeout_in_sec=1.0):
+        """
+        :param timeout_in_sec: timeout of connecting to the host
+        :param slave_timeout_in_sec: timeout of waiting for the response of a slave
+        """
+        self.host = host
+        self.port = port
+        self.timeout_in_sec = timeout_in_sec
+        self.slave_timeout_in_sec = min(slave_timeout_in_sec, timeout_in_sec)
+        self._reader = None
+        self._writer = None
+        self._receive_task = None
+        self._transaction_id = 0
+        self._pending_dict = dict()
+        self._connect_lock = asyncio.Lock()
+        # number of consecutive failures and monotonic time to retry connecting to the host
+        self._connect_failure_count = 0
+        self._connect_retry_time = 0.0
+        # (number of consecutive timeouts, monotonic time to retry) by slave
+        self._slave_backoff_dict = dict()
+
+    def is_connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self.is_connected():
+                return
+            if time.monotonic() < self._connect_retry_time:
+                raise ConnectionError("connecting to " + self.host + ":" + str(self.port) + " is backing off")
+            try:
+                self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                                    self.timeout_in_sec)
+            except (asyncio.TimeoutError, OSError) as e:
+                self._connect_failure_count += 1
+                self._connect_retry_time = time.monotonic() + backoff_in_seconds(self._connect_failure_count)
+                raise ConnectionError("failed to connect " + self.host + ":" + str(self.port) + " " + str(e))
+            self._connect_failure_count = 0
+            self._connect_retry_time = 0.0
+            self._receive_task = asyncio.get_running_loop().create_task(self._receive())
+
+    def seconds_to_reconnect(self):
+        return max(0.0, self._connect_retry_time - time.monotonic())
+
+    def is_slave_available(self, slave):
+        """
+        :return: False if the slave is backing off after timeouts
+        """
+        slave_backoff = self._slave_backoff_dict.get(slave)
+        return slave_backoff is None or time.monotonic() >= slave_backoff[1]
+
+    def report_timeout(self, slave):
+        timeout_count = self._slave_backoff_dict.get(slave, (0, 0.0))[0] + 1
+        self._slave_backoff_dict[slave] = (timeout_count, time.monotonic() + backoff_in_seconds(timeout_count))
+
+    def report_success(self, slave):
+        self._slave_backoff_dict.pop(slave, None)
+
+    async def close(self):
+        if self._receive_task is not None:
+            self._receive_task.cancel()
+            self._receive_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = None
+        self._writer = None
+        self._fail_pending(ConnectionError("connection closed"))
+
+    def _fail_pending(self, exception):
+        for future in self._pending_dict.values():
+            if not future.done():
+                future.set_exception(exception)
+        self._pending_dict.clear()
+
+    async def _receive(self):
+        # dispatch responses to the waiting requests until the connection is lost
+        try:
+            while True:
+                header = await self._reader.readexactly(7)
+                transaction_id, protocol_id, length, unit_id = struct.unpack('>HHHB', header)
+                # the length counts the unit identifier and a PDU of at most 253 bytes,
+                # a malformed frame means the stream is out of sync, so the connection is treated as lost
+                if length < 2 or length > 254:
+                    raise ConnectionError("malformed frame with length " + str(length))
+                pdu = await self._reader.readexactly(length - 1)
+                future = self._pending_dict.pop(transaction_id, None)
+                if future is not None and not future.done():
+                    future.set_result(pdu)
+                # else the response of a timed out request, ignore it
+        except Exception as e:
+            # any error ends the receive task, so the connection is closed and reconnected by the next request
+            if self._writer is not None:
+                self._writer.close()
+            self._writer = None
+            self._reader = None
+            self._fail_pending(ConnectionError("connection lost " + str(e)))
+
+    async def execute(self, slave, function_code, starting_address, quantity_of_x, data_format=''):
+        """
+        Read coils, discrete inputs, holding registers or input registers
+
+        :return: tuple of values unpacked with data_format,
+                 or tuple of bits for coils and discrete inputs without data_format,
+                 or tuple of unsigned 16 bits registers for registers without data_format
+        """
+        number_of_digits = 0
+        if function_code in (1, 2):
+            byte_count = quantity_of_x // 8 + (1 if quantity_of_x % 8 > 0 else 0)
+            number_of_digits = quantity_of_x
+            if not data_format:
+                data_format = '>' + (byte_count * 'B')
+        elif function_code in (3, 4):
+            if not data_format:
+                data_format = '>' + (quantity_of_x * 'H')
+        else:
+            raise ValueError("function code " + str(function_code) + " is not supported")
+
+        request_pdu = struct.pack('>BHH', function_code, starting_address, quantity_of_x)
+
+        async with get_host_semaphore(self.host, self.port):
+            if not self.is_connected():
+                await self.connect()
+
+            self._transaction_id = (self._transaction_id + 1) % 0x10000
+            transaction_id = self._transaction_id
+            future = asyncio.get_running_loop().create_future()
+            self._pending_dict[transaction_id] = future
+            self._writer.write(struct.pack('>HHHB', transaction_id, 0, len(request_pdu) + 1, slave) + request_pdu)
+            try:
+                await self._writer.drain()
+                # the slot of the host and port is released on the timeout of the slave,
+                # and the late response of the slave is ignored
+                response_pdu = await asyncio.wait_for(future, self.slave_timeout_in_sec)
+            except asyncio.TimeoutError:
+                self.report_timeout(slave)
+                raise TimeoutError("timed out")
+            finally:
+                self._pending_dict.pop(transaction_id, None)
+
+        # the slave responds, even with an exception response
+        self.report_success(slave)
+
+        if response_pdu[0] & 0x80:
+            raise ModbusError(response_pdu[1])
+
+        byte_count = response_pdu[1]
+        data = response_pdu[2:]
+        if byte_count != len(data):
+            raise ValueError("Byte count is " + str(byte_count) +
+                             " while actual number of bytes is " + str(len(data)))
+
+        result = struct.unpack(data_format, data)
+        if number_of_digits > 0:
+            digits = list()
+            for byte_value in result:
+                for i in range(8):
+                    if len(digits) >= number_of_digits:
+                        break
+                    digits.append(byte_value % 2)
+                    byte_value = byte_value >> 1
+            result = tuple(digits)
+        return result
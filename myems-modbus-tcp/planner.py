@@ -0,0 +1,273 @@
+import json
+import struct
+from decimal import Decimal
+
+import config
+from byte_swap import byte_swap_32_bit, byte_swap_64_bit
+
+########################################################################################################################
+# Modbus Read Planner
+# The point list of a data source is compiled once into point descriptors, each point address is parsed, validated
+# and its struct format is precompiled. The compiled plan is cached by the acquisition worker and compiled again only
+# when the point configuration is changed, so that the sweep loop only does I/O and decoding.
+# Points of the same slave and the same function code are sorted by offset, and adjacent or nearly adjacent register
+# ranges are merged into one block read of at most config.max_registers_per_read registers,
+# only points with the same polling interval are merged.
+# The registers returned by a block read are decoded into all point values in one pass: the registers are packed into
+# one buffer with a precompiled struct, and each point is unpacked from its byte offset in the buffer.
+# Byte swap of adjacent bytes equals to byte swap of each register, so byte swapped points are unpacked from a second
+# buffer of the registers packed in little-endian instead of being swapped value by value.
+########################################################################################################################
+
+# function codes which read 16 bits registers, only these reads can be coalesced into block reads.
+# coils and discrete inputs (function code 1 and 2) are always read point by point
+REGISTER_FUNCTION_CODES = (3, 4)
+
+# signed integer format characters, byte swapped values of them are unsigned as returned by byte_swap_32_bit and
+# byte_swap_64_bit, so that they are unpacked with the unsigned format characters from the byte swapped buffer
+SIGNED_INTEGER_FORMATS = 'bhilq'
+
+
+class PointDescriptor:
+    """Compiled read descriptor of a point"""
+    __slots__ = ('point_id', 'object_type', 'is_trend', 'ratio',
+                 'slave_id', 'function_code', 'offset', 'number_of_registers', 'format', 'byte_swap',
+                 'interval_in_seconds', 'deadband_absolute', 'deadband_percent', 'max_silence_in_seconds',
+                 'value_struct', 'register_struct', 'swapped_value_struct', 'swap_function')
+
+    def __init__(self, point, address):
+        self.point_id = point['id']
+        self.object_type = point['object_type']
+        self.is_trend = point['is_trend']
+        self.ratio = point['ratio'] if point['object_type'] != 'DIGITAL_VALUE' else int(point['ratio'])
+        self.slave_id = address['slave_id']
+        self.function_code = address['function_code']
+        self.offset = address['offset']
+        self.number_of_registers = address['number_of_registers']
+        self.format = address['format']
+        self.byte_swap = address['byte_swap']
+        # optional polling interval of the point, the polling interval of data source is used if it is None
+        self.interval_in_seconds = address.get('interval_in_seconds')
+        # optional deadband of trend values of analog and energy points,
+        # values inside the deadband are not trended until max_silence_in_seconds passed
+        self.deadband_absolute = None
+        self.deadband_percent = None
+        self.max_silence_in_seconds = None
+        if point['object_type'] in ('ANALOG_VALUE', 'ENERGY_VALUE'):
+            if address.get('deadband_absolute') is not None:
+                self.deadband_absolute = Decimal(str(address['deadband_absolute']))
+            if address.get('deadband_percent') is not None:
+                self.deadband_percent = Decimal(str(address['deadband_percent']))
+            if self.deadband_absolute is not None or self.deadband_percent is not None:
+                self.max_silence_in_seconds = address.get('max_silence_in_seconds',
+                                                          config.deadband_max_silence_in_seconds)
+        self.value_struct = struct.Struct(address['format'])
+        self.register_struct = struct.Struct('>' + str(address['number_of_registers']) + 'H')
+        # byte swap is effective when number_of_registers is ether 2(32bits) or 4(64bits)
+        self.swap_function = None
+        if address['byte_swap']:
+            if address['number_of_registers'] == 2:
+                self.swap_function = byte_swap_32_bit
+            elif address['number_of_registers'] == 4:
+                self.swap_function = byte_swap_64_bit
+        # byte swap of registers with single value format is done by unpacking from the byte swapped buffer,
+        # otherwise the swap function is applied to the first value after unpacking
+        self.swapped_value_struct = None
+        if self.swap_function is not None \
+                and address['function_code'] in REGISTER_FUNCTION_CODES \
+                and len(self.value_struct.unpack(bytes(self.value_struct.size))) == 1:
+            swapped_format = ''.join(c.upper() if c in SIGNED_INTEGER_FORMATS else c for c in address['format'])
+            self.swapped_value_struct = struct.Struct(swapped_format)
+            self.swap_function = None
+
+
+class ReadBlock:
+    """One request in read plan, which covers one or more points"""
+    __slots__ = ('slave_id', 'function_code', 'offset', 'number_of_registers', 'interval_in_seconds',
+                 'descriptor_list', 'is_block_read', 'register_struct', 'swapped_register_struct')
+
+    def __init__(self, descriptor):
+        self.slave_id = descriptor.slave_id
+        self.function_code = descriptor.function_code
+        self.offset = descriptor.offset
+        self.number_of_registers = descriptor.number_of_registers
+        self.interval_in_seconds = descriptor.interval_in_seconds
+        self.descriptor_list = [descriptor]
+        # only blocks of registers which cover more than one point are read in one request,
+        # single points are read with their own format
+        self.is_block_read = False
+        # structs to pack the registers of block read into buffers, compiled when the block is planned
+        self.register_struct = None
+        self.swapped_register_struct = None
+
+    def end(self):
+        return self.offset + self.number_of_registers
+
+    def append(self, descriptor):
+        self.number_of_registers = max(self.end(), descriptor.offset + descriptor.number_of_registers) - self.offset
+        self.descriptor_list.append(descriptor)
+        self.is_block_read = True
+
+    def compile(self):
+        if self.function_code not in REGISTER_FUNCTION_CODES:
+            return
+        self.register_struct = struct.Struct('>' + str(self.number_of_registers) + 'H')
+        if any(descriptor.swapped_value_struct is not None for descriptor in self.descriptor_list):
+            self.swapped_register_struct = struct.Struct('<' + str(self.number_of_registers) + 'H')
+
+
+def compile_point(logger, data_source_id, point):
+    """
+    Parse and validate the point address
+
+    :return: the point descriptor, or None if the point address is invalid
+    """
+    try:
+        address = json.loads(point['address'])
+    except Exception as e:
+        logger.error("Error in step 3.2 of acquisition process: Invalid point address in JSON " + str(e))
+        return None
+
+    if 'slave_id' not in address.keys() \
+            or 'function_code' not in address.keys() \
+            or 'offset' not in address.keys() \
+            or 'number_of_registers' not in address.keys() \
+            or 'format' not in address.keys() \
+            or 'byte_swap' not in address.keys() \
+            or address['slave_id'] < 1 \
+            or address['function_code'] not in (1, 2, 3, 4) \
+            or address['offset'] < 0 \
+            or address['number_of_registers'] < 0 \
+            or len(address['format']) < 1 \
+            or not isinstance(address['byte_swap'], bool) \
+            or ('interval_in_seconds' in address.keys() and
+                (not isinstance(address['interval_in_seconds'], int) or address['interval_in_seconds'] < 1)) \
+            or any(key in address.keys() and
+                   (not isinstance(address[key], (int, float)) or address[key] < 0)
+                   for key in ('deadband_absolute', 'deadband_percent', 'max_silence_in_seconds')):
+        logger.error('Data Source(ID=%s), Point(ID=%s) Invalid address data.',
+                     data_source_id, point['id'])
+        return None
+
+    try:
+        descriptor = PointDescriptor(point, address)
+    except Exception as e:
+        logger.error('Data Source(ID=%s), Point(ID=%s) Invalid address format. ' + str(e),
+                     data_source_id, point['id'])
+        return None
+
+    if descriptor.function_code in REGISTER_FUNCTION_CODES and \
+            descriptor.value_struct.size != descriptor.register_struct.size:
+        logger.error('Data Source(ID=%s), Point(ID=%s) Invalid address data, '
+                     'format requires %s bytes while number_of_registers is %s.',
+                     data_source_id, point['id'], descriptor.value_struct.size, descriptor.number_of_registers)
+        return None
+
+    return descriptor
+
+
+def plan_reads(descriptor_list,
+               max_registers_per_read=config.max_registers_per_read,
+               max_register_gap=config.max_register_gap):
+    """
+    Build the read plan
+
+    :param descriptor_list: list of point descriptors
+    :param max_registers_per_read: the maximum quantity of registers in one request, 125 in Modbus specification
+    :param max_register_gap: the maximum number of unused registers between two points to be read in one request
+    :return: list of read blocks
+    """
+    block_list = list()
+
+    # group points by slave_id, function_code and polling interval
+    group_dict = dict()
+    for descriptor in descriptor_list:
+        if descriptor.function_code not in REGISTER_FUNCTION_CODES:
+            block_list.append(ReadBlock(descriptor))
+            continue
+        key = (descriptor.slave_id, descriptor.function_code, descriptor.interval_in_seconds)
+        if key not in group_dict:
+            group_dict[key] = list()
+        group_dict[key].append(descriptor)
+
+    # merge register ranges in each group
+    for group in group_dict.values():
+        group.sort(key=lambda x: (x.offset, x.number_of_registers))
+        block = None
+        for descriptor in group:
+            end = descriptor.offset + descriptor.number_of_registers
+            if block is not None \
+                    and descriptor.offset <= block.end() + max_register_gap \
+                    and max(end, block.end()) - block.offset <= max_registers_per_read:
+                block.append(descriptor)
+            else:
+                block = ReadBlock(descriptor)
+                block_list.append(block)
+
+    for block in block_list:
+        block.compile()
+
+    return block_list
+
+
+def compile_plan(logger, data_source_id, point_list):
+    """
+    Compile the point list into the read plan
+
+    :param logger: the logger
+    :param data_source_id: the data source id
+    :param point_list: list of point dicts with id, name, object_type, is_trend, ratio and address
+    :return: list of read blocks
+    """
+    descriptor_list = list()
+    for point in point_list:
+        descriptor = compile_point(logger, data_source_id, point)
+        if descriptor is not None:
+            descriptor_list.append(descriptor)
+    return plan_reads(descriptor_list)
+
+
+def decode_registers(registers, block_offset, descriptor):
+    """
+    Split the point's registers from the result of block read or single point read and unpack them with the point's
+    format. Registers are transferred in big-endian, so the raw bytes are rebuilt with '>H' before unpacking,
+    or with '<H' for byte swapped points.
+
+    :param registers: tuple of unsigned 16 bits registers returned by the read
+    :param block_offset: the starting address of the read
+    :param descriptor: the point descriptor
+    :return: tuple of values as returned by a single point read, byte swapped if swapped_value_struct is compiled
+    """
+    index = descriptor.offset - block_offset
+    if index < 0 or index + descriptor.number_of_registers > len(registers):
+        raise ValueError('registers of point out of block range')
+    point_registers = registers[index:index + descriptor.number_of_registers]
+    if descriptor.swapped_value_struct is not None:
+        return descriptor.swapped_value_struct.unpack(struct.pack('<' + str(len(point_registers)) + 'H',
+                                                                  *point_registers))
+    return descriptor.value_struct.unpack(descriptor.register_struct.pack(*point_registers))
+
+
+def decode_block(registers, block):
+    """
+    Decode the registers returned by a block read into results of all points of the block in one pass
+
+    :param registers: tuple of unsigned 16 bits registers returned by the block read
+    :param block: the read block
+    :return: list of (descriptor, result) tuples, result is the tuple of values as returned by decode_registers
+    """
+    if len(registers) != block.number_of_registers:
+        raise ValueError('number of registers is ' + str(len(registers)) +
+                         ' while number of registers of block is ' + str(block.number_of_registers))
+    data = block.register_struct.pack(*registers)
+    swapped_data = None
+    if block.swapped_register_struct is not None:
+        swapped_data = block.swapped_register_struct.pack(*registers)
+    result_list = list()
+    for descriptor in block.descriptor_list:
+        byte_offset = (descriptor.offset - block.offset) * 2
+        if descriptor.swapped_value_struct is not None:
+            result_list.append((descriptor, descriptor.swapped_value_struct.unpack_from(swapped_data, byte_offset)))
+        else:
+            result_list.append((descriptor, descriptor.value_struct.unpack_from(data, byte_offset)))
+    return result_list
@@ -0,0 +1,64 @@
+import random
+import time
+
+import config
+
+########################################################################################################################
+# Deadline Scheduler
+# Blocks of the read plan are placed into time slots by their polling intervals. Each time slot has its own deadline,
+# which advances by the interval from the previous deadline instead of from the end of the previous sweep,
+# so that polling does not drift. The first deadline of each time slot is delayed by a random jitter to spread the
+# load of data sources and time slots over time. Deadlines passed over by slow sweeps are reported as missed.
+########################################################################################################################
+
+
+class TimeSlot:
+    __slots__ = ('interval_in_seconds', 'block_list', 'deadline')
+
+    def __init__(self, interval_in_seconds, deadline):
+        self.interval_in_seconds = interval_in_seconds
+        self.block_list = list()
+        self.deadline = deadline
+
+
+class Scheduler:
+    def __init__(self, read_plan, default_interval_in_seconds):
+        """
+        :param read_plan: list of read blocks
+        :param default_interval_in_seconds: the polling interval of data source,
+                                            used by blocks without their own interval
+        """
+        now = time.monotonic()
+        slot_dict = dict()
+        for block in read_plan:
+            interval_in_seconds = block.interval_in_seconds or default_interval_in_seconds
+            if interval_in_seconds not in slot_dict:
+                jitter = random.uniform(0, min(interval_in_seconds, config.max_jitter_in_seconds))
+                slot_dict[interval_in_seconds] = TimeSlot(interval_in_seconds, now + jitter)
+            slot_dict[interval_in_seconds].block_list.append(block)
+        self.slot_list = list(slot_dict.values())
+        self.missed_deadline_count = 0
+
+    def seconds_to_next_deadline(self):
+        if len(self.slot_list) == 0:
+            return config.interval_in_seconds
+        return max(0.0, min(slot.deadline for slot in self.slot_list) - time.monotonic())
+
+    def pop_due_blocks(self):
+        """
+        Get blocks of the time slots which reach their deadlines and advance the deadlines
+
+        :return: (list of due blocks, number of missed deadlines)
+        """
+        now = time.monotonic()
+        due_block_list = list()
+        missed_deadline_count = 0
+        for slot in self.slot_list:
+            if slot.deadline > now:
+                continue
+            due_block_list.extend(slot.block_list)
+            missed = int((now - slot.deadline) // slot.interval_in_seconds)
+            missed_deadline_count += missed
+            slot.deadline += (missed + 1) * slot.interval_in_seconds
+        self.missed_deadline_count += missed_deadline_count
+        return due_block_list, missed_deadline_count
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import math
+import random
+import struct
+import time
+
+########################################################################################################################
+# Modbus TCP Slave Simulator
+# A local Modbus TCP server which serves register maps of many slaves without PLC hardware,
+# so that the acquisition service can be tested and benchmarked on one box.
+# Holding registers and input registers (function code 3 and 4) hold 32 bits big-endian floats in register pairs,
+# the float of pair k at time t is k + 100 * sin(2 * pi * t / period + k), so values change slowly over time.
+# Coils and discrete inputs (function code 1 and 2) toggle every second.
+# Each request is answered after the injected latency, and a part of requests is dropped to inject timeouts.
+# Requests are answered one by one per connection, as most Modbus TCP devices do.
+########################################################################################################################
+
+
+class Simulator:
+    def __init__(self, number_of_slaves, number_of_registers, latency_in_ms=0.0, jitter_in_ms=0.0,
+                 timeout_rate=0.0, period_in_seconds=600.0):
+        """
+        :param number_of_slaves: slaves from 1 to number_of_slaves are served, requests to other slaves are dropped
+        :param number_of_registers: the number of registers (and coils) of each slave
+        :param latency_in_ms: the mean latency injected before each response
+        :param jitter_in_ms: the maximum deviation of the latency
+        :param timeout_rate: the probability of dropping a request without response
+        :param period_in_seconds: the period of register values
+        """
+        self.number_of_slaves = number_of_slaves
+        self.number_of_registers = number_of_registers
+        self.latency_in_ms = latency_in_ms
+        self.jitter_in_ms = jitter_in_ms
+        self.timeout_rate = timeout_rate
+        self.period_in_seconds = period_in_seconds
+        self.request_count = 0
+        self.dropped_request_count = 0
+
+    def read_registers(self, slave, starting_address, quantity_of_x):
+        first_pair = starting_address // 2
+        last_pair = (starting_address + quantity_of_x - 1) // 2
+        phase = 2 * math.pi * time.time() / self.period_in_seconds
+        values = [k + 100 * math.sin(phase + k + slave) for k in range(first_pair, last_pair + 1)]
+        data = struct.pack('>' + str(len(values)) + 'f', *values)
+        start = (starting_address - first_pair * 2) * 2
+        return data[start:start + quantity_of_x * 2]
+
+    def read_bits(self, slave, starting_address, quantity_of_x):
+        second = int(time.time())
+        data = bytearray(quantity_of_x // 8 + (1 if quantity_of_x % 8 > 0 else 0))
+        for i in range(quantity_of_x):
+            if (starting_address + i + second + slave) % 2 == 1:
+                data[i // 8] |= 1 << (i % 8)
+        return bytes(data)
+
+    def respond(self, slave, request_pdu):
+        """
+        :return: the response PDU, or None if the request is dropped
+        """
+        if slave < 1 or slave > self.number_of_slaves or random.random() < self.timeout_rate:
+            return None
+
+        function_code = request_pdu[0]
+        if function_code not in (1, 2, 3, 4) or len(request_pdu) != 5:
+            # illegal function
+            return struct.pack('>BB', function_code | 0x80, 1)
+
+        starting_address, quantity_of_x = struct.unpack('>HH', request_pdu[1:5])
+        max_quantity = 2000 if function_code in (1, 2) else 125
+        if quantity_of_x < 1 or quantity_of_x > max_quantity:
+            # illegal data value
+            return struct.pack('>BB', function_code | 0x80, 3)
+        if starting_address + quantity_of_x > self.number_of_registers:
+            # illegal data address
+            return struct.pack('>BB', function_code | 0x80, 2)
+
+        if function_code in (1, 2):
+            data = self.read_bits(slave, starting_address, quantity_of_x)
+        else:
+            data = self.read_registers(slave, starting_address, quantity_of_x)
+        return struct.pack('>BB', function_code, len(data)) + data
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction_id, protocol_id, length, slave = struct.unpack('>HHHB', header)
+                request_pdu = await reader.readexactly(length - 1)
+                self.request_count += 1
+
+                latency_in_ms = self.latency_in_ms + random.uniform(-self.jitter_in_ms, self.jitter_in_ms)
+                if latency_in_ms > 0:
+                    await asyncio.sleep(latency_in_ms / 1000)
+
+                response_pdu = self.respond(slave, request_pdu)
+                if response_pdu is None:
+                    self.dropped_request_count += 1
+                    continue
+                writer.write(struct.pack('>HHHB', transaction_id, 0, len(response_pdu) + 1, slave) + response_pdu)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # the event loop is shutting down, end the connection quietly
+            pass
+        finally:
+            writer.close()
+
+    async def start_server(self, host, port):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def parse_arguments(argument_parser=None):
+    argument_parser = argument_parser or argparse.ArgumentParser(description='Modbus TCP slave simulator')
+    argument_parser.add_argument('--host', default='127.0.0.1')
+    argument_parser.add_argument('--port', type=int, default=5020)
+    argument_parser.add_argument('--slaves', type=int, default=4, help='number of slaves')
+    argument_parser.add_argument('--registers', type=int, default=2000, help='number of registers of each slave')
+    argument_parser.add_argument('--latency', type=float, default=5.0, help='mean latency of responses in ms')
+    argument_parser.add_argument('--jitter', type=float, default=2.0, help='maximum jitter of latency in ms')
+    argument_parser.add_argument('--timeout-rate', type=float, default=0.0,
+                                 help='probability of dropping a request without response')
+    argument_parser.add_argument('--period', type=float, default=600.0, help='period of register values in seconds')
+    return argument_parser
+
+
+def create_simulator(arguments):
+    return Simulator(number_of_slaves=arguments.slaves,
+                     number_of_registers=arguments.registers,
+                     latency_in_ms=arguments.latency,
+                     jitter_in_ms=arguments.jitter,
+                     timeout_rate=arguments.timeout_rate,
+                     period_in_seconds=arguments.period)
+
+
+async def serve(arguments):
+    simulator = create_simulator(arguments)
+    server = await simulator.start_server(arguments.host, arguments.port)
+    print("Simulating %d slaves of %d registers on %s:%d " %
+          (arguments.slaves, arguments.registers, arguments.host, arguments.port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(parse_arguments().parse_args()))
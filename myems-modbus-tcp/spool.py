@@ -0,0 +1,64 @@
+import json
+import sqlite3
+import threading
+
+########################################################################################################################
+# Local Spool
+# An append-only on-disk buffer (SQLite) of trend values which failed to be inserted into the historical database.
+# Each record is one batch of rows of one table, records are replayed in bulk and in order by the spool flusher
+# once the historical database is back, and then removed from the spool.
+########################################################################################################################
+
+
+class Spool:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.cnx = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.cnx.execute("PRAGMA journal_mode=WAL")
+            self.cnx.execute(" CREATE TABLE IF NOT EXISTS tbl_spool ( "
+                             " id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                             " table_name TEXT NOT NULL, "
+                             " utc_date_time TEXT NOT NULL, "
+                             " point_values TEXT NOT NULL) ")
+            self.cnx.commit()
+
+    def append(self, table_name, utc_date_time, point_value_list):
+        """
+        :param table_name: the historical table, tbl_analog_value, tbl_energy_value or tbl_digital_value
+        :param utc_date_time: datetime of the values
+        :param point_value_list: list of (point_id, value) tuples
+        """
+        if len(point_value_list) == 0:
+            return
+        point_values = json.dumps([(point_id, str(value)) for point_id, value in point_value_list])
+        with self.lock:
+            self.cnx.execute(" INSERT INTO tbl_spool (table_name, utc_date_time, point_values) VALUES (?, ?, ?) ",
+                             (table_name, utc_date_time.isoformat(), point_values))
+            self.cnx.commit()
+
+    def read(self, limit):
+        """
+        :return: list of (id, table_name, utc_date_time, point_value_list) tuples in order of appending
+        """
+        with self.lock:
+            rows = self.cnx.execute(" SELECT id, table_name, utc_date_time, point_values "
+                                    " FROM tbl_spool "
+                                    " ORDER BY id "
+                                    " LIMIT ? ", (limit,)).fetchall()
+        return [(row[0], row[1], row[2], json.loads(row[3])) for row in rows]
+
+    def remove(self, id_list):
+        if len(id_list) == 0:
+            return
+        with self.lock:
+            self.cnx.executemany(" DELETE FROM tbl_spool WHERE id = ? ", [(record_id,) for record_id in id_list])
+            self.cnx.commit()
+
+    def count(self):
+        with self.lock:
+            return self.cnx.execute(" SELECT COUNT(*) FROM tbl_spool ").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.cnx.close()
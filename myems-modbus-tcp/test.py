@@ -1,10 +1,16 @@
 import sys
+import time
+import random
+import struct
+import logging
 import telnetlib3
 import asyncio
+from decimal import Decimal
 
 from modbus_tk import modbus_tcp
 
 import byte_swap
+import planner
 
 
 ########################################################################################################################
@@ -16,14 +22,97 @@ async def check_connectivity(host, port):
     writer.close()
 
 
+########################################################################################################################
+# Benchmark of decoding block reads
+# The scalar path unpacks registers point by point with the point's format, then swaps bytes and applies ratio,
+# the batch path decodes all points of the block in one pass with precompiled structs, then applies ratio.
+########################################################################################################################
+def benchmark(number_of_sweeps):
+    formats = [('>f', 2, False), ('<f', 2, True), ('>i', 2, False), ('<i', 2, True), ('>H', 1, False),
+               ('>d', 4, False), ('<d', 4, True), ('>q', 4, True)]
+    point_list = list()
+    offset = 0
+    for point_id in range(1, 1001):
+        data_format, number_of_registers, is_byte_swap = formats[point_id % len(formats)]
+        point_list.append({'id': point_id,
+                           'name': 'point' + str(point_id),
+                           'object_type': 'ANALOG_VALUE',
+                           'is_trend': True,
+                           'ratio': Decimal('1.000'),
+                           'address': '{"slave_id":1, "function_code":3, "offset":%d, "number_of_registers":%d, '
+                                      '"format":"%s", "byte_swap":%s}' %
+                                      (offset, number_of_registers, data_format, str(is_byte_swap).lower())})
+        offset += number_of_registers
+
+    read_plan = planner.compile_plan(logging.getLogger('benchmark'), 0, point_list)
+
+    # the registers of random real values packed with the formats of points, as slaves return them,
+    # random registers may be NaN of floats whose bits are not kept by the scalar path before swapping bytes
+    random_generator = random.Random(0)
+
+    def generate_registers(block):
+        registers = [0] * block.number_of_registers
+        for descriptor in block.descriptor_list:
+            if descriptor.format[-1] in 'fd':
+                value = random_generator.uniform(-1000000.0, 1000000.0)
+            elif descriptor.format[-1].islower():
+                number_of_bits = struct.calcsize(descriptor.format) * 8
+                value = random_generator.randint(-2 ** (number_of_bits - 1), 2 ** (number_of_bits - 1) - 1)
+            else:
+                value = random_generator.randint(0, 2 ** (struct.calcsize(descriptor.format) * 8) - 1)
+            index = descriptor.offset - block.offset
+            registers[index:index + descriptor.number_of_registers] = \
+                struct.unpack('>' + str(descriptor.number_of_registers) + 'H', struct.pack(descriptor.format, value))
+        return tuple(registers)
+
+    registers_list = [generate_registers(block) for block in read_plan]
+    print("points: %d, blocks: %d, sweeps: %d" % (len(point_list), len(read_plan), number_of_sweeps))
+
+    def decode_scalar(registers, block):
+        value_list = list()
+        for descriptor in block.descriptor_list:
+            index = descriptor.offset - block.offset
+            data = struct.pack('>' + str(descriptor.number_of_registers) + 'H',
+                               *registers[index:index + descriptor.number_of_registers])
+            value = struct.unpack(descriptor.format, data)[0]
+            if descriptor.byte_swap and descriptor.number_of_registers == 2:
+                value = byte_swap.byte_swap_32_bit(value)
+            elif descriptor.byte_swap and descriptor.number_of_registers == 4:
+                value = byte_swap.byte_swap_64_bit(value)
+            value_list.append(Decimal(value) * descriptor.ratio)
+        return value_list
+
+    def decode_batch(registers, block):
+        return [Decimal(result[0]) * descriptor.ratio for descriptor, result in planner.decode_block(registers, block)]
+
+    # the both paths must decode the same values, NaN is never equal to itself so compare the strings
+    for block, registers in zip(read_plan, registers_list):
+        if [str(v) for v in decode_scalar(registers, block)] != [str(v) for v in decode_batch(registers, block)]:
+            print("Mismatched values in block at offset %d" % block.offset)
+            return
+
+    for name, decode in (('scalar', decode_scalar), ('batch', decode_batch)):
+        start_time = time.perf_counter()
+        for _ in range(number_of_sweeps):
+            for block, registers in zip(read_plan, registers_list):
+                decode(registers, block)
+        elapsed_time = time.perf_counter() - start_time
+        print("%s: %.3f seconds, %.0f points per second" %
+              (name, elapsed_time, len(point_list) * number_of_sweeps / elapsed_time))
+
+
 ########################################################################################################################
 # main procedure
 ########################################################################################################################
 def main():
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100)
+        return
+    elif len(sys.argv) > 1:
         host = sys.argv[1]
     else:
         print('Usage: python3 test.py HOST_IP_ADDR ')
+        print('       python3 test.py benchmark [NUMBER_OF_SWEEPS]')
         return
 
     port = 502
@@ -0,0 +1,439 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+import config
+from spool import Spool
+
+########################################################################################################################
+# Writer Pool
+# A small pool of database threads shared by all acquisition workers in the event loop.
+# Each thread keeps one connection to the system database and one connection to the historical database,
+# so the number of database connections is bounded by the pool size instead of the number of data sources.
+# Trend values which can not be inserted while the historical database is unreachable are appended to the local spool.
+########################################################################################################################
+
+
+class WriterPool:
+    def __init__(self, logger, size=config.writer_pool_size):
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='writer')
+        self.local = threading.local()
+        self.spool = Spool(config.spool_path)
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def load_data_sources(self):
+        return await self.run(self._load_data_sources)
+
+    async def load_point_checksums(self):
+        return await self.run(self._load_point_checksums)
+
+    async def load_points(self, data_source_id):
+        return await self.run(self._load_points, data_source_id)
+
+    async def write_values(self, data_source_id, energy_value_list, analog_value_list, digital_value_list,
+                           current_datetime_utc):
+        return await self.run(self._write_values, data_source_id, energy_value_list, analog_value_list,
+                              digital_value_list, current_datetime_utc)
+
+    async def flush_spool(self):
+        return await self.run(self._flush_spool)
+
+    async def count_spool(self):
+        return await self.run(self.spool.count)
+
+    async def write_heartbeat(self, statistics):
+        return await self.run(self._write_heartbeat, statistics)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.spool.close()
+
+    ####################################################################################################################
+    # Connections of the current writer thread
+    ####################################################################################################################
+    def _get_system_db(self):
+        cnx_system_db = getattr(self.local, 'cnx_system_db', None)
+        if cnx_system_db is None or not cnx_system_db.is_connected():
+            if cnx_system_db is not None:
+                try:
+                    cnx_system_db.close()
+                except Exception:
+                    pass
+            self.local.cnx_system_db = None
+            # autocommit so that queries on the long-lived connection read the latest configuration
+            # instead of the snapshot of a repeatable read transaction
+            self.local.cnx_system_db = mysql.connector.connect(autocommit=True, **config.myems_system_db)
+        return self.local.cnx_system_db
+
+    def _get_historical_db(self):
+        cnx_historical_db = getattr(self.local, 'cnx_historical_db', None)
+        if cnx_historical_db is None or not cnx_historical_db.is_connected():
+            if cnx_historical_db is not None:
+                try:
+                    cnx_historical_db.close()
+                except Exception:
+                    pass
+            self.local.cnx_historical_db = None
+            self.local.cnx_historical_db = mysql.connector.connect(**config.myems_historical_db)
+        return self.local.cnx_historical_db
+
+    ####################################################################################################################
+    # Get data sources by gateway and protocol
+    ####################################################################################################################
+    def _load_data_sources(self):
+        cnx_system_db = self._get_system_db()
+        cursor_system_db = cnx_system_db.cursor()
+        try:
+            query = (" SELECT ds.id, ds.name, ds.connection "
+                     " FROM tbl_data_sources ds, tbl_gateways g "
+                     " WHERE ds.protocol = 'modbus-tcp' AND ds.gateway_id = g.id AND g.id = %s AND g.token = %s "
+                     " ORDER BY ds.id ")
+            cursor_system_db.execute(query, (config.gateway['id'], config.gateway['token'],))
+            return cursor_system_db.fetchall()
+        finally:
+            cursor_system_db.close()
+
+    ####################################################################################################################
+    # Get checksums of point configurations by data source,
+    # the checksums are calculated in database so that the point lists are loaded only when they are changed
+    ####################################################################################################################
+    def _load_point_checksums(self):
+        cnx_system_db = self._get_system_db()
+        cursor_system_db = cnx_system_db.cursor()
+        try:
+            query = (" SELECT p.data_source_id, COUNT(p.id), "
+                     "        BIT_XOR(CRC32(CONCAT_WS('|', p.id, p.name, p.object_type, p.is_trend, p.ratio, "
+                     "                                 p.address))) "
+                     " FROM tbl_points p, tbl_data_sources ds, tbl_gateways g "
+                     " WHERE p.data_source_id = ds.id AND p.is_virtual = 0 "
+                     "       AND ds.protocol = 'modbus-tcp' AND ds.gateway_id = g.id AND g.id = %s AND g.token = %s "
+                     " GROUP BY p.data_source_id ")
+            cursor_system_db.execute(query, (config.gateway['id'], config.gateway['token'],))
+            point_checksum_dict = dict()
+            for row in cursor_system_db.fetchall():
+                point_checksum_dict[row[0]] = (row[1], row[2])
+            return point_checksum_dict
+        finally:
+            cursor_system_db.close()
+
+    ####################################################################################################################
+    # Get point list of the data source
+    ####################################################################################################################
+    def _load_points(self, data_source_id):
+        cnx_system_db = self._get_system_db()
+        cursor_system_db = cnx_system_db.cursor()
+        try:
+            query = (" SELECT id, name, object_type, is_trend, ratio, address "
+                     " FROM tbl_points "
+                     " WHERE data_source_id = %s AND is_virtual = 0 "
+                     " ORDER BY id ")
+            cursor_system_db.execute(query, (data_source_id,))
+            return cursor_system_db.fetchall()
+        finally:
+            cursor_system_db.close()
+
+    ####################################################################################################################
+    # Bulk insert point values and update latest values in historical database
+    # Trend values which can not be inserted because the historical database is unreachable are appended to the spool,
+    # so there is no failure to be handled by the caller
+    ####################################################################################################################
+    def _write_values(self, data_source_id, energy_value_list, analog_value_list, digital_value_list,
+                      current_datetime_utc):
+        logger = self.logger
+        # check the connection to the Historical Database
+        try:
+            cnx_historical_db = self._get_historical_db()
+            cursor_historical_db = cnx_historical_db.cursor()
+        except Exception as e:
+            logger.error("Error in step 4.1 of acquisition process: " + str(e))
+            # append trend values to the local spool, and they will be replayed by the spool flusher
+            # once the historical database is back
+            self._spool_trend_values('tbl_analog_value', analog_value_list, current_datetime_utc)
+            self._spool_trend_values('tbl_energy_value', energy_value_list, current_datetime_utc)
+            self._spool_trend_values('tbl_digital_value', digital_value_list, current_datetime_utc)
+            return
+
+        try:
+            # bulk insert values into historical database within a period
+            # and then update latest values
+            while len(analog_value_list) > 0:
+                analog_value_list_100 = analog_value_list[:100]
+                analog_value_list = analog_value_list[100:]
+
+                add_values = (" INSERT INTO tbl_analog_value (point_id, utc_date_time, actual_value) "
+                              " VALUES  ")
+                trend_value_count = 0
+
+                for point_value in analog_value_list_100:
+                    if point_value['is_trend']:
+                        add_values += " (" + str(point_value['point_id']) + ","
+                        add_values += "'" + current_datetime_utc.isoformat() + "',"
+                        add_values += str(point_value['value']) + "), "
+                        trend_value_count += 1
+
+                if trend_value_count > 0:
+                    try:
+                        # trim ", " at the end of string and then execute
+                        cursor_historical_db.execute(add_values[:-2])
+                        cnx_historical_db.commit()
+                    except Exception as e:
+                        logger.error("Error in step 4.3.1 of acquisition process " + str(e))
+                        if not cnx_historical_db.is_connected():
+                            # the connection to historical database is lost, append trend values to the local spool
+                            self._spool_trend_values('tbl_analog_value', analog_value_list_100, current_datetime_utc)
+                        # else ignore this exception
+
+                # update tbl_analog_value_latest in one statement, the latest value of a point is inserted
+                # if it does not exist, otherwise it is updated by the unique key on point_id
+                latest_values = (" INSERT INTO tbl_analog_value_latest (point_id, utc_date_time, actual_value) "
+                                 " VALUES  ")
+                latest_value_count = 0
+                for point_value in analog_value_list_100:
+                    latest_values += " (" + str(point_value['point_id']) + ","
+                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
+                    latest_values += str(point_value['value']) + "), "
+                    latest_value_count += 1
+
+                if latest_value_count > 0:
+                    try:
+                        # trim ", " at the end of string and then execute
+                        cursor_historical_db.execute(latest_values[:-2] +
+                                                     " ON DUPLICATE KEY UPDATE "
+                                                     " utc_date_time = VALUES(utc_date_time), "
+                                                     " actual_value = VALUES(actual_value) ")
+                        cnx_historical_db.commit()
+                    except Exception as e:
+                        logger.error("Error in step 4.3.2 of acquisition process " + str(e))
+                        # ignore this exception
+
+            while len(energy_value_list) > 0:
+                energy_value_list_100 = energy_value_list[:100]
+                energy_value_list = energy_value_list[100:]
+
+                add_values = (" INSERT INTO tbl_energy_value (point_id, utc_date_time, actual_value) "
+                              " VALUES  ")
+                trend_value_count = 0
+
+                for point_value in energy_value_list_100:
+                    if point_value['is_trend']:
+                        add_values += " (" + str(point_value['point_id']) + ","
+                        add_values += "'" + current_datetime_utc.isoformat() + "',"
+                        add_values += str(point_value['value']) + "), "
+                        trend_value_count += 1
+
+                if trend_value_count > 0:
+                    try:
+                        # trim ", " at the end of string and then execute
+                        cursor_historical_db.execute(add_values[:-2])
+                        cnx_historical_db.commit()
+                    except Exception as e:
+                        logger.error("Error in step 4.4.1 of acquisition process: " + str(e))
+                        if not cnx_historical_db.is_connected():
+                            # the connection to historical database is lost, append trend values to the local spool
+                            self._spool_trend_values('tbl_energy_value', energy_value_list_100, current_datetime_utc)
+                        # else ignore this exception
+
+                # update tbl_energy_value_latest in one statement, the latest value of a point is inserted
+                # if it does not exist, otherwise it is updated by the unique key on point_id
+                latest_values = (" INSERT INTO tbl_energy_value_latest (point_id, utc_date_time, actual_value) "
+                                 " VALUES  ")
+                latest_value_count = 0
+                for point_value in energy_value_list_100:
+                    latest_values += " (" + str(point_value['point_id']) + ","
+                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
+                    latest_values += str(point_value['value']) + "), "
+                    latest_value_count += 1
+
+                if latest_value_count > 0:
+                    try:
+                        # trim ", " at the end of string and then execute
+                        cursor_historical_db.execute(latest_values[:-2] +
+                                                     " ON DUPLICATE KEY UPDATE "
+                                                     " utc_date_time = VALUES(utc_date_time), "
+                                                     " actual_value = VALUES(actual_value) ")
+                        cnx_historical_db.commit()
+                    except Exception as e:
+                        logger.error("Error in step 4.4.2 of acquisition process " + str(e))
+                        # ignore this exception
+
+            while len(digital_value_list) > 0:
+                digital_value_list_100 = digital_value_list[:100]
+                digital_value_list = digital_value_list[100:]
+
+                add_values = (" INSERT INTO tbl_digital_value (point_id, utc_date_time, actual_value) "
+                              " VALUES  ")
+                trend_value_count = 0
+
+                for point_value in digital_value_list_100:
+                    if point_value['is_trend']:
+                        add_values += " (" + str(point_value['point_id']) + ","
+                        add_values += "'" + current_datetime_utc.isoformat() + "',"
+                        add_values += str(point_value['value']) + "), "
+                        trend_value_count += 1
+
+                if trend_value_count > 0:
+                    try:
+                        # trim ", " at the end of string and then execute
+                        cursor_historical_db.execute(add_values[:-2])
+                        cnx_historical_db.commit()
+                    except Exception as e:
+                        logger.error("Error in step 4.5.1 of acquisition process: " + str(e))
+                        if not cnx_historical_db.is_connected():
+                            # the connection to historical database is lost, append trend values to the local spool
+                            self._spool_trend_values('tbl_digital_value', digital_value_list_100, current_datetime_utc)
+                        # else ignore this exception
+
+                # update tbl_digital_value_latest in one statement, the latest value of a point is inserted
+                # if it does not exist, otherwise it is updated by the unique key on point_id
+                latest_values = (" INSERT INTO tbl_digital_value_latest (point_id, utc_date_time, actual_value) "
+                                 " VALUES  ")
+                latest_value_count = 0
+                for point_value in digital_value_list_100:
+                    latest_values += " (" + str(point_value['point_id']) + ","
+                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
+                    latest_values += str(point_value['value']) + "), "
+                    latest_value_count += 1
+
+                if latest_value_count > 0:
+                    try:
+                        # trim ", " at the end of string and then execute
+                        cursor_historical_db.execute(latest_values[:-2] +
+                                                     " ON DUPLICATE KEY UPDATE "
+                                                     " utc_date_time = VALUES(utc_date_time), "
+                                                     " actual_value = VALUES(actual_value) ")
+                        cnx_historical_db.commit()
+                    except Exception as e:
+                        logger.error("Error in step 4.5.2 of acquisition process " + str(e))
+                        # ignore this exception
+
+        finally:
+            cursor_historical_db.close()
+
+        # last seen datetime of data source is updated by the gateway heartbeat in batch
+
+    def _spool_trend_values(self, table_name, point_value_list, current_datetime_utc):
+        try:
+            self.spool.append(table_name,
+                              current_datetime_utc,
+                              [(point_value['point_id'], point_value['value'])
+                               for point_value in point_value_list if point_value['is_trend']])
+        except Exception as e:
+            self.logger.error("Error in appending values to spool " + str(e))
+
+    ####################################################################################################################
+    # Verify gateway token, update gateway information and last seen datetime of data sources by gateway heartbeat
+    ####################################################################################################################
+    def _write_heartbeat(self, statistics):
+        logger = self.logger
+        try:
+            cnx_system_db = self._get_system_db()
+            cursor_system_db = cnx_system_db.cursor()
+        except Exception as e:
+            logger.error("Error in step 1.1 of gateway process " + str(e))
+            return False
+
+        try:
+            # TODO: choose a more secure method to verify gateway token
+            try:
+                query = (" SELECT name "
+                         " FROM tbl_gateways "
+                         " WHERE id = %s AND token = %s ")
+                cursor_system_db.execute(query, (config.gateway['id'], config.gateway['token']))
+                row = cursor_system_db.fetchone()
+            except Exception as e:
+                logger.error("Error in step 1.2 of gateway process: " + str(e))
+                return False
+
+            if row is None:
+                logger.error("Error in step 1.3 of gateway process: Not Found ")
+                return False
+
+            update_row = (" UPDATE tbl_gateways "
+                          " SET last_seen_datetime_utc = %s, live_workers = %s, spool_records = %s, "
+                          "     average_sweep_seconds = %s "
+                          " WHERE id = %s ")
+            try:
+                cursor_system_db.execute(update_row, (statistics['last_seen_datetime_utc'].isoformat(),
+                                                      statistics['live_workers'],
+                                                      statistics['spool_records'],
+                                                      statistics['average_sweep_seconds'],
+                                                      config.gateway['id']))
+                cnx_system_db.commit()
+            except Exception as e:
+                logger.error("Error in step 3.1 of gateway process " + str(e))
+                return False
+
+            # update last seen datetime of data sources by their last successful sweeps in one statement
+            last_sweep_datetime_utc_dict = statistics['last_sweep_datetime_utc_dict']
+            if len(last_sweep_datetime_utc_dict) > 0:
+                update_row = (" UPDATE tbl_data_sources "
+                              " SET last_seen_datetime_utc = CASE id ")
+                update_values = list()
+                for data_source_id, last_sweep_datetime_utc in last_sweep_datetime_utc_dict.items():
+                    update_row += " WHEN %s THEN %s "
+                    update_values.extend((data_source_id, last_sweep_datetime_utc.isoformat()))
+                update_row += (" ELSE last_seen_datetime_utc END "
+                               " WHERE gateway_id = %s AND id IN (" +
+                               ", ".join(["%s"] * len(last_sweep_datetime_utc_dict)) + ") ")
+                update_values.append(config.gateway['id'])
+                update_values.extend(last_sweep_datetime_utc_dict.keys())
+                try:
+                    cursor_system_db.execute(update_row, tuple(update_values))
+                    cnx_system_db.commit()
+                except Exception as e:
+                    logger.error("Error in step 3.2 of gateway process " + str(e))
+                    return False
+        finally:
+            cursor_system_db.close()
+
+        return True
+
+    ####################################################################################################################
+    # Replay spooled trend values in order once the historical database is back
+    ####################################################################################################################
+    def _flush_spool(self):
+        logger = self.logger
+        if self.spool.count() == 0:
+            return
+
+        try:
+            cnx_historical_db = self._get_historical_db()
+            cursor_historical_db = cnx_historical_db.cursor()
+        except Exception as e:
+            logger.error("Error in spool flusher, the historical database is still unreachable: " + str(e))
+            return
+
+        try:
+            while True:
+                record_list = self.spool.read(config.spool_flush_batch_size)
+                if len(record_list) == 0:
+                    break
+                flushed_id_list = list()
+                for record_id, table_name, utc_date_time, point_value_list in record_list:
+                    add_values = (" INSERT INTO " + table_name + " (point_id, utc_date_time, actual_value) "
+                                  " VALUES  ")
+                    for point_id, value in point_value_list:
+                        add_values += " (" + str(point_id) + ","
+                        add_values += "'" + utc_date_time + "',"
+                        add_values += value + "), "
+                    try:
+                        # trim ", " at the end of string and then execute
+                        cursor_historical_db.execute(add_values[:-2])
+                        cnx_historical_db.commit()
+                    except Exception as e:
+                        if not cnx_historical_db.is_connected():
+                            logger.error("Error in spool flusher, the historical database is lost again: " + str(e))
+                            # stop flushing and retry later
+                            self.spool.remove(flushed_id_list)
+                            return
+                        # the record can never be inserted, drop it
+                        logger.error("Error in spool flusher, drop spooled record " + str(record_id) + ": " + str(e))
+                    flushed_id_list.append(record_id)
+                self.spool.remove(flushed_id_list)
+        finally:
+            cursor_historical_db.close()
@@ -0,0 +1,244 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+
+from sympy import Rational, sympify
+
+import config
+import meter
+import virtualmeter
+
+########################################################################################################################
+# Benchmark of Normalizing Energy Values
+# Compares meter.normalize_energy_values with the previous implementation, which moved rows between lists by
+# pop(0) and insert(0, ...), on the special test cases documented in meter.worker and on a synthetic backlog,
+# checks that the outputs are identical, and reports the time of both.
+# Compares the compiled equations of virtual meters with the exact results on synthetic hourly values and on large
+# values, and reports the time of both the compiled equation and the previous evaluation by SymPy evalf per time slot.
+########################################################################################################################
+
+
+def normalize_energy_values_by_pop(rows_energy_values, maximum, start_datetime_utc, end_datetime_utc,
+                                   hourly_low_limit, hourly_high_limit):
+    """
+    The previous implementation of meter.normalize_energy_values, as the reference of outputs
+    """
+    rows_energy_values = list(rows_energy_values)
+    normalized_values = list()
+    current_datetime_utc = start_datetime_utc
+    while current_datetime_utc < end_datetime_utc:
+        initial_maximum = maximum
+        # get all energy values in current time slot
+        current_energy_values = list()
+        while len(rows_energy_values) > 0:
+            row_energy_value = rows_energy_values.pop(0)
+            energy_value_datetime = row_energy_value[0].replace(tzinfo=timezone.utc)
+            if energy_value_datetime < current_datetime_utc + timedelta(minutes=config.minutes_to_count):
+                current_energy_values.append(row_energy_value)
+            else:
+                rows_energy_values.insert(0, row_energy_value)
+                break
+
+        # get the energy increment one by one in current time slot
+        increment = Decimal(0.0)
+        # maximum should be equal to the maximum value of last time here
+        for index in range(len(current_energy_values)):
+            current_energy_value = current_energy_values[index]
+            if maximum < current_energy_value[1]:
+                increment += current_energy_value[1] - maximum
+            maximum = current_energy_value[1]
+
+        if initial_maximum <= Decimal(0.1):
+            increment = Decimal(0.0)
+        if increment < hourly_low_limit:
+            increment = Decimal(0.0)
+        if increment > hourly_high_limit:
+            increment = Decimal(0.0)
+
+        normalized_values.append({'start_datetime_utc': current_datetime_utc,
+                                  'actual_value': increment})
+        current_datetime_utc += timedelta(minutes=config.minutes_to_count)
+    return normalized_values
+
+
+def parse_rows(row_list):
+    """
+    :param row_list: list of (utc_date_time string, actual_value string)
+    :return: list of (utc_date_time, actual_value) in order of utc_date_time
+    """
+    return sorted([(datetime.strptime(utc_date_time, '%Y-%m-%d %H:%M:%S'), Decimal(actual_value))
+                   for utc_date_time, actual_value in row_list])
+
+
+def parse_datetime(utc_date_time):
+    return datetime.strptime(utc_date_time, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+# (name, rows, maximum just before start, start_datetime_utc, end_datetime_utc)
+test_case_list = [
+    ('special test case 1 (disconnected)',
+     parse_rows([('2016-12-05 23:58:46', '38312088'),
+                 ('2016-12-05 23:59:48', '38312088'),
+                 ('2016-12-06 06:14:49', '38315900'),
+                 ('2016-12-06 06:15:50', '38315928'),
+                 ('2016-12-06 06:16:52', '38315928')]),
+     Decimal('38312000'), parse_datetime('2016-12-05 23:00:00'), parse_datetime('2016-12-06 08:00:00')),
+    ('special test case 2 (a new added used meter)',
+     parse_rows([('2017-03-27 02:36:07', '56842220.77297248'),
+                 ('2017-03-27 02:35:04', '56842208.420127675'),
+                 ('2017-03-27 02:34:01', '56842195.95270827'),
+                 ('2017-03-27 02:32:58', '56842183.48610827'),
+                 ('2017-03-27 02:31:53', '56842170.812365524'),
+                 ('2017-03-27 02:30:48', '56842157.90797222')]),
+     Decimal(0.0), parse_datetime('2017-03-27 02:00:00'), parse_datetime('2017-03-27 04:00:00')),
+    ('special test case 3 (hi_limit exceeded)',
+     parse_rows([('2016-12-24 08:26:14', '999984.0625'),
+                 ('2016-12-24 08:27:15', '999984.0625'),
+                 ('2016-12-24 08:28:17', '999984.0625'),
+                 ('2016-12-24 08:29:18', '20'),
+                 ('2016-12-24 08:30:20', '20'),
+                 ('2016-12-24 08:31:21', '20')]),
+     Decimal('999980'), parse_datetime('2016-12-24 08:00:00'), parse_datetime('2016-12-24 10:00:00')),
+    ('test case 4 (recovered from bad zeroes)',
+     parse_rows([('2019-03-14 02:03:20', '1103860.625'),
+                 ('2019-03-14 02:02:19', '1103845'),
+                 ('2019-03-14 02:01:19', '1103825.5'),
+                 ('2019-03-14 02:00:18', '1103804.25'),
+                 ('2019-03-14 01:59:17', '1103785.625'),
+                 ('2019-03-14 01:50:13', '1103608.625'),
+                 ('2019-03-14 01:40:08', '1103391.875'),
+                 ('2019-03-14 01:37:06', '1103325.75')]),
+     Decimal(0.0), parse_datetime('2019-03-14 01:00:00'), parse_datetime('2019-03-14 03:00:00')),
+]
+
+# (hourly_low_limit, hourly_high_limit)
+limits_list = [(Decimal(0.0), Decimal(1000000000.0)),
+               (Decimal(10.0), Decimal(1000000000.0)),
+               (Decimal(0.0), Decimal(100.0))]
+
+
+def generate_backlog(number_of_days, seed):
+    """
+    Generate energy values of a meter one minute apart with gaps, as a meter catching up after days offline
+
+    :return: (rows, maximum, start_datetime_utc, end_datetime_utc)
+    """
+    random_generator = random.Random(seed)
+    start_datetime_utc = parse_datetime('2023-01-01 00:00:00')
+    end_datetime_utc = start_datetime_utc + timedelta(days=number_of_days)
+    value = Decimal('1000.000')
+    rows = list()
+    current_datetime_utc = start_datetime_utc
+    while current_datetime_utc < end_datetime_utc:
+        if random_generator.random() < 0.001:
+            # disconnected for hours
+            current_datetime_utc += timedelta(hours=random_generator.randint(1, 48))
+            continue
+        value += Decimal(random_generator.randint(0, 10000)) / Decimal(1000)
+        rows.append((current_datetime_utc.replace(tzinfo=None) + timedelta(seconds=random_generator.randint(0, 59)),
+                     value))
+        current_datetime_utc += timedelta(minutes=1)
+    return rows, Decimal('999.000'), start_datetime_utc, end_datetime_utc
+
+
+def compare(name, rows, maximum, start_datetime_utc, end_datetime_utc, hourly_low_limit, hourly_high_limit):
+    """
+    :return: True if the outputs are identical
+    """
+    start_time = time.perf_counter()
+    expected_values = normalize_energy_values_by_pop(rows, maximum, start_datetime_utc, end_datetime_utc,
+                                                     hourly_low_limit, hourly_high_limit)
+    reference_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    normalized_values = meter.normalize_energy_values(rows, maximum, start_datetime_utc, end_datetime_utc,
+                                                      hourly_low_limit, hourly_high_limit)
+    elapsed_time = time.perf_counter() - start_time
+
+    is_identical = normalized_values == expected_values
+    print("%s, limits %s..%s: %d rows, %d time slots, %s, %.6fs by pop, %.6fs by bisect" %
+          (name, hourly_low_limit, hourly_high_limit, len(rows), len(normalized_values),
+           'identical' if is_identical else 'DIFFERENT', reference_time, elapsed_time))
+    return is_identical
+
+
+def compare_equation(equation, number_of_slots, maximum_value, seed):
+    """
+    :param maximum_value: the maximum of the synthetic hourly values of the variables
+    :return: True if the outputs are identical to the exact results rounded half up to 3 decimal places
+    """
+    random_generator = random.Random(seed)
+    start_datetime_utc = datetime(2023, 1, 1)
+    datetime_list = [start_datetime_utc + timedelta(minutes=config.minutes_to_count * i)
+                     for i in range(number_of_slots)]
+    variable_dict = dict()
+    for symbol in sorted(sympify(equation.lower()).free_symbols, key=lambda symbol: symbol.name):
+        variable_dict[symbol.name] = [Decimal(random_generator.randint(0, maximum_value * 1000)) / Decimal(1000)
+                                      for _ in range(number_of_slots)]
+
+    start_time = time.perf_counter()
+    expr = sympify(equation.lower())
+    for i in range(number_of_slots):
+        subs = dict()
+        for variable_name, value_list in variable_dict.items():
+            subs[variable_name] = value_list[i]
+        # the previous implementation wrote str(evalf) and MySQL rounded it into DECIMAL(18, 3),
+        # evalf may round exact halves such as 0.0005 down by its binary rounding errors
+        expr.evalf(subs=subs)
+    reference_time = time.perf_counter() - start_time
+
+    # exact results of the numbers in the equation and the values as rationals
+    exact_expr = sympify(equation.lower(), rational=True)
+    expected_values = list()
+    for i in range(number_of_slots):
+        subs = dict()
+        for variable_name, value_list in variable_dict.items():
+            subs[variable_name] = Rational(str(value_list[i]))
+        expected_values.append(Decimal(str(exact_expr.subs(subs).evalf(30))).quantize(Decimal('0.001'),
+                                                                                        rounding=ROUND_HALF_UP))
+
+    start_time = time.perf_counter()
+    function, exact_function = virtualmeter.compile_equation(equation, list(variable_dict.keys()))
+    actual_values = virtualmeter.evaluate_equation(function, exact_function, list(variable_dict.values()),
+                                                   datetime_list)
+    elapsed_time = time.perf_counter() - start_time
+
+    number_of_differences = sum(1 for actual_value, expected_value in zip(actual_values, expected_values)
+                                if actual_value != expected_value)
+    print("equation %s, values up to %d: %d time slots, %s, %.6fs by evalf, %.6fs compiled" %
+          (equation, maximum_value, number_of_slots,
+           'identical' if number_of_differences == 0 else str(number_of_differences) + ' DIFFERENT',
+           reference_time, elapsed_time))
+    return number_of_differences == 0
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Benchmark of normalizing energy values of meters')
+    argument_parser.add_argument('--days', type=int, default=28, help='number of days of the synthetic backlog')
+    argument_parser.add_argument('--seed', type=int, default=0, help='seed of the generator')
+    argument_parser.add_argument('--equation', default='x1+x2*0.5-x3/4',
+                                 help='equation of the virtual meter to be evaluated')
+    arguments = argument_parser.parse_args()
+
+    is_identical = True
+    for name, rows, maximum, start_datetime_utc, end_datetime_utc in test_case_list:
+        for hourly_low_limit, hourly_high_limit in limits_list:
+            is_identical &= compare(name, rows, maximum, start_datetime_utc, end_datetime_utc,
+                                    hourly_low_limit, hourly_high_limit)
+
+    rows, maximum, start_datetime_utc, end_datetime_utc = generate_backlog(arguments.days, arguments.seed)
+    is_identical &= compare('backlog of ' + str(arguments.days) + ' days', rows, maximum,
+                            start_datetime_utc, end_datetime_utc, Decimal(0.0), Decimal(1000000000.0))
+    # hourly values of meters, and large values beyond the 15 significant digits of float64 with 3 decimal places
+    for maximum_value in (10000, 10000000000000):
+        is_identical &= compare_equation(arguments.equation, arguments.days * 24 * 60 // config.minutes_to_count,
+                                         maximum_value, arguments.seed)
+
+    if not is_identical:
+        raise SystemExit("the outputs are different")
+
+
+if __name__ == "__main__":
+    main()
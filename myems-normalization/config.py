@@ -33,7 +33,7 @@ minutes_to_count = config('MINUTES_TO_COUNT', default=60, cast=int)
 # indicates within how many minutes to allow myems-cleaning service to clean the historical data
 minutes_to_clean = config('MINUTES_TO_CLEAN', default=30, cast=int)
 
-# indicates from when (in UTC timezone) to calculate if the energy data is empty or were cleared
+# indicates from when (in UTC timezone) to calculate if there is no normalization watermark of a meter
 # format string: "%Y-%m-%d %H:%M:%S"
 start_datetime_utc = config('START_DATETIME_UTC', default='2019-12-31 16:00:00')
 
@@ -44,3 +44,6 @@ utc_offset = config('UTC_OFFSET', default='+08:00')
 # the pool size depends on the computing performance of the database server and the analysis server
 pool_size = config('POOL_SIZE', default=5, cast=int)
 
+
+# the number of meters normalized in a batch by a worker process with batched queries
+meter_batch_size = config('METER_BATCH_SIZE', default=100, cast=int)
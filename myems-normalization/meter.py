@@ -1,7 +1,9 @@
 import random
 import time
+from bisect import bisect_left
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from itertools import groupby
 from multiprocessing import Pool
 
 import mysql.connector
@@ -12,11 +14,15 @@ import config
 ########################################################################################################################
 # PROCEDURES:
 # Step 1: Query all meters and associated energy value points
-# Step 2: Create multiprocessing pool to call worker in parallel
+# Step 2: Query the watermarks of all meters
+# Step 3: Split meters into batches and call worker in parallel by the multiprocessing pool
+#
+# NOTE: the pool is created once and its worker processes keep their database connections between cycles
 ########################################################################################################################
 
 
 def calculate_hourly(logger):
+    p = Pool(processes=config.pool_size, initializer=initialize_worker)
 
     while True:
         ################################################################################################################
@@ -81,16 +87,44 @@ def calculate_hourly(logger):
         print("Got all meters in MyEMS System Database")
 
         ################################################################################################################
-        # Step 2: Create multiprocessing pool to call worker in parallel
+        # Step 2: Query the watermarks of all meters
         ################################################################################################################
-        p = Pool(processes=config.pool_size)
-        error_list = p.map(worker, meter_list)
-        p.close()
-        p.join()
+        cnx_energy_db = None
+        cursor_energy_db = None
+        try:
+            cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
+            cursor_energy_db = cnx_energy_db.cursor()
+            cursor_energy_db.execute(" SELECT entity_id, last_slot_utc "
+                                     " FROM tbl_normalization_watermarks "
+                                     " WHERE entity_type = 'meter' ")
+            last_slot_dict = dict()
+            for row in cursor_energy_db.fetchall():
+                last_slot_dict[row[0]] = row[1]
+        except Exception as e:
+            logger.error("Error in step 2.1 of meter.calculate_hourly " + str(e))
+            # sleep several minutes and continue the outer loop to reconnect the database
+            time.sleep(60)
+            continue
+        finally:
+            if cursor_energy_db:
+                cursor_energy_db.close()
+            if cnx_energy_db:
+                cnx_energy_db.close()
 
-        for error in error_list:
-            if error is not None and len(error) > 0:
-                logger.error(error)
+        for meter in meter_list:
+            meter['last_slot_utc'] = last_slot_dict.get(meter['id'])
+
+        ################################################################################################################
+        # Step 3: Split meters into batches and call worker in parallel by the multiprocessing pool
+        ################################################################################################################
+        meter_batch_list = [meter_list[i:i + config.meter_batch_size]
+                            for i in range(0, len(meter_list), config.meter_batch_size)]
+        error_lists = p.map(worker, meter_batch_list)
+
+        for error_list in error_lists:
+            for error in error_list:
+                if error is not None and len(error) > 0:
+                    logger.error(error)
 
         print("go to sleep ...")
         time.sleep(60)
@@ -99,164 +133,182 @@ def calculate_hourly(logger):
 
 
 ########################################################################################################################
-# PROCEDURES:
-# Step 1: Determine the start datetime and end datetime
-# Step 2: Get raw data from historical database between start_datetime_utc and end datetime
-# Step 3: Normalize energy values by minutes_to_count
-# Step 4: Insert into energy database
-#
-# NOTE: returns None or the error string because that the logger object cannot be passed in as parameter
+# Connections of a worker process
+# The connections are opened by the initializer of the pool in each worker process and reused by all batches of meters
+# in the process. A connection is discarded on any error and opened again by the next batch.
+# NOTE: the energy database connection is only written, and every transaction on it is committed per meter or
+#       discarded with the connection, the historical database connection is only read in autocommit mode.
 ########################################################################################################################
+cnx_energy_db = None
+cnx_historical_db = None
 
-def worker(meter):
-    print("Start to process meter: " + "'" + meter['name'] + "'")
-    ####################################################################################################################
-    # Step 1: Determine the start datetime and end datetime
-    ####################################################################################################################
-    cnx_energy_db = None
-    cursor_energy_db = None
-    try:
-        cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
-        cursor_energy_db = cnx_energy_db.cursor()
-    except Exception as e:
-        error_string = "Error in step 1.1 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
-        if cursor_energy_db:
-            cursor_energy_db.close()
-        if cnx_energy_db:
-            cnx_energy_db.close()
-        print(error_string)
-        return error_string
-
-    # get the initial start datetime from config file in case there is no energy data
-    start_datetime_utc = datetime.strptime(config.start_datetime_utc, '%Y-%m-%d %H:%M:%S')
-    start_datetime_utc = start_datetime_utc.replace(tzinfo=timezone.utc)
-    start_datetime_utc = start_datetime_utc.replace(minute=0, second=0, microsecond=0)
 
+def initialize_worker():
     try:
-        query = (" SELECT MAX(start_datetime_utc) "
-                 " FROM tbl_meter_hourly "
-                 " WHERE meter_id = %s ")
-        cursor_energy_db.execute(query, (meter['id'],))
-        row_datetime = cursor_energy_db.fetchone()
+        connect()
     except Exception as e:
-        error_string = "Error in step 1.3 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
-        if cursor_energy_db:
-            cursor_energy_db.close()
-        if cnx_energy_db:
-            cnx_energy_db.close()
-        print(error_string)
-        return error_string
-
-    if row_datetime is not None and len(row_datetime) > 0 and isinstance(row_datetime[0], datetime):
-        start_datetime_utc = row_datetime[0].replace(tzinfo=timezone.utc)
-        # replace second and microsecond with 0
-        # NOTE: DO NOT replace minute in case of calculating in half hourly
-        start_datetime_utc = start_datetime_utc.replace(second=0, microsecond=0)
-        # start from the next time slot
-        start_datetime_utc += timedelta(minutes=config.minutes_to_count)
-
-    end_datetime_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
-    # we should allow myems-cleaning service to take at most [minutes_to_clean] minutes to clean the data
-    end_datetime_utc -= timedelta(minutes=config.minutes_to_clean)
-
-    time_difference = end_datetime_utc - start_datetime_utc
-    time_difference_in_minutes = time_difference / timedelta(minutes=1)
-    if time_difference_in_minutes < config.minutes_to_count:
-        error_string = "it's too early to calculate" + " for '" + meter['name'] + "'"
-        print(error_string)
-        return error_string
+        # the connections will be opened again by worker
+        print("Error in initializing meter worker " + str(e))
 
-    # trim end_datetime_utc
-    trimmed_end_datetime_utc = start_datetime_utc + timedelta(minutes=config.minutes_to_count)
-    while trimmed_end_datetime_utc <= end_datetime_utc:
-        trimmed_end_datetime_utc += timedelta(minutes=config.minutes_to_count)
 
-    end_datetime_utc = trimmed_end_datetime_utc - timedelta(minutes=config.minutes_to_count)
+def connect():
+    global cnx_energy_db, cnx_historical_db
+    if cnx_energy_db is None or not cnx_energy_db.is_connected():
+        cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
+    if cnx_historical_db is None or not cnx_historical_db.is_connected():
+        # autocommit so that queries on the long-lived connection read the latest energy values
+        # instead of the snapshot of a repeatable read transaction
+        cnx_historical_db = mysql.connector.connect(autocommit=True, **config.myems_historical_db)
+
+
+def disconnect():
+    global cnx_energy_db, cnx_historical_db
+    for cnx in (cnx_energy_db, cnx_historical_db):
+        if cnx is not None:
+            try:
+                cnx.close()
+            except Exception as e:
+                print("Error in closing connection of meter worker " + str(e))
+    cnx_energy_db = None
+    cnx_historical_db = None
 
-    if end_datetime_utc <= start_datetime_utc:
-        error_string = "it's too early to calculate" + " for '" + meter['name'] + "'"
-        print(error_string)
-        return error_string
 
-    print("start_datetime_utc: " + start_datetime_utc.isoformat()[0:19]
-          + "end_datetime_utc: " + end_datetime_utc.isoformat()[0:19])
+########################################################################################################################
+# PROCEDURES:
+# Step 1: Determine the start datetime and end datetime of each meter in the batch
+# Step 2: Get raw data of all points in the batch from historical database in one range scan
+# Step 3: Normalize energy values by minutes_to_count
+# Step 4: Insert into energy database and update the watermark of the meter in the same transaction
+#
+# NOTE: returns the list of error strings because that the logger object cannot be passed in as parameter
+########################################################################################################################
 
+def worker(meter_batch):
+    print("Start to process " + str(len(meter_batch)) + " meters")
+    error_list = list()
     ####################################################################################################################
-    # Step 2: Get raw data from historical database between start_datetime_utc and end_datetime_utc
+    # Step 1: Determine the start datetime and end datetime of each meter in the batch
     ####################################################################################################################
+    meter_list = list()
+    for meter in meter_batch:
+        # get the initial start datetime from config file in case there is no energy data
+        start_datetime_utc = datetime.strptime(config.start_datetime_utc, '%Y-%m-%d %H:%M:%S')
+        start_datetime_utc = start_datetime_utc.replace(tzinfo=timezone.utc)
+        start_datetime_utc = start_datetime_utc.replace(minute=0, second=0, microsecond=0)
+
+        if isinstance(meter['last_slot_utc'], datetime):
+            start_datetime_utc = meter['last_slot_utc'].replace(tzinfo=timezone.utc)
+            # replace second and microsecond with 0
+            # NOTE: DO NOT replace minute in case of calculating in half hourly
+            start_datetime_utc = start_datetime_utc.replace(second=0, microsecond=0)
+            # start from the next time slot
+            start_datetime_utc += timedelta(minutes=config.minutes_to_count)
+
+        end_datetime_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
+        # we should allow myems-cleaning service to take at most [minutes_to_clean] minutes to clean the data
+        end_datetime_utc -= timedelta(minutes=config.minutes_to_clean)
+
+        time_difference = end_datetime_utc - start_datetime_utc
+        time_difference_in_minutes = time_difference / timedelta(minutes=1)
+        if time_difference_in_minutes < config.minutes_to_count:
+            error_string = "it's too early to calculate" + " for '" + meter['name'] + "'"
+            print(error_string)
+            error_list.append(error_string)
+            continue
 
-    cnx_historical_db = None
-    cursor_historical_db = None
-    try:
-        cnx_historical_db = mysql.connector.connect(**config.myems_historical_db)
-        cursor_historical_db = cnx_historical_db.cursor()
-    except Exception as e:
-        error_string = "Error in step 1.2 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
-        if cursor_historical_db:
-            cursor_historical_db.close()
-        if cnx_historical_db:
-            cnx_historical_db.close()
+        # trim end_datetime_utc
+        trimmed_end_datetime_utc = start_datetime_utc + timedelta(minutes=config.minutes_to_count)
+        while trimmed_end_datetime_utc <= end_datetime_utc:
+            trimmed_end_datetime_utc += timedelta(minutes=config.minutes_to_count)
 
-        if cursor_energy_db:
-            cursor_energy_db.close()
-        if cnx_energy_db:
-            cnx_energy_db.close()
+        end_datetime_utc = trimmed_end_datetime_utc - timedelta(minutes=config.minutes_to_count)
 
-        print(error_string)
-        return error_string
+        if end_datetime_utc <= start_datetime_utc:
+            error_string = "it's too early to calculate" + " for '" + meter['name'] + "'"
+            print(error_string)
+            error_list.append(error_string)
+            continue
+
+        print("start_datetime_utc: " + start_datetime_utc.isoformat()[0:19]
+              + "end_datetime_utc: " + end_datetime_utc.isoformat()[0:19] + " for '" + meter['name'] + "'")
+        meter_list.append({'meter': meter,
+                           'start_datetime_utc': start_datetime_utc,
+                           'end_datetime_utc': end_datetime_utc})
+
+    if len(meter_list) == 0:
+        return error_list
 
-    # query latest record before start_datetime_utc
-    energy_value_just_before_start = dict()
     try:
-        query = (" SELECT utc_date_time, actual_value "
-                 " FROM tbl_energy_value "
-                 " WHERE point_id = %s AND utc_date_time < %s AND is_bad = 0 "
-                 " ORDER BY utc_date_time DESC "
-                 " LIMIT 1 ")
-        cursor_historical_db.execute(query, (meter['point_id'], start_datetime_utc,))
-        row_energy_value_before_start = cursor_historical_db.fetchone()
-
-        if row_energy_value_before_start is not None and len(row_energy_value_before_start) > 0:
-            energy_value_just_before_start = {"utc_date_time": row_energy_value_before_start[0],
-                                              "actual_value": row_energy_value_before_start[1]}
+        connect()
+        cursor_energy_db = cnx_energy_db.cursor()
+        cursor_historical_db = cnx_historical_db.cursor()
     except Exception as e:
-        error_string = "Error in step 2.2 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
-        if cursor_historical_db:
-            cursor_historical_db.close()
-        if cnx_historical_db:
-            cnx_historical_db.close()
+        error_string = "Error in step 1.1 of meter.worker " + str(e)
+        disconnect()
+        print(error_string)
+        error_list.append(error_string)
+        return error_list
 
-        if cursor_energy_db:
-            cursor_energy_db.close()
-        if cnx_energy_db:
-            cnx_energy_db.close()
+    ####################################################################################################################
+    # Step 2: Get raw data of all points in the batch from historical database in one range scan
+    ####################################################################################################################
+    # time ranges of points, a point may be associated with more than one meter
+    point_range_dict = dict()
+    for meter_batch_item in meter_list:
+        point_id = meter_batch_item['meter']['point_id']
+        if point_id in point_range_dict:
+            point_range_dict[point_id] = (min(point_range_dict[point_id][0], meter_batch_item['start_datetime_utc']),
+                                          max(point_range_dict[point_id][1], meter_batch_item['end_datetime_utc']))
+        else:
+            point_range_dict[point_id] = (meter_batch_item['start_datetime_utc'],
+                                          meter_batch_item['end_datetime_utc'])
 
+    try:
+        # query latest record before start_datetime_utc of each meter
+        query = " UNION ALL ".join([" (SELECT %s, actual_value "
+                                    "  FROM tbl_energy_value "
+                                    "  WHERE point_id = %s AND utc_date_time < %s AND is_bad = 0 "
+                                    "  ORDER BY utc_date_time DESC "
+                                    "  LIMIT 1) "] * len(meter_list))
+        parameters = list()
+        for index, meter_batch_item in enumerate(meter_list):
+            parameters.extend([index, meter_batch_item['meter']['point_id'], meter_batch_item['start_datetime_utc']])
+        cursor_historical_db.execute(query, parameters)
+        for row in cursor_historical_db.fetchall():
+            meter_list[row[0]]['energy_value_just_before_start'] = row[1]
+    except Exception as e:
+        error_string = "Error in step 2.2 of meter.worker " + str(e)
+        cursor_energy_db.close()
+        cursor_historical_db.close()
+        disconnect()
         print(error_string)
-        return error_string
+        error_list.append(error_string)
+        return error_list
 
-    # query energy values to be normalized
+    # query energy values to be normalized, in one range scan of index (point_id, utc_date_time)
+    rows_energy_values_dict = dict()
     try:
-        query = (" SELECT utc_date_time, actual_value "
+        query = (" SELECT point_id, utc_date_time, actual_value "
                  " FROM tbl_energy_value "
-                 " WHERE point_id = %s AND utc_date_time >= %s AND utc_date_time < %s AND is_bad = 0 "
-                 " ORDER BY utc_date_time ")
-        cursor_historical_db.execute(query, (meter['point_id'], start_datetime_utc, end_datetime_utc))
-        rows_energy_values = cursor_historical_db.fetchall()
+                 " WHERE (" + " OR ".join(["(point_id = %s AND utc_date_time >= %s AND utc_date_time < %s)"] *
+                                          len(point_range_dict)) + ") "
+                 "       AND is_bad = 0 "
+                 " ORDER BY point_id, utc_date_time ")
+        parameters = list()
+        for point_id, (start_datetime_utc, end_datetime_utc) in point_range_dict.items():
+            parameters.extend([point_id, start_datetime_utc, end_datetime_utc])
+        cursor_historical_db.execute(query, parameters)
+        for point_id, rows in groupby(cursor_historical_db.fetchall(), key=lambda row: row[0]):
+            rows_energy_values_dict[point_id] = [(row[1], row[2]) for row in rows]
     except Exception as e:
-        error_string = "Error in step 2.3 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
-
-        if cursor_energy_db:
-            cursor_energy_db.close()
-        if cnx_energy_db:
-            cnx_energy_db.close()
-
+        error_string = "Error in step 2.3 of meter.worker " + str(e)
+        cursor_energy_db.close()
+        disconnect()
         print(error_string)
-        return error_string
+        error_list.append(error_string)
+        return error_list
     finally:
-        if cursor_historical_db:
-            cursor_historical_db.close()
-        if cnx_historical_db:
-            cnx_historical_db.close()
+        cursor_historical_db.close()
 
     ####################################################################################################################
     # Step 3: Normalize energy values by minutes_to_count
@@ -340,96 +392,126 @@ def worker(meter):
     # 300346191	1003344	2019-03-14 01:25:00	0	            1
     ####################################################################################################################
 
-    normalized_values = list()
-    if rows_energy_values is None or len(rows_energy_values) == 0:
-        # NOTE: there isn't any value to be normalized
-        # that means the meter is offline or all values are bad
-        current_datetime_utc = start_datetime_utc
-        while current_datetime_utc < end_datetime_utc:
-            normalized_values.append({'start_datetime_utc': current_datetime_utc, 'actual_value': Decimal(0.0)})
-            current_datetime_utc += timedelta(minutes=config.minutes_to_count)
-    else:
-        maximum = Decimal(0.0)
-        if energy_value_just_before_start is not None and \
-                len(energy_value_just_before_start) > 0 and \
-                energy_value_just_before_start['actual_value'] > Decimal(0.0):
-            maximum = energy_value_just_before_start['actual_value']
-
-        current_datetime_utc = start_datetime_utc
-        while current_datetime_utc < end_datetime_utc:
-            initial_maximum = maximum
-            # get all energy values in current time slot
-            current_energy_values = list()
-            while len(rows_energy_values) > 0:
-                row_energy_value = rows_energy_values.pop(0)
-                energy_value_datetime = row_energy_value[0].replace(tzinfo=timezone.utc)
-                if energy_value_datetime < current_datetime_utc + timedelta(minutes=config.minutes_to_count):
-                    current_energy_values.append(row_energy_value)
-                else:
-                    rows_energy_values.insert(0, row_energy_value)
-                    break
-
-            # get the energy increment one by one in current time slot
-            increment = Decimal(0.0)
-            # maximum should be equal to the maximum value of last time here
-            for index in range(len(current_energy_values)):
-                current_energy_value = current_energy_values[index]
-                if maximum < current_energy_value[1]:
-                    increment += current_energy_value[1] - maximum
-                maximum = current_energy_value[1]
-
-            # omit huge initial value for a new meter
-            # or omit huge value for a recovered meter with zero values during failure
-            # NOTE: this method may cause the lose of energy consumption in this time slot
-            if initial_maximum <= Decimal(0.1):
-                increment = Decimal(0.0)
-
-            # check with hourly low limit
-            if increment < meter['hourly_low_limit']:
-                increment = Decimal(0.0)
-
-            # check with hourly high limit
-            # NOTE: this method may cause the lose of energy consumption in this time slot
-            if increment > meter['hourly_high_limit']:
-                increment = Decimal(0.0)
-
-            meta_data = {'start_datetime_utc': current_datetime_utc,
-                         'actual_value': increment}
-            # append mete_data
-            normalized_values.append(meta_data)
-            current_datetime_utc += timedelta(minutes=config.minutes_to_count)
+    for meter_batch_item in meter_list:
+        meter = meter_batch_item['meter']
+        start_datetime_utc = meter_batch_item['start_datetime_utc']
+        end_datetime_utc = meter_batch_item['end_datetime_utc']
+        # rows of the point between start_datetime_utc and end_datetime_utc of the meter
+        rows_energy_values = rows_energy_values_dict.get(meter['point_id'], list())
+        utc_date_time_list = [row_energy_value[0] for row_energy_value in rows_energy_values]
+        rows_energy_values = rows_energy_values[
+            bisect_left(utc_date_time_list, start_datetime_utc.replace(tzinfo=None)):
+            bisect_left(utc_date_time_list, end_datetime_utc.replace(tzinfo=None))]
+
+        normalized_values = list()
+        if len(rows_energy_values) == 0:
+            # NOTE: there isn't any value to be normalized
+            # that means the meter is offline or all values are bad
+            current_datetime_utc = start_datetime_utc
+            while current_datetime_utc < end_datetime_utc:
+                normalized_values.append({'start_datetime_utc': current_datetime_utc, 'actual_value': Decimal(0.0)})
+                current_datetime_utc += timedelta(minutes=config.minutes_to_count)
+        else:
+            maximum = Decimal(0.0)
+            energy_value_just_before_start = meter_batch_item.get('energy_value_just_before_start')
+            if energy_value_just_before_start is not None and energy_value_just_before_start > Decimal(0.0):
+                maximum = energy_value_just_before_start
+
+            normalized_values = normalize_energy_values(rows_energy_values,
+                                                        maximum,
+                                                        start_datetime_utc,
+                                                        end_datetime_utc,
+                                                        meter['hourly_low_limit'],
+                                                        meter['hourly_high_limit'])
 
-    ####################################################################################################################
-    # Step 4: Insert into energy database
-    ####################################################################################################################
-    while len(normalized_values) > 0:
-        insert_100 = normalized_values[:100]
-        normalized_values = normalized_values[100:]
+        ################################################################################################################
+        # Step 4: Insert into energy database and update the watermark of the meter in the same transaction
+        ################################################################################################################
+        last_slot_utc = normalized_values[-1]['start_datetime_utc']
         try:
-            add_values = (" INSERT INTO tbl_meter_hourly (meter_id, start_datetime_utc, actual_value) "
-                          " VALUES  ")
-
-            for meta_data in insert_100:
-                add_values += " (" + str(meter['id']) + ","
-                add_values += "'" + meta_data['start_datetime_utc'].isoformat()[0:19] + "',"
-                add_values += str(meta_data['actual_value']) + "), "
-            # trim ", " at the end of string and then execute
-            cursor_energy_db.execute(add_values[:-2])
+            while len(normalized_values) > 0:
+                insert_100 = normalized_values[:100]
+                normalized_values = normalized_values[100:]
+                add_values = (" INSERT INTO tbl_meter_hourly (meter_id, start_datetime_utc, actual_value) "
+                              " VALUES  ")
+
+                for meta_data in insert_100:
+                    add_values += " (" + str(meter['id']) + ","
+                    add_values += "'" + meta_data['start_datetime_utc'].isoformat()[0:19] + "',"
+                    add_values += str(meta_data['actual_value']) + "), "
+                # trim ", " at the end of string and then execute
+                cursor_energy_db.execute(add_values[:-2])
+            cursor_energy_db.execute(" INSERT INTO tbl_normalization_watermarks "
+                                     "             (entity_type, entity_id, last_slot_utc) "
+                                     " VALUES ('meter', %s, %s) "
+                                     " ON DUPLICATE KEY UPDATE last_slot_utc = VALUES(last_slot_utc) ",
+                                     (meter['id'], last_slot_utc.isoformat()[0:19]))
+            # commit all time slots of the meter with the watermark at once
             cnx_energy_db.commit()
         except Exception as e:
             error_string = "Error in step 4.1 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
-            if cursor_energy_db:
-                cursor_energy_db.close()
-            if cnx_energy_db:
-                cnx_energy_db.close()
-
+            cursor_energy_db.close()
+            disconnect()
             print(error_string)
-            return error_string
+            error_list.append(error_string)
+            return error_list
 
-    if cursor_energy_db:
-        cursor_energy_db.close()
-    if cnx_energy_db:
-        cnx_energy_db.close()
+        print("End of processing meter: " + "'" + meter['name'] + "'")
+
+    cursor_energy_db.close()
+    return error_list
+
+
+########################################################################################################################
+# Normalize energy values into time slots of minutes_to_count from start_datetime_utc to end_datetime_utc
+# rows_energy_values: list of (utc_date_time, actual_value) in order of utc_date_time, utc_date_time is in UTC
+# maximum: the good energy value just before start_datetime_utc, or 0 if there isn't any
+# The rows are swept once by index, and the first row of the next time slot is found by bisect,
+# so that it takes linear time even if a meter catches up after weeks offline.
+# :return: list of dicts of start_datetime_utc and actual_value of time slots
+########################################################################################################################
+def normalize_energy_values(rows_energy_values, maximum, start_datetime_utc, end_datetime_utc,
+                            hourly_low_limit, hourly_high_limit):
+    minutes_to_count = timedelta(minutes=config.minutes_to_count)
+    # values from database are naive datetimes in UTC
+    utc_date_time_list = [row_energy_value[0].replace(tzinfo=None) for row_energy_value in rows_energy_values]
+
+    normalized_values = list()
+    index = 0
+    current_datetime_utc = start_datetime_utc
+    while current_datetime_utc < end_datetime_utc:
+        initial_maximum = maximum
+        next_datetime_utc = current_datetime_utc + minutes_to_count
+        # energy values from index to next_index are in current time slot
+        next_index = bisect_left(utc_date_time_list, next_datetime_utc.replace(tzinfo=None), index)
+
+        # get the energy increment one by one in current time slot
+        increment = Decimal(0.0)
+        # maximum should be equal to the maximum value of last time here
+        for i in range(index, next_index):
+            actual_value = rows_energy_values[i][1]
+            if maximum < actual_value:
+                increment += actual_value - maximum
+            maximum = actual_value
+        index = next_index
+
+        # omit huge initial value for a new meter
+        # or omit huge value for a recovered meter with zero values during failure
+        # NOTE: this method may cause the lose of energy consumption in this time slot
+        if initial_maximum <= Decimal(0.1):
+            increment = Decimal(0.0)
+
+        # check with hourly low limit
+        if increment < hourly_low_limit:
+            increment = Decimal(0.0)
+
+        # check with hourly high limit
+        # NOTE: this method may cause the lose of energy consumption in this time slot
+        if increment > hourly_high_limit:
+            increment = Decimal(0.0)
+
+        normalized_values.append({'start_datetime_utc': current_datetime_utc,
+                                  'actual_value': increment})
+        current_datetime_utc = next_datetime_utc
 
-    print("End of processing meter: " + "'" + meter['name'] + "'")
-    return None
+    return normalized_values
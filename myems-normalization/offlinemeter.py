@@ -13,6 +13,7 @@ import config
 # STEP 1: get all 'new' offline meter files
 # STEP 2: for each new files, iterate all rows and read cell's value and store data to energy data list
 # STEP 3: insert or update energy data to table offline meter hourly in energy database
+#         with the watermark of the offline meter in the same transaction
 # STEP 4: update file status to 'done' or 'error'
 ################################################################################################################
 
@@ -250,7 +251,6 @@ def calculate_hourly(logger):
                                                (offline_meter_id,
                                                 start_datetime_utc.isoformat()[0:19],
                                                 end_datetime_utc.isoformat()[0:19]))
-                                cnx.commit()
                                 # todo: check with hourly low limit and hourly high limit
                                 add_values = (" INSERT INTO tbl_offline_meter_hourly "
                                               "             (offline_meter_id, start_datetime_utc, actual_value) "
@@ -265,6 +265,15 @@ def calculate_hourly(logger):
                                 print("add_values:" + add_values)
                                 # trim ", " at the end of string and then execute
                                 cursor.execute(add_values[:-2])
+                                # files may be imported in any order, so the watermark never goes back
+                                last_slot_utc = end_datetime_utc - timedelta(minutes=config.minutes_to_count)
+                                cursor.execute(" INSERT INTO tbl_normalization_watermarks "
+                                               "             (entity_type, entity_id, last_slot_utc) "
+                                               " VALUES ('offline_meter', %s, %s) "
+                                               " ON DUPLICATE KEY UPDATE "
+                                               "     last_slot_utc = GREATEST(last_slot_utc, VALUES(last_slot_utc)) ",
+                                               (offline_meter_id, last_slot_utc.isoformat()[0:19]))
+                                # commit the time slots of the day with the watermark at once
                                 cnx.commit()
                     except Exception as e:
                         logger.error("Error in step 3.3 of offlinemeter.calculate_hourly " + str(e))
@@ -1,19 +1,22 @@
 import random
 import time
 from datetime import datetime, timedelta
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from multiprocessing import Pool
 
 import mysql.connector
-from sympy import sympify
+import numpy as np
+from sympy import Rational, Symbol, lambdify, sympify
 
 import config
 
 
 ########################################################################################################################
 # PROCEDURES:
-# Step 1: Query all virtual meters
-# Step 2: Create multiprocessing pool to call worker in parallel
+# Step 1: Query all virtual meters and the virtual meters in their equations
+# Step 2: Query the watermarks of all virtual meters
+# Step 3: Sort virtual meters into levels by dependencies
+# Step 4: Create multiprocessing pool to call worker in parallel level by level
 ########################################################################################################################
 
 def calculate_hourly(logger):
@@ -53,6 +56,12 @@ def calculate_hourly(logger):
                 meta_result = {"id": row[0], "name": row[1], "equation": row[2]}
                 virtual_meter_list.append(meta_result)
 
+            # pairs of virtual meter and the virtual meter in its equation
+            cursor_system_db.execute(" SELECT virtual_meter_id, meter_id "
+                                     " FROM tbl_variables "
+                                     " WHERE meter_type = 'virtual_meter' ")
+            rows_dependencies = cursor_system_db.fetchall()
+
         except Exception as e:
             logger.error("Error in step 1 of virtual meter calculate hourly " + str(e))
             # sleep and continue the outer loop to reconnect the database
@@ -64,32 +73,114 @@ def calculate_hourly(logger):
             if cnx_system_db:
                 cnx_system_db.close()
 
-        # shuffle the virtual meter list for randomly calculating the meter hourly value
-        random.shuffle(virtual_meter_list)
-
         print("Got all virtual meters in MyEMS System Database")
         ################################################################################################################
-        # Step 2: Create multiprocessing pool to call worker in parallel
+        # Step 2: Query the watermarks of all virtual meters
+        ################################################################################################################
+        cnx_energy_db = None
+        cursor_energy_db = None
+        try:
+            cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
+            cursor_energy_db = cnx_energy_db.cursor()
+            cursor_energy_db.execute(" SELECT entity_id, last_slot_utc "
+                                     " FROM tbl_normalization_watermarks "
+                                     " WHERE entity_type = 'virtual_meter' ")
+            last_slot_dict = dict()
+            for row in cursor_energy_db.fetchall():
+                last_slot_dict[row[0]] = row[1]
+        except Exception as e:
+            logger.error("Error in step 2 of virtual meter calculate hourly " + str(e))
+            # sleep and continue the outer loop to reconnect the database
+            time.sleep(60)
+            continue
+        finally:
+            if cursor_energy_db:
+                cursor_energy_db.close()
+            if cnx_energy_db:
+                cnx_energy_db.close()
+
+        for virtual_meter in virtual_meter_list:
+            virtual_meter['last_slot_utc'] = last_slot_dict.get(virtual_meter['id'])
+
+        ################################################################################################################
+        # Step 3: Sort virtual meters into levels by dependencies
+        ################################################################################################################
+        level_list, cyclic_virtual_meter_list = sort_virtual_meters(virtual_meter_list, rows_dependencies)
+        if len(cyclic_virtual_meter_list) > 0:
+            logger.error("Error in step 3 of virtual meter calculate hourly: cyclic dependencies of virtual meters " +
+                         ", ".join("'" + virtual_meter['name'] + "'" for virtual_meter in cyclic_virtual_meter_list))
+
+        ################################################################################################################
+        # Step 4: Create multiprocessing pool to call worker in parallel level by level
+        # NOTE: virtual meters of a level are calculated after all virtual meters in their equations,
+        #       so that a chain of virtual meters advances in one cycle
         ################################################################################################################
         p = Pool(processes=config.pool_size)
-        error_list = p.map(worker, virtual_meter_list)
+        for virtual_meter_level in level_list:
+            # shuffle the virtual meter list for randomly calculating the meter hourly value
+            random.shuffle(virtual_meter_level)
+            error_list = p.map(worker, virtual_meter_level)
+
+            for error in error_list:
+                if error is not None and len(error) > 0:
+                    logger.error(error)
         p.close()
         p.join()
 
-        for error in error_list:
-            if error is not None and len(error) > 0:
-                logger.error(error)
-
         print("go to sleep ...")
         time.sleep(60)
         print("wake from sleep, and continue to work...")
 
 
 ########################################################################################################################
-# Step 1: get start datetime and end datetime
+# Sort virtual meters into levels by the virtual meters in their equations, by Kahn's algorithm
+# rows_dependencies: rows of (virtual_meter_id, meter_id) where virtual meter meter_id is in the equation of
+#                    virtual meter virtual_meter_id
+# Virtual meters in the first level have no virtual meter in their equations, and virtual meters in each next level
+# depend only on virtual meters in previous levels.
+# Virtual meters in cycles, or depending on virtual meters in cycles, are left out of levels and never calculated.
+# :return: (list of levels of virtual meters, list of virtual meters left out)
+########################################################################################################################
+def sort_virtual_meters(virtual_meter_list, rows_dependencies):
+    virtual_meter_dict = dict()
+    for virtual_meter in virtual_meter_list:
+        virtual_meter_dict[virtual_meter['id']] = virtual_meter
+
+    # the number of virtual meters in the equation, and the virtual meters depending on it, of each virtual meter
+    in_degree_dict = dict()
+    dependent_dict = dict()
+    for virtual_meter_id in virtual_meter_dict.keys():
+        in_degree_dict[virtual_meter_id] = 0
+        dependent_dict[virtual_meter_id] = list()
+    for virtual_meter_id, meter_id in set(rows_dependencies):
+        # skip the variables of deleted virtual meters
+        if virtual_meter_id in virtual_meter_dict and meter_id in virtual_meter_dict:
+            in_degree_dict[virtual_meter_id] += 1
+            dependent_dict[meter_id].append(virtual_meter_id)
+
+    level_list = list()
+    current_level = [virtual_meter_id for virtual_meter_id, in_degree in in_degree_dict.items() if in_degree == 0]
+    while len(current_level) > 0:
+        level_list.append([virtual_meter_dict[virtual_meter_id] for virtual_meter_id in current_level])
+        next_level = list()
+        for virtual_meter_id in current_level:
+            for dependent_id in dependent_dict[virtual_meter_id]:
+                in_degree_dict[dependent_id] -= 1
+                if in_degree_dict[dependent_id] == 0:
+                    next_level.append(dependent_id)
+        current_level = next_level
+
+    cyclic_virtual_meter_list = [virtual_meter_dict[virtual_meter_id]
+                                 for virtual_meter_id, in_degree in in_degree_dict.items() if in_degree > 0]
+    return level_list, cyclic_virtual_meter_list
+
+
+########################################################################################################################
+# Step 1: get start datetime and end datetime from the watermark of the virtual meter
 # Step 2: parse the expression and get all meters, virtual meters, offline meters associated with the expression
 # Step 3: query energy consumption values from table meter hourly, virtual meter hourly and offline meter hourly
 # Step 4: evaluate the equation with variables values from previous step and save to table virtual meter hourly
+#         with the watermark of the virtual meter in the same transaction
 # returns the error string for logging or returns None
 ########################################################################################################################
 
@@ -111,29 +202,16 @@ def worker(virtual_meter):
 
     ####################################################################################################################
     # step 1: get start datetime and end datetime
-    #         get latest timestamp from energy database in tbl_virtual_meter_hourly
+    #         get the last normalized time slot from the watermark of the virtual meter
     ####################################################################################################################
 
-    try:
-        query = (" SELECT MAX(start_datetime_utc) "
-                 " FROM tbl_virtual_meter_hourly "
-                 " WHERE virtual_meter_id = %s ")
-        cursor_energy_db.execute(query, (virtual_meter['id'],))
-        row_datetime = cursor_energy_db.fetchone()
-    except Exception as e:
-        if cursor_energy_db:
-            cursor_energy_db.close()
-        if cnx_energy_db:
-            cnx_energy_db.close()
-        return "Error in step 1.2 of virtual meter worker " + str(e) + " for '" + virtual_meter['name'] + "'"
-
     start_datetime_utc = datetime.strptime(config.start_datetime_utc, '%Y-%m-%d %H:%M:%S')
     start_datetime_utc = start_datetime_utc.replace(minute=0, second=0, microsecond=0, tzinfo=None)
 
-    if row_datetime is not None and len(row_datetime) > 0 and isinstance(row_datetime[0], datetime):
+    if isinstance(virtual_meter['last_slot_utc'], datetime):
         # replace second and microsecond with 0
         # note: do not replace minute in case of calculating in half hourly
-        start_datetime_utc = row_datetime[0].replace(second=0, microsecond=0, tzinfo=None)
+        start_datetime_utc = virtual_meter['last_slot_utc'].replace(second=0, microsecond=0, tzinfo=None)
         # start from the next time slot
         start_datetime_utc += timedelta(minutes=config.minutes_to_count)
 
@@ -378,66 +456,49 @@ def worker(virtual_meter):
                     if common_end_datetime_utc > max(energy_hourly.keys()):
                         common_end_datetime_utc = max(energy_hourly.keys())
 
-    print("evaluating the equation with SymPy...")
+    print("evaluating the equation with SymPy and NumPy...")
     normalized_values = list()
 
     ############################################################################################################
-    # Converting Strings to SymPy Expressions
-    # The sympify function(that’s sympify, not to be confused with simplify) can be used to
-    # convert strings into SymPy expressions.
+    # The equation is compiled once into a NumPy function of the variables,
+    # and evaluated over the arrays of aligned values of all time slots at once
     ############################################################################################################
     try:
-        expr = sympify(virtual_meter['equation'].lower())
-        print("the expression to be evaluated: " + str(expr))
-        current_datetime_utc = common_start_datetime_utc
         print("common_start_datetime_utc: " + str(common_start_datetime_utc))
         print("common_end_datetime_utc: " + str(common_end_datetime_utc))
-        while common_start_datetime_utc is not None \
-                and common_end_datetime_utc is not None \
-                and current_datetime_utc <= common_end_datetime_utc:
-            meta_data = dict()
-            meta_data['start_datetime_utc'] = current_datetime_utc
-
-            ####################################################################################################
-            # create a dictionary of Symbol: point pairs
-            ####################################################################################################
-
-            subs = dict()
+        if common_start_datetime_utc is not None and common_end_datetime_utc is not None:
+            datetime_list = list()
+            current_datetime_utc = common_start_datetime_utc
+            while current_datetime_utc <= common_end_datetime_utc:
+                datetime_list.append(current_datetime_utc)
+                current_datetime_utc += timedelta(minutes=config.minutes_to_count)
 
             ####################################################################################################
-            # Evaluating the expression at current_datetime_utc
+            # create a dictionary of variable name: energy values of time slots
             ####################################################################################################
+            variable_dict = dict()
 
-            if meter_list_in_expression is not None and len(meter_list_in_expression) > 0:
-                for meter_in_expression in meter_list_in_expression:
-                    meter_id = str(meter_in_expression['meter_id'])
-                    actual_value = energy_meter_hourly[meter_id].get(current_datetime_utc, Decimal(0.0))
-                    subs[meter_in_expression['variable_name']] = actual_value
-
-            if virtual_meter_list_in_expression is not None and len(virtual_meter_list_in_expression) > 0:
-                for virtual_meter_in_expression in virtual_meter_list_in_expression:
-                    virtual_meter_id = str(virtual_meter_in_expression['virtual_meter_id'])
-                    actual_value = energy_virtual_meter_hourly[virtual_meter_id].get(current_datetime_utc, Decimal(0.0))
-                    subs[virtual_meter_in_expression['variable_name']] = actual_value
-
-            if offline_meter_list_in_expression is not None and len(offline_meter_list_in_expression) > 0:
-                for offline_meter_in_expression in offline_meter_list_in_expression:
-                    offline_meter_id = str(offline_meter_in_expression['offline_meter_id'])
-                    actual_value = energy_offline_meter_hourly[offline_meter_id].get(current_datetime_utc, Decimal(0.0))
-                    subs[offline_meter_in_expression['variable_name']] = actual_value
+            for meter_in_expression in meter_list_in_expression:
+                energy_hourly = energy_meter_hourly[str(meter_in_expression['meter_id'])]
+                variable_dict[meter_in_expression['variable_name']] = \
+                    [energy_hourly.get(current_datetime_utc, Decimal(0.0)) for current_datetime_utc in datetime_list]
 
-            ####################################################################################################
-            # To numerically evaluate an expression with a Symbol at a point,
-            # we might use subs followed by evalf,
-            # but it is more efficient and numerically stable to pass the substitution to evalf
-            # using the subs flag, which takes a dictionary of Symbol: point pairs.
-            ####################################################################################################
+            for virtual_meter_in_expression in virtual_meter_list_in_expression:
+                energy_hourly = energy_virtual_meter_hourly[str(virtual_meter_in_expression['virtual_meter_id'])]
+                variable_dict[virtual_meter_in_expression['variable_name']] = \
+                    [energy_hourly.get(current_datetime_utc, Decimal(0.0)) for current_datetime_utc in datetime_list]
 
-            meta_data['actual_value'] = expr.evalf(subs=subs)
+            for offline_meter_in_expression in offline_meter_list_in_expression:
+                energy_hourly = energy_offline_meter_hourly[str(offline_meter_in_expression['offline_meter_id'])]
+                variable_dict[offline_meter_in_expression['variable_name']] = \
+                    [energy_hourly.get(current_datetime_utc, Decimal(0.0)) for current_datetime_utc in datetime_list]
 
-            normalized_values.append(meta_data)
+            function, exact_function = compile_equation(virtual_meter['equation'], list(variable_dict.keys()))
+            actual_value_list = evaluate_equation(function, exact_function, list(variable_dict.values()),
+                                                  datetime_list)
 
-            current_datetime_utc += timedelta(minutes=config.minutes_to_count)
+            for current_datetime_utc, actual_value in zip(datetime_list, actual_value_list):
+                normalized_values.append({'start_datetime_utc': current_datetime_utc, 'actual_value': actual_value})
 
     except Exception as e:
         if cursor_energy_db:
@@ -448,21 +509,29 @@ def worker(virtual_meter):
 
     print("saving energy values to table energy virtual meter hourly...")
 
-    while len(normalized_values) > 0:
-        insert_100 = normalized_values[:100]
-        normalized_values = normalized_values[100:]
+    if len(normalized_values) > 0:
+        last_slot_utc = normalized_values[-1]['start_datetime_utc']
         try:
-            add_values = (" INSERT INTO tbl_virtual_meter_hourly "
-                          " (virtual_meter_id, start_datetime_utc, actual_value) "
-                          " VALUES  ")
-
-            for meta_data in insert_100:
-                add_values += " (" + str(virtual_meter['id']) + ","
-                add_values += "'" + meta_data['start_datetime_utc'].isoformat()[0:19] + "',"
-                add_values += str(meta_data['actual_value']) + "), "
-            print("add_values:" + add_values)
-            # trim ", " at the end of string and then execute
-            cursor_energy_db.execute(add_values[:-2])
+            while len(normalized_values) > 0:
+                insert_100 = normalized_values[:100]
+                normalized_values = normalized_values[100:]
+                add_values = (" INSERT INTO tbl_virtual_meter_hourly "
+                              " (virtual_meter_id, start_datetime_utc, actual_value) "
+                              " VALUES  ")
+
+                for meta_data in insert_100:
+                    add_values += " (" + str(virtual_meter['id']) + ","
+                    add_values += "'" + meta_data['start_datetime_utc'].isoformat()[0:19] + "',"
+                    add_values += str(meta_data['actual_value']) + "), "
+                print("add_values:" + add_values)
+                # trim ", " at the end of string and then execute
+                cursor_energy_db.execute(add_values[:-2])
+            cursor_energy_db.execute(" INSERT INTO tbl_normalization_watermarks "
+                                     "             (entity_type, entity_id, last_slot_utc) "
+                                     " VALUES ('virtual_meter', %s, %s) "
+                                     " ON DUPLICATE KEY UPDATE last_slot_utc = VALUES(last_slot_utc) ",
+                                     (virtual_meter['id'], last_slot_utc.isoformat()[0:19]))
+            # commit all time slots of the virtual meter with the watermark at once
             cnx_energy_db.commit()
         except Exception as e:
             if cursor_energy_db:
@@ -477,3 +546,64 @@ def worker(virtual_meter):
         cnx_energy_db.close()
 
     return None
+
+
+########################################################################################################################
+# Compile the equation of a virtual meter into functions of the variables in order of variable_name_list
+# The sympify function(that’s sympify, not to be confused with simplify) converts the string into a SymPy expression,
+# and the lambdify function translates the expression into a function which evaluates arrays element-wise.
+# The exact function takes the numbers in the equation as rationals, and substitutes SymPy rationals of the variables.
+# :return: (NumPy function, exact function)
+# :raise ValueError: if the equation refers to any variable not in variable_name_list
+########################################################################################################################
+def compile_equation(equation, variable_name_list):
+    expr = sympify(equation.lower())
+    print("the expression to be evaluated: " + str(expr))
+    undefined_variable_name_list = sorted(symbol.name for symbol in expr.free_symbols
+                                          if symbol.name not in variable_name_list)
+    if len(undefined_variable_name_list) > 0:
+        raise ValueError("undefined variables " + ", ".join(undefined_variable_name_list) + " in the equation")
+    symbol_list = [Symbol(variable_name) for variable_name in variable_name_list]
+    exact_expr = sympify(equation.lower(), rational=True)
+
+    def exact_function(*value_list):
+        return exact_expr.xreplace(dict(zip(symbol_list, value_list)))
+
+    return lambdify(symbol_list, expr, modules='numpy'), exact_function
+
+
+# the relative error of float64 results of equations, several hundred times the precision of float64
+FLOAT_RELATIVE_ERROR = 1e-13
+
+
+########################################################################################################################
+# Evaluate the compiled equation over the values of variables in all time slots at once
+# value_lists: lists of Decimal values of the variables in time slots, in order of the arguments of the functions
+# datetime_list: start datetimes of the time slots
+# The values are evaluated in float64, and rounded half up to 3 decimal places as MySQL rounds DECIMAL(18, 3).
+# The rounding errors of float64 may move a result across a half of 0.001, such as 0.00249999999999 of 0.0025,
+# so the results within FLOAT_RELATIVE_ERROR of the magnitude of the slot from a half are evaluated again exactly.
+# That is rare for hourly energy values, unless the values are too large to be exact in float64 at all.
+# :return: list of Decimal values of time slots
+# :raise ValueError: if the result is not finite in any time slot, for example divided by zero
+########################################################################################################################
+def evaluate_equation(function, exact_function, value_lists, datetime_list):
+    arrays = [np.array(value_list, dtype=float) for value_list in value_lists]
+    with np.errstate(all='ignore'):
+        values = np.asarray(function(*arrays), dtype=float)
+    # an equation of constants returns a scalar
+    values = np.broadcast_to(values, (len(datetime_list),))
+    not_finite_indexes = np.nonzero(~np.isfinite(values))[0]
+    if len(not_finite_indexes) > 0:
+        raise ValueError("the result is not finite at " + datetime_list[not_finite_indexes[0]].isoformat()[0:19])
+
+    magnitudes = np.abs(values)
+    for array in arrays:
+        magnitudes = np.maximum(magnitudes, np.abs(array))
+    thousandths = values * 1000
+    distances = np.abs(thousandths - np.floor(thousandths) - 0.5) / 1000
+    result_list = [Decimal(value).quantize(Decimal('0.001'), rounding=ROUND_HALF_UP) for value in values.tolist()]
+    for index in np.nonzero(distances <= magnitudes * FLOAT_RELATIVE_ERROR)[0].tolist():
+        exact_value = exact_function(*[Rational(str(value_list[index])) for value_list in value_lists])
+        result_list[index] = Decimal(str(exact_value.evalf(30))).quantize(Decimal('0.001'), rounding=ROUND_HALF_UP)
+    return result_list